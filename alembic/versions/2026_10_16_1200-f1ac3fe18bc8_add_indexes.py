@@ -0,0 +1,48 @@
+"""add indexes
+
+Revision ID: f1ac3fe18bc8
+Create Date: 2026-10-16 12:00:00.000000
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "f1ac3fe18bc8"
+down_revision = "465a290e6c05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_events_slot_start", "events_slot", ["start"])
+    op.create_index("ix_events_slot_end", "events_slot", ["end"])
+    op.create_index("ix_events_slot_booked_by", "events_slot", ["booked_by"])
+    op.create_index("ix_events_slot_weekly_slot_id", "events_slot", ["weekly_slot_id"])
+    op.create_index("ix_events_slot_user_id_start", "events_slot", ["user_id", "start"])
+    op.create_index("ix_events_webinars_end", "events_webinars", ["end"])
+    op.create_index("ix_events_webinars_creator_start", "events_webinars", ["creator", "start"])
+    op.create_index("ix_events_webinars_skill_id_start", "events_webinars", ["skill_id", "start"])
+    op.create_index("ix_events_webinar_participants_user_id", "events_webinar_participants", ["user_id"])
+    op.create_index(
+        "ix_events_lecturer_rating_lecturer_id_skill_id_rating",
+        "events_lecturer_rating",
+        ["lecturer_id", "skill_id", "rating"],
+    )
+    op.create_index(
+        "ix_events_lecturer_rating_participant_id_rating", "events_lecturer_rating", ["participant_id", "rating"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_events_lecturer_rating_participant_id_rating", "events_lecturer_rating")
+    op.drop_index("ix_events_lecturer_rating_lecturer_id_skill_id_rating", "events_lecturer_rating")
+    op.drop_index("ix_events_webinar_participants_user_id", "events_webinar_participants")
+    op.drop_index("ix_events_webinars_skill_id_start", "events_webinars")
+    op.drop_index("ix_events_webinars_creator_start", "events_webinars")
+    op.drop_index("ix_events_webinars_end", "events_webinars")
+    op.drop_index("ix_events_slot_user_id_start", "events_slot")
+    op.drop_index("ix_events_slot_weekly_slot_id", "events_slot")
+    op.drop_index("ix_events_slot_booked_by", "events_slot")
+    op.drop_index("ix_events_slot_end", "events_slot")
+    op.drop_index("ix_events_slot_start", "events_slot")
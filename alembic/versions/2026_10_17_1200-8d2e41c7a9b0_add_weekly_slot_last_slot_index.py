@@ -0,0 +1,22 @@
+"""add weekly slot last_slot index
+
+Revision ID: 8d2e41c7a9b0
+Create Date: 2026-10-17 12:00:00.000000
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "8d2e41c7a9b0"
+down_revision = "f1ac3fe18bc8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_events_weekly_slots_last_slot", "events_weekly_slots", ["last_slot"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_events_weekly_slots_last_slot", "events_weekly_slots")
@@ -0,0 +1,37 @@
+"""add outbox
+
+Revision ID: b3f9c2d4e5a6
+Create Date: 2026-10-17 13:00:00.000000
+"""
+
+from alembic import op
+
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b3f9c2d4e5a6"
+down_revision = "8d2e41c7a9b0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "events_outbox",
+        sa.Column("id", sa.String(length=36), nullable=False),
+        sa.Column("action", sa.String(length=32), nullable=True),
+        sa.Column("payload", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("next_attempt", sa.DateTime(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("id"),
+        mysql_collate="utf8mb4_bin",
+    )
+    op.create_index("ix_events_outbox_next_attempt", "events_outbox", ["next_attempt"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_events_outbox_next_attempt", table_name="events_outbox")
+    op.drop_table("events_outbox")
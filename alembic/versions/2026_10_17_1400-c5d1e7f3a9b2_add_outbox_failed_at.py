@@ -0,0 +1,24 @@
+"""add outbox failed_at
+
+Revision ID: c5d1e7f3a9b2
+Create Date: 2026-10-17 14:00:00.000000
+"""
+
+from alembic import op
+
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c5d1e7f3a9b2"
+down_revision = "b3f9c2d4e5a6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("events_outbox", sa.Column("failed_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("events_outbox", "failed_at")
@@ -3,7 +3,6 @@
 See [Auth Microservice](/auth/docs).
 """
 
-import asyncio
 from typing import Awaitable, Callable, TypeVar
 
 from fastapi import FastAPI, HTTPException, Request
@@ -16,17 +15,48 @@ from . import __version__
 from .database import db, db_context
 from .endpoints import ROUTER, TAGS
 from .logger import get_logger, setup_sentry
-from .models.slots import clean_old_slots
-from .models.webinars import clean_old_webinars
+from .models.outbox import dispatch_outbox
+from .models.slots import clean_old_slots, slot_deadlines, sync_slot_deadlines
+from .models.webinars import clean_old_webinars, sync_webinar_deadlines, webinar_deadlines
+from .models.weekly_slots import create_weekly_slots
+from .services.internal import close_clients, start_clients
 from .settings import settings
+from .utils.cache import start_cache_invalidation, stop_cache_invalidation
 from .utils.debug import check_responses
 from .utils.docs import add_endpoint_links_to_openapi_docs
+from .utils.leader import LeaderLease
+from .utils.scheduler import Scheduler
 
 
 T = TypeVar("T")
 
 logger = get_logger(__name__)
 
+# only the worker holding this lease runs the cleanup jobs
+cleanup_lease = LeaderLease("cleanup")
+
+scheduler = Scheduler()
+scheduler.add_job(
+    "clean_old_webinars",
+    clean_old_webinars,
+    settings.webinar_cleanup_interval,
+    lease=cleanup_lease,
+    deadline=webinar_deadlines.next_deadline,
+)
+scheduler.add_job(
+    "clean_old_slots",
+    clean_old_slots,
+    settings.slot_cleanup_interval,
+    lease=cleanup_lease,
+    deadline=slot_deadlines.next_deadline,
+)
+scheduler.add_job("dispatch_outbox", dispatch_outbox, settings.outbox_interval, lease=cleanup_lease)
+scheduler.add_job("create_weekly_slots", create_weekly_slots, settings.weekly_slot_interval, lease=cleanup_lease)
+scheduler.add_job(
+    "sync_webinar_deadlines", sync_webinar_deadlines, settings.deadline_sync_interval, lease=cleanup_lease
+)
+scheduler.add_job("sync_slot_deadlines", sync_slot_deadlines, settings.deadline_sync_interval, lease=cleanup_lease)
+
 app = FastAPI(
     title="Bootstrap Academy Backend: Events Microservice",
     description=__doc__,
@@ -66,24 +96,20 @@ async def rollback_on_exception(request: Request, exc: HTTPException) -> Respons
     return await http_exception_handler(request, exc)
 
 
-async def cleanup_loop() -> None:
-    while True:
-        try:
-            await clean_old_webinars()
-            await clean_old_slots()
-        except Exception as e:
-            logger.exception(e)
-        await asyncio.sleep(5 * 60)
-
-
 @app.on_event("startup")
 async def on_startup() -> None:
-    asyncio.create_task(cleanup_loop())
+    start_clients()
+    start_cache_invalidation()
+    cleanup_lease.start()
+    scheduler.start()
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
-    pass
+    await scheduler.stop()
+    await cleanup_lease.stop()
+    await stop_cache_invalidation()
+    await close_clients()
 
 
 @app.head("/status", include_in_schema=False)
@@ -3,6 +3,7 @@ from functools import wraps
 from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
 
 from .database import Base, delete, exists, filter_by, get_database, select
+from ..utils.cache import clear_cache, defer_clear_cache, request_memo
 
 
 T = TypeVar("T")
@@ -10,14 +11,22 @@ T = TypeVar("T")
 
 @asynccontextmanager
 async def db_context() -> AsyncIterator[None]:
-    """Async context manager for database sessions."""
+    """
+    Async context manager for database sessions.
+
+    Results of cached functions are remembered until the end, and caches are only cleared after the commit.
+    """
 
     db.create_session()
+    cleared: set[str] = set()
     try:
-        yield
+        with request_memo(), defer_clear_cache(cleared):
+            yield
     finally:
         await db.commit()
         await db.close()
+        for prefix in cleared:
+            await clear_cache(prefix)
 
 
 def db_wrapper(f: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
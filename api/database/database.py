@@ -85,7 +85,8 @@ class Base(metaclass=DeclarativeMeta):
     registry = registry()
     metadata = registry.metadata
 
-    __table_args__ = {"mysql_collate": "utf8mb4_bin"}
+    # models with indexes or constraints use a tuple that ends with these options
+    __table_args__: dict[str, Any] | tuple[Any, ...] = {"mysql_collate": "utf8mb4_bin"}
 
     def __init__(self, **kwargs: Any) -> None:
         self.registry.constructor(self, **kwargs)
@@ -161,6 +162,11 @@ class DB:
 
         return await self.first(filter_by(cls, *args, **kwargs))
 
+    async def flush(self) -> None:
+        """Shortcut for :meth:`sqlalchemy.ext.asyncio.AsyncSession.flush`"""
+
+        await self.session.flush()
+
     async def commit(self) -> None:
         """Shortcut for :meth:`sqlalchemy.ext.asyncio.AsyncSession.commit`"""
 
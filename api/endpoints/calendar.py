@@ -1,27 +1,36 @@
 """Endpoints related to the calendar."""
 
+import asyncio
+import base64
+import hashlib
 import hmac
-from datetime import timedelta
-from typing import Any, Type, cast
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, NamedTuple, Type
 
-from fastapi import APIRouter, Path, Query
-from sqlalchemy import func
+from fastapi import APIRouter, Path, Query, Request
+from sqlalchemy import and_, case, func, not_, or_
 from sqlalchemy.sql import Select
-from starlette.responses import Response
+from starlette.responses import Response, StreamingResponse
 
 from api import models
 from api.auth import require_verified_email, user_auth
-from api.database import db, select
+from api.database import db, db_wrapper, select
 from api.exceptions.auth import PermissionDeniedError, verified_responses
+from api.exceptions.calendar import InvalidCursorError
 from api.exceptions.slots import SlotNotFoundException
+from api.models.outbox import OutboxAction
+from api.models.webinars import webinar_deadlines
 from api.schemas.calendar import Calendar, Coaching, EventType, Webinar
 from api.schemas.user import User
-from api.services import shop
-from api.services.auth import get_userinfo, is_admin
-from api.services.ics import create_ics
+from api.services.auth import get_userinfos, is_admin
+from api.services.ics import stream_ics
 from api.services.skills import get_skill_levels
 from api.settings import settings
-from api.utils.cache import clear_cache
+from api.utils.cache import clear_cache, get_generation, redis_cached
+from api.utils.codecs import PickleCodec
+from api.utils.concurrency import gather_limited
 from api.utils.utc import utcfromtimestamp, utcnow
 
 
@@ -47,9 +56,44 @@ def _filter_time(
     return query
 
 
+class CalendarEntry(NamedTuple):
+    """User-independent data of an event as stored in the calendar snapshot."""
+
+    event: Webinar | Coaching  # the event as seen by an admin
+    instructor_id: str
+    participants: list[str]  # webinar participants or the student of a booked coaching
+    start: datetime  # the exact start as stored in the database, used for pagination
+
+
+def _effective_price(instructor: Any, price: Any) -> Any:
+    """SQL expression for the price of an event, which is zero if the instructor has to make up for a cancellation."""
+
+    return case(
+        (select(models.EmergencyCancel).where(models.EmergencyCancel.user_id == instructor).exists(), 0), else_=price
+    )
+
+
+def _paginate(
+    query: Select, cls: Type[models.Webinar | models.Slot], after: tuple[datetime, str] | None, limit: int | None
+) -> Select:
+    if after:
+        start, id_ = after
+        query = query.where(or_(cls.start > start, and_(cls.start == start, cls.id > id_)))
+    query = query.order_by(cls.start, cls.id)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+def _filter_price(query: Select, price: Any, price_min: int | None, price_max: int | None) -> Select:
+    if price_min is not None:
+        query = query.where(price >= price_min)
+    if price_max is not None:
+        query = query.where(price <= price_max)
+    return query
+
+
 async def get_webinars(
-    user_id: str,
-    admin: bool,
     title: str | None,
     description: str | None,
     instructor_id: str | None,
@@ -58,9 +102,18 @@ async def get_webinars(
     start_before: int | None,
     duration_min: int | None,
     duration_max: int | None,
-) -> list[Webinar]:
-    events = []
-    query = select(models.Webinar).where(models.Webinar.end > utcnow())
+    price_min: int | None,
+    price_max: int | None,
+    bookable: bool | None,
+    member_id: str | None,
+    after: tuple[datetime, str] | None,
+    limit: int | None,
+) -> tuple[list[CalendarEntry], tuple[datetime, str] | None]:
+    """Return one page of webinars ordered by (start, id) and the position of its last row if the page is full."""
+
+    now = utcnow()
+    price = _effective_price(models.Webinar.creator, models.Webinar.price)
+    query = select(models.Webinar).add_columns(price).where(models.Webinar.end > now)
     if title:
         query = query.where(func.lower(models.Webinar.name).contains(title.lower(), autoescape=True))
     if description:
@@ -70,15 +123,29 @@ async def get_webinars(
     if skill_id:
         query = query.filter_by(skill_id=skill_id)
     query = _filter_time(query, models.Webinar, start_after, start_before, duration_min, duration_max)
-
-    webinar: models.Webinar
-    async for webinar in await db.stream(query):
-        _booked = user_id == webinar.creator or any(
-            participant.user_id == user_id for participant in webinar.participants
+    query = _filter_price(query, price, price_min, price_max)
+    if bookable:
+        participants = (
+            select(func.count()).where(models.WebinarParticipant.webinar_id == models.Webinar.id).scalar_subquery()
+        )
+        query = query.where(models.Webinar.start > now, participants < models.Webinar.max_participants)
+    if member_id:
+        query = query.where(
+            or_(
+                models.Webinar.creator == member_id,
+                select(models.WebinarParticipant).filter_by(webinar_id=models.Webinar.id, user_id=member_id).exists(),
+            )
         )
-        _bookable = not _booked and utcnow() < webinar.start and len(webinar.participants) < webinar.max_participants
 
-        events.append(
+    rows: list[tuple[models.Webinar, int]] = (await db.exec(_paginate(query, models.Webinar, after, limit))).all()
+    webinars = [webinar for webinar, _ in rows]
+    users, ratings = await asyncio.gather(
+        get_userinfos(webinar.creator for webinar in webinars),
+        models.LecturerRating.get_ratings((webinar.creator, webinar.skill_id) for webinar in webinars),
+    )
+
+    entries = [
+        CalendarEntry(
             Webinar(
                 id=webinar.id,
                 type=EventType.WEBINAR,
@@ -87,98 +154,328 @@ async def get_webinars(
                 skill_id=webinar.skill_id,
                 start=int(webinar.start.timestamp()),
                 duration=int((webinar.end - webinar.start).total_seconds()) // 60,
-                price=webinar.price,
-                admin_link=webinar.admin_link if admin or user_id == webinar.creator else None,
-                link=(
-                    webinar.link
-                    if admin or user_id == webinar.creator or (_booked and webinar.start - utcnow() < timedelta(days=1))
-                    else None
-                ),
-                instructor=await get_userinfo(webinar.creator),
-                instructor_rating=await models.LecturerRating.get_rating(webinar.creator, webinar.skill_id),
-                booked=_booked,
-                bookable=_bookable,
+                price=webinar_price,
+                admin_link=webinar.admin_link,
+                link=webinar.link,
+                instructor=users[webinar.creator],
+                instructor_rating=ratings[(webinar.creator, webinar.skill_id)],
+                booked=False,
+                bookable=False,
                 creation_date=int(webinar.creation_date.timestamp()),
                 max_participants=webinar.max_participants,
                 participants=len(webinar.participants),
-            )
+            ),
+            webinar.creator,
+            [participant.user_id for participant in webinar.participants],
+            webinar.start,
         )
-    return events
+        for webinar, webinar_price in rows
+    ]
+    return entries, (rows[-1][0].start, rows[-1][0].id) if len(rows) == limit else None
 
 
 async def get_coachings(
-    user_id: str,
-    admin: bool,
     instructor_id: str | None,
+    skill_id: str | None,
     start_after: int | None,
     start_before: int | None,
     duration_min: int | None,
     duration_max: int | None,
-) -> list[Coaching]:
-    events = []
-    query = select(models.Slot).where(models.Slot.end > utcnow())
+    price_min: int | None,
+    price_max: int | None,
+    booked: bool | None,
+    bookable: bool | None,
+    member_id: str | None,
+    after: tuple[datetime, str] | None,
+    limit: int | None,
+) -> tuple[list[CalendarEntry], tuple[datetime, str] | None]:
+    """
+    Return the coachings of one page of slots ordered by (start, id) and the position of its last slot if the page is
+    full.
+    """
+
+    entries = []
+    is_booked = models.Slot.booked_by != None  # noqa: E711
+    # booked slots have a fixed skill and price, free slots are joined with the coaching offers of their instructor
+    skill = case((is_booked, models.Slot.skill_id), else_=models.Coaching.skill_id)
+    price = _effective_price(
+        models.Slot.user_id, case((is_booked, models.Slot.student_coins), else_=models.Coaching.price)
+    )
+    query = (
+        select(models.Slot)
+        .add_columns(skill, price)
+        .outerjoin(models.Coaching, and_(models.Coaching.user_id == models.Slot.user_id, not_(is_booked)))
+        .where(models.Slot.end > utcnow(), or_(is_booked, models.Coaching.skill_id != None))  # noqa: E711
+    )
     query = _filter_time(query, models.Slot, start_after, start_before, duration_min, duration_max)
+    query = _filter_price(query, price, price_min, price_max)
     if instructor_id:
-        query = query.filter_by(user_id=instructor_id)
-
-    coachings: dict[str, dict[str, int]] = {}
-    coaching: models.Coaching
-    async for coaching in await db.stream(select(models.Coaching)):
-        coachings.setdefault(coaching.user_id, {})[coaching.skill_id] = coaching.price
-
-    slot: models.Slot
-    async for slot in await db.stream(query):
-        if slot.booked:
-            events.append(
-                Coaching(
-                    id=slot.id,
-                    type=EventType.COACHING,
-                    title=None,
-                    description=None,
-                    skill_id=slot.skill_id,
-                    start=int(slot.start.timestamp()),
-                    duration=int((slot.end - slot.start).total_seconds()) // 60,
-                    price=cast(int, slot.student_coins),
-                    admin_link=slot.admin_link if admin or user_id == slot.user_id else None,
-                    link=slot.link if admin or user_id in (slot.user_id, slot.booked_by) else None,
-                    instructor=await get_userinfo(slot.user_id),
-                    instructor_rating=await models.LecturerRating.get_rating(slot.user_id, slot.skill_id),
-                    booked=True,
-                    bookable=False,
-                    student=(
-                        await get_userinfo(slot.booked_by)
-                        if admin or user_id in (slot.user_id, slot.booked_by)
-                        else None
+        query = query.where(models.Slot.user_id == instructor_id)
+    if skill_id:
+        query = query.where(skill == skill_id)
+    if booked is not None:
+        query = query.where(is_booked if booked else not_(is_booked))
+    if bookable:
+        query = query.where(not_(is_booked))
+    if member_id:
+        query = query.where(or_(models.Slot.user_id == member_id, models.Slot.booked_by == member_id))
+
+    rows: list[tuple[models.Slot, str, int]] = (await db.exec(_paginate(query, models.Slot, after, limit))).all()
+    last = None
+    if len(rows) == limit:
+        # the limit may have cut off some of the offers of the last slot
+        last = rows[-1][0].start, rows[-1][0].id
+        rows = [row for row in rows if row[0].id != last[1]]
+        rows += (await db.exec(query.where(models.Slot.id == last[1]))).all()
+
+    offers: dict[str, dict[str, int]] = {}
+    for slot, slot_skill, slot_price in rows:
+        if not slot.booked_by:
+            offers.setdefault(slot.user_id, {})[slot_skill] = slot_price
+
+    slots = [slot for slot, *_ in rows]
+    users, ratings, qualified = await asyncio.gather(
+        get_userinfos([slot.user_id for slot in slots] + [slot.booked_by for slot in slots if slot.booked_by]),
+        models.LecturerRating.get_ratings((slot.user_id, slot_skill) for slot, slot_skill, _ in rows),
+        gather_limited(*[_get_coaching_skills(instructor, skills) for instructor, skills in offers.items()]),
+    )
+    coaching_skills = dict(zip(offers, qualified))
+
+    for slot, slot_skill, slot_price in rows:
+        if slot.booked_by:
+            entries.append(
+                CalendarEntry(
+                    Coaching(
+                        id=slot.id,
+                        type=EventType.COACHING,
+                        title=None,
+                        description=None,
+                        skill_id=slot.skill_id,
+                        start=int(slot.start.timestamp()),
+                        duration=int((slot.end - slot.start).total_seconds()) // 60,
+                        price=slot_price,
+                        admin_link=slot.admin_link,
+                        link=slot.link,
+                        instructor=users[slot.user_id],
+                        instructor_rating=ratings[(slot.user_id, slot_skill)],
+                        booked=True,
+                        bookable=False,
+                        student=users[slot.booked_by],
                     ),
+                    slot.user_id,
+                    [slot.booked_by],
+                    slot.start,
                 )
             )
             continue
 
-        for skill, price in coachings.get(slot.user_id, {}).items():
-            level = (await get_skill_levels(slot.user_id)).get(skill, 0)
-            if level < settings.coaching_level and not await is_admin(slot.user_id):
-                continue
-
-            events.append(
-                Coaching(
-                    id=slot.id,
-                    type=EventType.COACHING,
-                    title=None,
-                    description=None,
-                    skill_id=skill,
-                    start=int(slot.start.timestamp()),
-                    duration=int((slot.end - slot.start).total_seconds()) // 60,
-                    price=price,
-                    admin_link=None,
-                    link=None,
-                    instructor=await get_userinfo(slot.user_id),
-                    instructor_rating=await models.LecturerRating.get_rating(slot.user_id, skill),
-                    booked=False,
-                    bookable=user_id != slot.user_id,
-                    student=None,
+        if slot_skill in coaching_skills.get(slot.user_id, {}):
+            entries.append(
+                CalendarEntry(
+                    Coaching(
+                        id=slot.id,
+                        type=EventType.COACHING,
+                        title=None,
+                        description=None,
+                        skill_id=slot_skill,
+                        start=int(slot.start.timestamp()),
+                        duration=int((slot.end - slot.start).total_seconds()) // 60,
+                        price=slot_price,
+                        admin_link=None,
+                        link=None,
+                        instructor=users[slot.user_id],
+                        instructor_rating=ratings[(slot.user_id, slot_skill)],
+                        booked=False,
+                        bookable=True,
+                        student=None,
+                    ),
+                    slot.user_id,
+                    [],
+                    slot.start,
                 )
             )
-    return events
+    return entries, last
+
+
+async def _get_coaching_skills(instructor: str, offers: dict[str, int]) -> dict[str, int]:
+    """Return the coaching offers of an instructor whose skill requirements are met."""
+
+    levels = await get_skill_levels(instructor)
+    if all(levels.get(skill, 0) >= settings.coaching_level for skill in offers) or await is_admin(instructor):
+        return offers
+    return {skill: price for skill, price in offers.items() if levels.get(skill, 0) >= settings.coaching_level}
+
+
+@redis_cached(
+    "calendar",
+    "type_",
+    "title",
+    "description",
+    "instructor_id",
+    "skill_id",
+    "start_after",
+    "start_before",
+    "duration_min",
+    "duration_max",
+    "price_min",
+    "price_max",
+    "booked",
+    "bookable",
+    "member_id",
+    "after",
+    "limit",
+    codec=PickleCodec,  # the events cannot be restored from plain data, as they may be webinars or coachings
+)
+async def get_snapshot(
+    type_: EventType | None,
+    title: str | None,
+    description: str | None,
+    instructor_id: str | None,
+    skill_id: str | None,
+    start_after: int | None,
+    start_before: int | None,
+    duration_min: int | None,
+    duration_max: int | None,
+    price_min: int | None,
+    price_max: int | None,
+    booked: bool | None,
+    bookable: bool | None,
+    member_id: str | None,
+    after: tuple[datetime, str] | None,
+    limit: int | None,
+) -> tuple[list[CalendarEntry], tuple[datetime, str] | None]:
+    """
+    Return the user-independent data of all matching events and the position of the next page, if any.
+
+    All filters are applied in the database as far as they do not depend on the user. Only if `member_id` is set,
+    the events are restricted to those held or booked by this user.
+
+    The snapshot is invalidated by `clear_cache("calendar")` and personalized per request by `personalize`.
+    """
+
+    # each source gets its own database session so that all of them can be loaded concurrently
+    sources: list[Awaitable[tuple[list[CalendarEntry], tuple[datetime, str] | None]]] = []
+    if type_ is None or type_ == EventType.WEBINAR:
+        sources.append(
+            db_wrapper(get_webinars)(
+                title,
+                description,
+                instructor_id,
+                skill_id,
+                start_after,
+                start_before,
+                duration_min,
+                duration_max,
+                price_min,
+                price_max,
+                bookable,
+                member_id,
+                after,
+                limit,
+            )
+        )
+    if type_ is None or type_ == EventType.COACHING:
+        sources.append(
+            db_wrapper(get_coachings)(
+                instructor_id,
+                skill_id,
+                start_after,
+                start_before,
+                duration_min,
+                duration_max,
+                price_min,
+                price_max,
+                booked,
+                bookable,
+                member_id,
+                after,
+                limit,
+            )
+        )
+
+    return _merge_pages(await asyncio.gather(*sources), limit)
+
+
+def _position(entry: CalendarEntry) -> tuple[datetime, str]:
+    return entry.start, entry.event.id
+
+
+def _merge_pages(
+    pages: list[tuple[list[CalendarEntry], tuple[datetime, str] | None]], limit: int | None
+) -> tuple[list[CalendarEntry], tuple[datetime, str] | None]:
+    """
+    Interleave pages of multiple sources in start order and cut the result at the page limit.
+
+    Each page comes with the position of its last row if the source might have more rows. Entries after the first of
+    these positions are dropped, as the missing rows of that source could belong before them.
+    """
+
+    entries = sorted((entry for page, _ in pages for entry in page), key=_position)
+    if limit is None:
+        return entries, None
+
+    horizon = min((last for _, last in pages if last), default=None)
+    if horizon:
+        entries = [entry for entry in entries if _position(entry) <= horizon]
+
+    if len(entries) > limit:
+        # never split the coachings of a single slot
+        end = limit
+        while end < len(entries) and _position(entries[end]) == _position(entries[limit - 1]):
+            end += 1
+        if end < len(entries):
+            return entries[:end], _position(entries[end - 1])
+
+    return entries, horizon
+
+
+def _encode_cursor(position: tuple[datetime, str]) -> str:
+    return base64.urlsafe_b64encode(f"{position[0].isoformat()} {position[1]}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        start, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split(" ", 1)
+        return datetime.fromisoformat(start), id_
+    except ValueError:
+        raise InvalidCursorError
+
+
+def personalize(entry: CalendarEntry, user_id: str, admin: bool) -> Webinar | Coaching | None:
+    """Apply the user-specific fields to an event of the calendar snapshot."""
+
+    event, instructor_id, participants, _ = entry
+    now = utcnow()
+    if event.start + event.duration * 60 <= now.timestamp():
+        return None
+
+    start = utcfromtimestamp(event.start)
+    if isinstance(event, Webinar):
+        booked = user_id == instructor_id or user_id in participants
+        return event.copy(
+            update={
+                "admin_link": event.admin_link if admin or user_id == instructor_id else None,
+                "link": (
+                    event.link
+                    if admin or user_id == instructor_id or (booked and start - now < timedelta(days=1))
+                    else None
+                ),
+                "booked": booked,
+                "bookable": not booked and now < start and len(participants) < event.max_participants,
+            }
+        )
+
+    if not event.booked:
+        return event.copy(update={"bookable": user_id != instructor_id})
+
+    visible = admin or user_id == instructor_id or user_id in participants
+    return event.copy(
+        update={
+            "admin_link": event.admin_link if admin or user_id == instructor_id else None,
+            "link": event.link if visible else None,
+            "student": event.student if visible else None,
+        }
+    )
 
 
 async def get_events(
@@ -197,42 +494,73 @@ async def get_events(
     price_max: int | None,
     booked: bool | None,
     bookable: bool | None,
-) -> list[Webinar | Coaching]:
-    events: list[Webinar | Coaching] = []
-    if type_ is None or type_ == EventType.WEBINAR:
-        events += await get_webinars(
-            user_id,
-            admin,
-            title,
-            description,
-            instructor_id,
-            skill_id,
-            start_after,
-            start_before,
-            duration_min,
-            duration_max,
-        )
-    if type_ is None or type_ == EventType.COACHING:
-        events += await get_coachings(
-            user_id, admin, instructor_id, start_after, start_before, duration_min, duration_max
-        )
+    *,
+    cursor: str | None = None,
+    limit: int | None = None,
+) -> tuple[list[Webinar | Coaching], str | None]:
+    """Return the personalized events of the user and the cursor of the next page, if any."""
+
+    snapshot, next_position = await get_snapshot(
+        type_,
+        title,
+        description,
+        instructor_id,
+        skill_id,
+        start_after,
+        start_before,
+        duration_min,
+        duration_max,
+        price_min,
+        price_max,
+        booked,
+        bookable,
+        user_id if booked else None,
+        _decode_cursor(cursor) if cursor else None,
+        limit,
+    )
 
-    free = {ec.user_id async for ec in await db.stream(select(models.EmergencyCancel))}
-    for event in events:
-        if event.instructor and event.instructor.id in free:
-            event.price = 0
+    # booked and bookable partly depend on the user and are therefore checked again after personalization
+    events = [event for entry in snapshot if (event := personalize(entry, user_id, admin))]
 
     f = iter(events)
-    f = filter(lambda e: skill_id is None or skill_id == e.skill_id, f)
-    f = filter(lambda e: price_min is None or e.price >= price_min, f)
-    f = filter(lambda e: price_max is None or e.price <= price_max, f)
     f = filter(lambda e: booked is None or e.booked is booked, f)
     f = filter(lambda e: bookable is None or e.bookable is bookable, f)
 
-    return [*f]
+    return [*f], _encode_cursor(next_position) if next_position else None
+
+
+def _ics_token(user_id: str) -> str:
+    return hmac.digest(settings.calendar_secret.encode(), user_id.encode(), "sha256").hex()
+
 
+async def _paged_events(
+    user_id: str, admin: bool, filters: tuple[Any, ...], cursor: str | None
+) -> AsyncIterator[Webinar | Coaching]:
+    """Yield all events after `cursor`, loading only one page at a time."""
 
-@router.get("/calendar", dependencies=[require_verified_email], responses=verified_responses(Calendar))
+    while True:
+        events, cursor = await get_events(
+            user_id, admin, *filters, cursor=cursor, limit=settings.calendar_stream_page_size
+        )
+        for event in events:
+            yield event
+        if not cursor:
+            break
+
+
+async def _stream_calendar(
+    ics_token: str, user: User, filters: tuple[Any, ...], cursor: str | None
+) -> AsyncIterator[str]:
+    """Yield the calendar as newline delimited json: first the ics token, then one event per line."""
+
+    yield json.dumps({"ics_token": ics_token}) + "\n"
+    async for event in _paged_events(user.id, user.admin, filters, cursor):
+        yield event.json() + "\n"
+
+
+@router.get(
+    "/calendar", dependencies=[require_verified_email], responses=verified_responses(Calendar, InvalidCursorError)
+)
 async def get_calendar(
     type_: EventType | None = Query(None, alias="type", description="Return only events of this type"),
     title: str | None = Query(None, description="Return only events with this title"),
@@ -247,17 +575,27 @@ async def get_calendar(
     price_max: int | None = Query(None, description="Return only events that cost at most this much (in morphcoins)"),
     booked: bool | None = Query(None, description="Return only events that the user has booked"),
     bookable: bool | None = Query(None, description="Return only events that the user can book"),
+    limit: int | None = Query(
+        None, ge=1, description="Return at most this many events (plus coachings of the same slot)"
+    ),
+    cursor: str | None = Query(None, description="Continue after the page that returned this `next_cursor`"),
+    stream: bool = Query(False, description="Stream the calendar as newline delimited json"),
     user: User = user_auth,
 ) -> Any:
     """
     Return the calendar for the user.
 
+    Events are ordered by start. If `limit` is set, the events are paginated and `next_cursor` can be passed as
+    `cursor` to get the next page.
+
+    If `stream` is set, the response is sent as newline delimited json (`application/x-ndjson`) instead: the first
+    line contains the `ics_token` and each following line contains one event. All events after `cursor` are sent and
+    `limit` is ignored.
+
     *Requirements:* **VERIFIED**
     """
 
-    events = await get_events(
-        user.id,
-        user.admin,
+    filters = (
         type_,
         title,
         description,
@@ -272,15 +610,40 @@ async def get_calendar(
         booked,
         bookable,
     )
+    ics_token = f"{user.id}_" + _ics_token(user.id)
 
-    return Calendar(
-        ics_token=f"{user.id}_" + hmac.digest(settings.calendar_secret.encode(), user.id.encode(), "sha256").hex(),
-        events=events,
-    )
+    if stream:
+        if cursor:
+            _decode_cursor(cursor)  # fail before the response has started
+        return StreamingResponse(_stream_calendar(ics_token, user, filters, cursor), media_type="application/x-ndjson")
+
+    events, next_cursor = await get_events(user.id, user.admin, *filters, cursor=cursor, limit=limit)
+    return Calendar(ics_token=ics_token, events=events, next_cursor=next_cursor)
+
+
+async def _ics_etag(user_id: str, *filters: Any) -> str:
+    """
+    Return a strong etag for an ics feed without loading any events.
+
+    The etag changes whenever the calendar data changes (`clear_cache("calendar")`) and at the latest after one cache
+    ttl, which covers skill names, user infos and events that have ended in the meantime.
+    """
+
+    generation = await get_generation("calendar")
+    period = int(time.time()) // max(settings.cache_ttl, 1)
+    data = ":".join(map(str, [generation, period, user_id, *filters]))
+    return '"' + hashlib.sha256(data.encode()).hexdigest()[:32] + '"'
+
+
+def _etag_matches(etag: str, if_none_match: str | None) -> bool:
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
 
 
 @router.get("/calendar/{token}/academy.ics")
 async def download_ics(
+    request: Request,
     type_: EventType | None = Query(None, alias="type", description="Return only events of this type"),
     skill_id: str | None = Query(None, description="Return only events with this skill id"),
     booked: bool | None = Query(None, description="Return only events that the user has booked"),
@@ -290,17 +653,20 @@ async def download_ics(
     """wip"""
 
     user_id, token = token.split("_")
-    if token != hmac.digest(settings.calendar_secret.encode(), user_id.encode(), "sha256").hex():
+    if token != _ics_token(user_id):
         return Response(status_code=401)
 
+    etag = await _ics_etag(user_id, type_, skill_id, booked, bookable)
+    if _etag_matches(etag, request.headers.get("If-None-Match")):
+        return Response(status_code=304, headers={"ETag": etag})
+
     admin = await is_admin(user_id)
+    filters = (type_, None, None, None, skill_id, None, None, None, None, None, None, booked, bookable)
 
-    events = await get_events(
-        user_id, admin, type_, None, None, None, skill_id, None, None, None, None, None, None, booked, bookable
+    return StreamingResponse(
+        stream_ics(_paged_events(user_id, admin, filters, None)), media_type="text/calendar", headers={"ETag": etag}
     )
 
-    return Response(await create_ics(events), media_type="text/calendar")
-
 
 @router.delete(
     "/calendar/{event_id}",
@@ -323,6 +689,14 @@ async def cancel_event(event_id: str, user: User = user_auth) -> Any:
     raise SlotNotFoundException
 
 
+async def _enqueue_coins(user_id: str, coins: int, description: str) -> None:
+    """Add (or spend) coins after the cancellation has been committed."""
+
+    await models.OutboxMessage.enqueue(
+        OutboxAction.ADD_COINS, user_id=user_id, coins=coins, description=description, credit_note=False
+    )
+
+
 async def _try_cancel_webinar(event_id: str, user: User = user_auth) -> bool:
     webinar = await db.get(models.Webinar, id=event_id)
     if webinar is None:
@@ -349,9 +723,9 @@ async def _try_cancel_webinar(event_id: str, user: User = user_auth) -> bool:
             raise PermissionDeniedError
 
         if student_coins:
-            await shop.add_coins(participant.user_id, student_coins, f"Cancel webinar '{webinar.name}'", False)
+            await _enqueue_coins(participant.user_id, student_coins, f"Cancel webinar '{webinar.name}'")
         if instructor_coins:
-            await shop.add_coins(webinar.creator, instructor_coins, f"Cancel webinar '{webinar.name}'", False)
+            await _enqueue_coins(webinar.creator, instructor_coins, f"Cancel webinar '{webinar.name}'")
 
         await db.delete(participant)
         await clear_cache("calendar")
@@ -360,12 +734,13 @@ async def _try_cancel_webinar(event_id: str, user: User = user_auth) -> bool:
         return True
 
     for participant in webinar.participants:
-        await shop.spend_coins(participant.user_id, webinar.price, f"Webinar {webinar.name}")
+        await _enqueue_coins(participant.user_id, -webinar.price, f"Webinar {webinar.name}")
 
     if webinar.participants:
         await models.EmergencyCancel.create(webinar.creator)
 
     await db.delete(webinar)
+    await webinar_deadlines.cancel(webinar.id)
     await clear_cache("calendar")
     # todo: email
 
@@ -400,9 +775,9 @@ async def _try_cancel_coaching(event_id: str, user: User = user_auth) -> bool:
         await models.EmergencyCancel.create(slot.user_id)
 
     if student_coins:
-        await shop.add_coins(slot.booked_by, student_coins, "Cancel coaching", False)
+        await _enqueue_coins(slot.booked_by, student_coins, "Cancel coaching")
     if instructor_coins:
-        await shop.add_coins(slot.user_id, instructor_coins, "Cancel coaching", False)
+        await _enqueue_coins(slot.user_id, instructor_coins, "Cancel coaching")
 
     slot.cancel()
     # todo: email
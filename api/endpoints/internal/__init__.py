@@ -1,4 +1,6 @@
 from fastapi import APIRouter
 
+from . import cache, jobs
 
-INTERNAL_ROUTERS: list[APIRouter] = []
+
+INTERNAL_ROUTERS: list[APIRouter] = [cache.router, jobs.router]
@@ -0,0 +1,16 @@
+from typing import Any
+
+from fastapi import APIRouter
+
+from api.exceptions.auth import internal_responses
+from api.utils.cache import local_cache_stats
+
+
+router = APIRouter()
+
+
+@router.get("/cache", responses=internal_responses(dict[str, dict[str, int]]))
+async def get_cache_stats() -> Any:
+    """Return the hits, misses and sizes of the in-process caches of the worker that handles this request."""
+
+    return local_cache_stats()
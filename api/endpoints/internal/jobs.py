@@ -0,0 +1,20 @@
+from typing import Any
+
+from fastapi import APIRouter
+
+from api.exceptions.auth import internal_responses
+from api.utils.scheduler import job_stats
+
+
+router = APIRouter()
+
+
+@router.get("/jobs", responses=internal_responses(dict[str, dict[str, Any]]))
+async def get_job_stats() -> Any:
+    """
+    Return the runs, failures and durations of the background jobs of the worker that handles this request.
+
+    Jobs that only run on the leader are counted as skipped on all other workers.
+    """
+
+    return job_stats()
@@ -7,7 +7,8 @@ from api import models
 from api.auth import get_user, require_verified_email
 from api.database import db, filter_by
 from api.exceptions.auth import admin_responses
-from api.exceptions.slots import SlotBookedException, SlotNotFoundException
+from api.exceptions.slots import SlotBookedException, SlotNotFoundException, SlotOverlapException
+from api.models.slots import serialize_row, slot_deadlines
 from api.schemas.slots import CreateSlot, CreateWeeklySlot, Slot, WeeklySlot
 from api.utils.cache import clear_cache
 from api.utils.utc import utcfromtimestamp, utcnow
@@ -27,29 +28,40 @@ async def get_slots(user_id: str = get_user(require_self_or_admin=True)) -> Any:
     return [slot.serialize async for slot in await db.stream(filter_by(models.Slot, user_id=user_id))]
 
 
-@router.post("/slots/{user_id}", dependencies=[require_verified_email], responses=admin_responses(list[Slot]))
+@router.post(
+    "/slots/{user_id}",
+    dependencies=[require_verified_email],
+    responses=admin_responses(list[Slot], SlotOverlapException),
+)
 async def add_slots(
     slots: list[CreateSlot] = Body(embed=True), user_id: str = get_user(require_self_or_admin=True)
 ) -> Any:
     """
     Add slots for the user.
 
+    Slots that start in the past are ignored. If any of the new slots overlap with each other or with existing slots
+    of the user, no slots are added.
+
     *Requirements:* **VERIFIED** and (**SELF** or **ADMIN**)
     """
 
-    await clear_cache("calendar")
-
     now = utcnow().timestamp()
-    return [
-        (
-            await models.Slot.create(
-                user_id, utcfromtimestamp(slot.start), utcfromtimestamp(slot.start + 60 * slot.duration)
-            )
-        ).serialize
+    rows = [
+        models.Slot.new_row(user_id, utcfromtimestamp(slot.start), utcfromtimestamp(slot.start + 60 * slot.duration))
         for slot in slots
         if slot.start > now
     ]
 
+    ordered = sorted(rows, key=lambda row: row["start"])
+    if any(a["end"] > b["start"] for a, b in zip(ordered, ordered[1:])):
+        raise SlotOverlapException
+    if await models.Slot.insert_many(rows) != len(rows):
+        raise SlotOverlapException  # the exception handler rolls back the slots that have already been inserted
+
+    await clear_cache("calendar")
+
+    return [serialize_row(row["id"], row["start"], row["end"], False) for row in rows]
+
 
 @router.delete(
     "/slots/{user_id}/{slot_id}",
@@ -71,6 +83,7 @@ async def delete_slot(slot_id: str, user_id: str = get_user(require_self_or_admi
         raise SlotBookedException
 
     await db.delete(slot)
+    await slot_deadlines.cancel(slot.id)
 
     await clear_cache("calendar")
 
@@ -123,12 +136,15 @@ async def delete_weekly_slot(slot_id: str, user_id: str = get_user(require_self_
     if not slot:
         raise SlotNotFoundException
 
+    deleted = []
     for s in [*slot.slots]:
         if s.booked:
             s.weekly_slot = None
             s.weekly_slot_id = None
         else:
             await db.delete(s)
+            deleted.append(s.id)
+    await slot_deadlines.cancel(*deleted)
 
     await db.delete(slot)
 
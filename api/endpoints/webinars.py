@@ -19,6 +19,7 @@ from api.exceptions.webinars import (
     InsufficientRatingError,
     WebinarNotFoundError,
 )
+from api.models.webinars import webinar_deadlines
 from api.schemas.calendar import Webinar
 from api.schemas.user import User
 from api.schemas.webinars import CreateWebinar, UpdateWebinar
@@ -102,6 +103,7 @@ async def create_webinar(data: CreateWebinar, user: User = user_auth) -> Any:
         participants=[],
     )
     await db.add(webinar)
+    await webinar_deadlines.schedule({webinar.id: webinar.end})
 
     await clear_cache("calendar")
 
@@ -239,6 +241,7 @@ async def update_webinar(data: UpdateWebinar, user: User = user_auth, webinar: m
     if not user.admin:
         await check_price(user.id, webinar.skill_id, webinar.price, webinar.max_participants)
 
+    await webinar_deadlines.schedule({webinar.id: webinar.end})
     await clear_cache("calendar")
 
     return await webinar.serialize(True, True, True, False)
@@ -0,0 +1,9 @@
+from starlette import status
+
+from api.exceptions.api_exception import APIException
+
+
+class InvalidCursorError(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    detail = "Invalid cursor"
+    description = "The cursor is malformed."
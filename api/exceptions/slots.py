@@ -13,3 +13,9 @@ class SlotBookedException(APIException):
     status_code = status.HTTP_400_BAD_REQUEST
     detail = "Slot already booked"
     description = "The requested slot is already booked."
+
+
+class SlotOverlapException(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    detail = "Slots overlap"
+    description = "The slots overlap with each other or with existing slots of the user."
@@ -2,6 +2,7 @@ from .coachings import Coaching
 from .emergency_cancel import EmergencyCancel
 from .exams import Exam
 from .lecturer_rating import LecturerRating
+from .outbox import OutboxMessage
 from .slots import EventType, Slot
 from .webinar_participants import WebinarParticipant
 from .webinars import Webinar
@@ -14,6 +15,7 @@ __all__ = [
     "EventType",
     "Exam",
     "LecturerRating",
+    "OutboxMessage",
     "Slot",
     "Webinar",
     "WebinarParticipant",
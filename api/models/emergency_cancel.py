@@ -1,7 +1,7 @@
 from sqlalchemy import Column, String
 from sqlalchemy.orm import Mapped
 
-from api.database import Base, db, filter_by
+from api.database import Base, db, delete, filter_by
 
 
 class EmergencyCancel(Base):
@@ -24,3 +24,8 @@ class EmergencyCancel(Base):
             await db.delete(x)
             return True
         return False
+
+    @classmethod
+    async def delete_many(cls, user_ids: set[str]) -> None:
+        if user_ids:
+            await db.exec(delete(cls).where(cls.user_id.in_(user_ids)).execution_options(synchronize_session=False))
@@ -1,19 +1,29 @@
 from __future__ import annotations
 
 from datetime import datetime
+from typing import Any, Iterable, cast
 from uuid import uuid4
 
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Index, Integer, String, insert, tuple_
 from sqlalchemy.orm import Mapped
 
-from api.database import Base, db
+from api.database import Base, db, select
 from api.database.database import UTCDateTime, filter_by
 from api.settings import settings
-from api.utils.cache import clear_cache, redis_cached
+from api.utils.cache import clear_cache, get_cached_many, redis_cached, set_cached_many
+
+
+# maximum number of ratings that are inserted with a single statement
+INSERT_BATCH_SIZE = 500
 
 
 class LecturerRating(Base):
     __tablename__ = "events_lecturer_rating"
+    __table_args__ = (
+        Index("ix_events_lecturer_rating_lecturer_id_skill_id_rating", "lecturer_id", "skill_id", "rating"),
+        Index("ix_events_lecturer_rating_participant_id_rating", "participant_id", "rating"),
+        Base.__table_args__,
+    )
 
     id: Mapped[str] = Column(String(36), primary_key=True, unique=True)
     lecturer_id: Mapped[str] = Column(String(36))
@@ -38,11 +48,35 @@ class LecturerRating(Base):
             )
         )
 
+    @staticmethod
+    def new_row(
+        lecturer_id: str, participant_id: str, skill_id: str, webinar_timestamp: datetime, webinar_name: str
+    ) -> dict[str, Any]:
+        """Return the column values of a new unrated rating for `insert_many`."""
+
+        return {
+            "id": str(uuid4()),
+            "lecturer_id": lecturer_id,
+            "participant_id": participant_id,
+            "skill_id": skill_id,
+            "webinar_timestamp": webinar_timestamp,
+            "webinar_name": webinar_name,
+        }
+
+    @classmethod
+    async def insert_many(cls, rows: list[dict[str, Any]]) -> None:
+        """Insert multiple ratings with a single statement per batch of `INSERT_BATCH_SIZE` ratings."""
+
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            end = start + INSERT_BATCH_SIZE
+            await db.exec(insert(cls).values(rows[start:end]))
+
     async def add_rating(self, rating: int) -> None:
         self.rating = rating
         self.webinar_name = None
         self.participant_id = None
         await clear_cache("lecturer_rating")
+        await clear_cache("calendar")
 
     @classmethod
     async def list_unrated(cls, participant_id: str) -> list[LecturerRating]:
@@ -55,24 +89,53 @@ class LecturerRating(Base):
     @classmethod
     @redis_cached("lecturer_rating", "lecturer_id", "skill_id")
     async def get_rating(cls, lecturer_id: str, skill_id: str) -> float | None:
-        ratings = [
-            (rating, rating.rating, rating.webinar_timestamp.timestamp())
-            async for rating in await db.stream(
-                filter_by(cls, lecturer_id=lecturer_id, skill_id=skill_id).where(cls.rating != None)  # noqa: E711
+        ratings = await db.all(
+            filter_by(cls, lecturer_id=lecturer_id, skill_id=skill_id).where(cls.rating != None)  # noqa: E711
+        )
+        return await _weighted_rating(ratings)
+
+    @classmethod
+    async def get_ratings(cls, pairs: Iterable[tuple[str, str]]) -> dict[tuple[str, str], float | None]:
+        """Return the ratings for multiple (lecturer_id, skill_id) pairs using a single query for all cache misses."""
+
+        keys = [*dict.fromkeys(pairs)]
+        result: dict[tuple[str, str], float | None]
+        result, generation = await get_cached_many(cls.get_rating, keys)
+        if not (missing := [k for k in keys if k not in result]):
+            return result
+
+        grouped: dict[tuple[str, str], list[LecturerRating]] = {k: [] for k in missing}
+        rating: LecturerRating
+        # the separate condition on the first column lets databases without index support for row values use the index
+        for rating in await db.all(
+            select(cls).where(
+                cls.lecturer_id.in_({lecturer_id for lecturer_id, _ in missing}),
+                tuple_(cls.lecturer_id, cls.skill_id).in_(missing),
+                cls.rating != None,  # noqa: E711
             )
-        ]
-        if not ratings:
-            return None
-
-        max_timestamp = max(ts for *_, ts in ratings)
-        total = 0
-        weights = 0
-        for r, rating, timestamp in ratings:
-            days = (max_timestamp - timestamp) / 3600 / 24
-            if days > settings.rating_max_keep:
-                await db.delete(r)
-                continue
-            weight = 2 ** (-days / settings.rating_half_life)
-            total += rating * weight
-            weights += weight
-        return total / weights if weights else None
+        ):
+            grouped[(rating.lecturer_id, rating.skill_id)].append(rating)
+
+        computed = {k: await _weighted_rating(ratings) for k, ratings in grouped.items()}
+        await set_cached_many(cls.get_rating, computed, generation)
+        return result | computed
+
+
+async def _weighted_rating(ratings: list[LecturerRating]) -> float | None:
+    """Combine ratings using an exponential decay by age and delete ratings that are too old."""
+
+    if not ratings:
+        return None
+
+    max_timestamp = max(r.webinar_timestamp.timestamp() for r in ratings)
+    total = 0.0
+    weights = 0.0
+    for r in ratings:
+        days = (max_timestamp - r.webinar_timestamp.timestamp()) / 3600 / 24
+        if days > settings.rating_max_keep:
+            await db.delete(r)
+            continue
+        weight = 2 ** (-days / settings.rating_half_life)
+        total += cast(int, r.rating) * weight
+        weights += weight
+    return total / weights if weights else None
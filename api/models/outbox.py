@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import enum
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable
+from uuid import uuid4
+
+from httpx import TransportError
+from sqlalchemy import JSON, Column, Integer, String, insert, update
+from sqlalchemy.orm import Mapped
+
+from api.database import Base, db, db_wrapper, delete, select
+from api.database.database import UTCDateTime
+from api.logger import get_logger
+from api.services import shop
+from api.services.internal import InternalServiceError
+from api.services.skills import add_xp
+from api.settings import settings
+from api.utils.concurrency import gather_limited
+from api.utils.utc import utcnow
+
+
+logger = get_logger(__name__)
+
+# maximum number of messages that are inserted with a single statement
+INSERT_BATCH_SIZE = 500
+
+
+class OutboxAction(enum.Enum):
+    ADD_COINS = "add_coins"
+    ADD_XP = "add_xp"
+
+
+class DispatchResult(enum.Enum):
+    DONE = "done"
+    # the call has been refused, retrying it would not change that
+    REJECTED = "rejected"
+    # the service could not be reached or failed to handle the call, it is retried later
+    FAILED = "failed"
+
+
+# the message id is passed to the handlers as idempotency key
+HANDLERS: dict[OutboxAction, Callable[..., Awaitable[Any]]] = {
+    OutboxAction.ADD_COINS: shop.add_coins,
+    OutboxAction.ADD_XP: add_xp,
+}
+
+
+class OutboxMessage(Base):
+    """A call to another service that is written in the same transaction as the change that requires it."""
+
+    __tablename__ = "events_outbox"
+
+    id: Mapped[str] = Column(String(36), primary_key=True, unique=True)
+    action: Mapped[str] = Column(String(32))
+    payload: Mapped[dict[str, Any]] = Column(JSON)
+    created_at: Mapped[datetime] = Column(UTCDateTime)
+    next_attempt: Mapped[datetime | None] = Column(UTCDateTime, index=True)
+    attempts: Mapped[int] = Column(Integer)
+    # set when the message has been given up after the maximum number of attempts, it is not dispatched anymore
+    failed_at: Mapped[datetime | None] = Column(UTCDateTime, nullable=True)
+
+    @staticmethod
+    def new_row(action: OutboxAction, **payload: Any) -> dict[str, Any]:
+        """Return the column values of a new message for `insert_many`."""
+
+        now = utcnow()
+        return {
+            "id": str(uuid4()),
+            "action": action.value,
+            "payload": payload,
+            "created_at": now,
+            "next_attempt": now,
+            "attempts": 0,
+        }
+
+    @classmethod
+    async def insert_many(cls, rows: list[dict[str, Any]]) -> None:
+        """Insert multiple messages with a single statement per batch of `INSERT_BATCH_SIZE` messages."""
+
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            end = start + INSERT_BATCH_SIZE
+            await db.exec(insert(cls).values(rows[start:end]))
+
+    @classmethod
+    async def enqueue(cls, action: OutboxAction, **payload: Any) -> None:
+        await cls.insert_many([cls.new_row(action, **payload)])
+
+    async def dispatch(self) -> DispatchResult:
+        """Perform the call of this message and return whether it has been successful."""
+
+        try:
+            ok = await HANDLERS[OutboxAction(self.action)](**self.payload, idempotency_key=self.id) is not False
+        except (TransportError, InternalServiceError) as e:
+            if isinstance(e, InternalServiceError) and e.args[0].status_code < 500:
+                logger.error(f"Outbox message {self.id} has been rejected: {e.args[0].status_code}")
+                return DispatchResult.REJECTED
+            logger.warning(f"Outbox message {self.id} failed: {e!r}")
+            return DispatchResult.FAILED
+        except Exception as e:
+            logger.exception(e)
+            return DispatchResult.REJECTED
+
+        if not ok:
+            logger.error(f"Outbox message {self.id} has been rejected")
+            return DispatchResult.REJECTED
+        return DispatchResult.DONE
+
+
+@db_wrapper
+async def _claim_batch() -> list[OutboxMessage]:
+    """
+    Lock the next batch of due messages and record the attempt that is about to be made.
+
+    The attempt is committed before the messages are dispatched, so other workers skip them until their next attempt is
+    due, even if this worker dies while dispatching. If a dispatch takes longer than the retry delay, the message may
+    be dispatched twice, which the idempotency key makes harmless.
+    """
+
+    now = utcnow()
+    messages: list[OutboxMessage] = await db.all(
+        select(OutboxMessage)
+        .where(OutboxMessage.next_attempt <= now)
+        .order_by(OutboxMessage.next_attempt)
+        .limit(settings.outbox_batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    for message in messages:
+        message.attempts += 1
+        delay = min(settings.outbox_retry_delay * 2 ** (message.attempts - 1), settings.outbox_max_backoff)
+        message.next_attempt = now + timedelta(seconds=delay)
+
+    # keep the loaded values of the messages after the commit
+    await db.flush()
+    db.session.expunge_all()
+    return messages
+
+
+@db_wrapper
+async def _settle_batch(results: list[tuple[OutboxMessage, DispatchResult]]) -> None:
+    """Delete the messages that are done or rejected and give up messages that failed too often."""
+
+    done = [message.id for message, result in results if result != DispatchResult.FAILED]
+    given_up = [
+        message.id
+        for message, result in results
+        if result == DispatchResult.FAILED and message.attempts >= settings.outbox_max_attempts
+    ]
+    for id_ in given_up:
+        logger.error(f"Giving up outbox message {id_} after {settings.outbox_max_attempts} attempts")
+
+    if done:
+        await db.exec(
+            delete(OutboxMessage).where(OutboxMessage.id.in_(done)).execution_options(synchronize_session=False)
+        )
+    if given_up:
+        await db.exec(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(given_up))
+            .values(next_attempt=None, failed_at=utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def _dispatch_batch() -> int:
+    messages = await _claim_batch()
+    results = await gather_limited(*[message.dispatch() for message in messages])
+    await _settle_batch([*zip(messages, results)])
+    return len(messages)
+
+
+async def dispatch_outbox() -> None:
+    """Dispatch all due messages in batches. No transaction is held open while the messages are dispatched."""
+
+    while await _dispatch_batch() >= settings.outbox_batch_size:
+        pass
@@ -3,22 +3,32 @@ from __future__ import annotations
 import enum
 import random
 import string
-from datetime import datetime
-from typing import Any
+from datetime import datetime, timedelta
+from typing import Any, cast
 from uuid import uuid4
 
-from sqlalchemy import BigInteger, Column, Enum, ForeignKey, String
-from sqlalchemy.orm import Mapped, relationship
+from sqlalchemy import BigInteger, Column, Enum, ForeignKey, Index, String, and_, insert, literal, or_, union_all
+from sqlalchemy.engine import Row
+from sqlalchemy.future import select as sa_select
+from sqlalchemy.orm import Mapped, aliased, relationship
 
-from api.database import Base, db, db_wrapper, select
+from api.database import Base, db, db_wrapper, delete, select
 from api.database.database import UTCDateTime
+from api.models.outbox import OutboxAction, OutboxMessage
 from api.models.weekly_slots import WeeklySlot
-from api.services import shop
-from api.services.skills import add_xp
 from api.settings import settings
+from api.utils.cache import clear_cache
+from api.utils.deadlines import Deadlines
 from api.utils.utc import utcnow
 
 
+# maximum number of slots that are inserted with a single statement
+INSERT_BATCH_SIZE = 500
+
+# slots are deleted (and paid out if booked) by `clean_old_slots` as soon as they end
+slot_deadlines = Deadlines("slots")
+
+
 class EventType(enum.Enum):
     COACHING = "coaching"
     EXAM = "exam"
@@ -26,19 +36,22 @@ class EventType(enum.Enum):
 
 class Slot(Base):
     __tablename__ = "events_slot"
+    __table_args__ = (Index("ix_events_slot_user_id_start", "user_id", "start"), Base.__table_args__)
 
     id: Mapped[str] = Column(String(36), primary_key=True, unique=True)
     user_id: Mapped[str] = Column(String(36))
-    start: Mapped[datetime] = Column(UTCDateTime)
-    end: Mapped[datetime] = Column(UTCDateTime)
-    booked_by: Mapped[str | None] = Column(String(36), nullable=True)
+    start: Mapped[datetime] = Column(UTCDateTime, index=True)
+    end: Mapped[datetime] = Column(UTCDateTime, index=True)
+    booked_by: Mapped[str | None] = Column(String(36), nullable=True, index=True)
     event_type: Mapped[EventType | None] = Column(Enum(EventType), nullable=True)
     student_coins: Mapped[int | None] = Column(BigInteger, nullable=True)
     instructor_coins: Mapped[int | None] = Column(BigInteger, nullable=True)
     skill_id: Mapped[str | None] = Column(String(256), nullable=True)
     admin_link: Mapped[str | None] = Column(String(256), nullable=True)
     link: Mapped[str | None] = Column(String(256), nullable=True)
-    weekly_slot_id: Mapped[str | None] = Column(String(36), ForeignKey("events_weekly_slots.id"), nullable=True)
+    weekly_slot_id: Mapped[str | None] = Column(
+        String(36), ForeignKey("events_weekly_slots.id"), nullable=True, index=True
+    )
     weekly_slot: Mapped[WeeklySlot | None] = relationship("WeeklySlot", back_populates="slots", lazy="selectin")
 
     @property
@@ -47,26 +60,47 @@ class Slot(Base):
 
     @property
     def serialize(self) -> dict[str, Any]:
-        return {"id": self.id, "start": self.start.timestamp(), "end": self.end.timestamp(), "booked": self.booked}
+        return serialize_row(self.id, self.start, self.end, self.booked)
+
+    @staticmethod
+    def new_row(user_id: str, start: datetime, end: datetime, weekly_slot_id: str | None = None) -> dict[str, Any]:
+        """Return the column values of a new unbooked slot for `insert_many`. All other columns default to null."""
+
+        return {"id": str(uuid4()), "user_id": user_id, "start": start, "end": end, "weekly_slot_id": weekly_slot_id}
 
     @classmethod
-    async def create(cls, user_id: str, start: datetime, end: datetime) -> Slot:
-        slot = cls(
-            id=str(uuid4()),
-            user_id=user_id,
-            start=start,
-            end=end,
-            booked_by=None,
-            event_type=None,
-            student_coins=None,
-            instructor_coins=None,
-            skill_id=None,
-            admin_link=None,
-            link=None,
-            weekly_slot_id=None,
-        )
-        await db.add(slot)
-        return slot
+    async def insert_many(cls, rows: list[dict[str, Any]]) -> int:
+        """
+        Insert multiple slots with a single statement per batch without creating orm objects.
+
+        Slots that overlap with an existing slot of the same user are skipped. The rows are not checked for overlaps
+        among each other. Large lists are split into batches of `INSERT_BATCH_SIZE` slots.
+
+        :param rows: the column values of the new slots as returned by `new_row`
+        :return: the number of inserted slots
+        """
+
+        if not rows:
+            return 0
+        if len(rows) > INSERT_BATCH_SIZE:
+            return await cls.insert_many(rows[:INSERT_BATCH_SIZE]) + await cls.insert_many(rows[INSERT_BATCH_SIZE:])
+
+        table = Base.metadata.tables[cls.__tablename__]
+        columns = [table.c[name] for name in rows[0]]
+        new = union_all(
+            *[sa_select(*[literal(row[c.name], c.type).label(c.name) for c in columns]) for row in rows]
+        ).subquery()
+
+        # mysql does not allow subqueries on the table that is inserted into, so an anti join is used instead
+        existing = aliased(cls)
+        overlap = and_(existing.user_id == new.c.user_id, existing.start < new.c.end, existing.end > new.c.start)
+        query = select(new).outerjoin(existing, overlap).where(existing.id.is_(None))
+        statement = insert(table).from_select([c.name for c in columns], query)
+        count = cast(int, (await db.exec(statement)).rowcount)
+
+        # deadlines of skipped slots are dropped by `clean_old_slots`
+        await slot_deadlines.schedule({row["id"]: row["end"] for row in rows})
+        return count
 
     def book(
         self, user_id: str, event_type: EventType, student_coins: int, instructor_coins: int, skill_id: str
@@ -88,6 +122,10 @@ class Slot(Base):
         self.link = None
 
 
+def serialize_row(id_: str, start: datetime, end: datetime, booked: bool) -> dict[str, Any]:
+    return {"id": id_, "start": start.timestamp(), "end": end.timestamp(), "booked": booked}
+
+
 def generate_meeting_link() -> tuple[str, str]:
     link = "https://meet.jit.si/" + "-".join(
         "".join(random.choice(string.ascii_uppercase + string.digits) for _ in range(4)) for _ in range(4)  # noqa: S311
@@ -95,20 +133,78 @@ def generate_meeting_link() -> tuple[str, str]:
     return link, link
 
 
+def _grants(slot: Row) -> list[dict[str, Any]]:
+    """Return the outbox messages that grant the coins and xp for a completed coaching."""
+
+    if slot.skill_id is None:
+        return []
+
+    grants = []
+    if slot.instructor_coins:
+        grants.append(
+            OutboxMessage.new_row(
+                OutboxAction.ADD_COINS,
+                user_id=slot.user_id,
+                coins=slot.instructor_coins,
+                description="Coaching",
+                credit_note=True,
+            )
+        )
+    for user_id, xp in [
+        (slot.user_id, settings.coaching_lecturer_xp),
+        (slot.booked_by, settings.coaching_participant_xp),
+    ]:
+        grants.append(OutboxMessage.new_row(OutboxAction.ADD_XP, user_id=user_id, skill_id=slot.skill_id, xp=xp))
+    return grants
+
+
 @db_wrapper
+async def _delete_expired_slots(due: list[str], now: datetime) -> dict[str, datetime]:
+    """
+    Pay out and delete the given slots if they have ended and return the new deadlines of those that are left.
+
+    Slots that have not ended yet keep their end as deadline. Slots that are locked by another transaction are checked
+    again after `scheduler_retry_delay` seconds.
+    """
+
+    expired = and_(Slot.id.in_(due), Slot.end <= now)
+
+    # booked slots are paid out via the outbox in the same transaction in which they are deleted, and are locked until
+    # then, so a former leader that is still running cannot pay them out a second time
+    booked = (
+        await db.exec(
+            sa_select(Slot.id, Slot.user_id, Slot.booked_by, Slot.skill_id, Slot.instructor_coins)
+            .where(expired, Slot.booked_by.is_not(None))
+            .with_for_update(skip_locked=True)
+        )
+    ).all()
+    # if slot.booked and slot.event_type == EventType.EXAM and now - slot.end < timedelta(days=7):
+    #     continue
+    await OutboxMessage.insert_many([row for slot in booked for row in _grants(slot)])
+    # booked slots that are locked by another transaction are left to it
+    paid = or_(Slot.booked_by.is_(None), Slot.id.in_([slot.id for slot in booked]))
+    await db.exec(delete(Slot).where(expired, paid).execution_options(synchronize_session=False))
+
+    await clear_cache("calendar")
+
+    retry = now + timedelta(seconds=settings.scheduler_retry_delay)
+    left = (await db.exec(sa_select(Slot.id, Slot.end).where(Slot.id.in_(due)))).all()
+    return {id_: end if end > now else retry for id_, end in left}
+
+
 async def clean_old_slots() -> None:
     now = utcnow()
-    slot: Slot
-    async for slot in await db.stream(select(Slot).where(Slot.end < now)):
-        # if slot.booked and slot.event_type == EventType.EXAM and now - slot.end < timedelta(days=7):
-        #     continue
-        if slot.booked and slot.booked_by is not None and slot.skill_id is not None:
-            if slot.instructor_coins:
-                await shop.add_coins(slot.user_id, slot.instructor_coins, "Coaching", True)
-            await add_xp(slot.user_id, slot.skill_id, settings.coaching_lecturer_xp)
-            await add_xp(slot.booked_by, slot.skill_id, settings.coaching_participant_xp)
-        await db.delete(slot)
-
-    weekly_slot: WeeklySlot
-    async for weekly_slot in await db.stream(select(WeeklySlot)):
-        await weekly_slot.create_slots()
+    if not (due := await slot_deadlines.due(now)):
+        return
+
+    left = await _delete_expired_slots(due, now)
+    # the deadlines are only changed after the commit, so they are retried if the transaction fails
+    await slot_deadlines.cancel(*(id_ for id_ in due if id_ not in left))
+    await slot_deadlines.schedule(left)
+
+
+@db_wrapper
+async def sync_slot_deadlines() -> None:
+    """Schedule the deadlines of all slots, e.g. in case deadlines have been lost in redis."""
+
+    await slot_deadlines.schedule(dict((await db.exec(sa_select(Slot.id, Slot.end))).all()))
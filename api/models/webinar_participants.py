@@ -10,4 +10,4 @@ class WebinarParticipant(Base):
 
     webinar_id: Mapped[str] = Column(String(36), ForeignKey("events_webinars.id"), primary_key=True)
     webinar: Webinar = relationship("Webinar", back_populates="participants", lazy="selectin")
-    user_id: Mapped[str] = Column(String(36), primary_key=True)
+    user_id: Mapped[str] = Column(String(36), primary_key=True, index=True)
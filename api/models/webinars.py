@@ -1,29 +1,39 @@
 from __future__ import annotations
 
-from datetime import datetime
-from typing import TYPE_CHECKING
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any
 
-from sqlalchemy import BigInteger, Column, Integer, String
+from sqlalchemy import BigInteger, Column, Index, Integer, String
+from sqlalchemy.future import select as sa_select
 from sqlalchemy.orm import Mapped, relationship
 
 from .emergency_cancel import EmergencyCancel
 from .lecturer_rating import LecturerRating
+from .outbox import OutboxAction, OutboxMessage
 from ..database.database import UTCDateTime
 from ..schemas import calendar
-from ..services import shop
 from ..services.auth import get_userinfo
-from ..services.skills import add_xp
 from ..settings import settings
+from ..utils.cache import clear_cache
+from ..utils.deadlines import Deadlines
 from ..utils.utc import utcnow
-from api.database import Base, db, db_wrapper, select
+from api.database import Base, db, db_wrapper, delete, select
 
 
 if TYPE_CHECKING:
     from .webinar_participants import WebinarParticipant
 
+# webinars are settled by `clean_old_webinars` as soon as they end
+webinar_deadlines = Deadlines("webinars")
+
 
 class Webinar(Base):
     __tablename__ = "events_webinars"
+    __table_args__ = (
+        Index("ix_events_webinars_creator_start", "creator", "start"),
+        Index("ix_events_webinars_skill_id_start", "skill_id", "start"),
+        Base.__table_args__,
+    )
 
     id: Mapped[str] = Column(String(36), primary_key=True, unique=True)
     skill_id: Mapped[str] = Column(String(256))
@@ -34,7 +44,7 @@ class Webinar(Base):
     admin_link: Mapped[str] = Column(String(256))
     link: Mapped[str] = Column(String(256))
     start: Mapped[datetime] = Column(UTCDateTime)
-    end: Mapped[datetime] = Column(UTCDateTime)
+    end: Mapped[datetime] = Column(UTCDateTime, index=True)
     max_participants: Mapped[int] = Column(Integer)
     price: Mapped[int] = Column(BigInteger)
     participants: list[WebinarParticipant] = relationship(
@@ -63,19 +73,89 @@ class Webinar(Base):
         )
 
 
+def _grants(webinar: Webinar) -> list[dict[str, Any]]:
+    """Return the outbox messages that grant the coins and xp for a finished webinar."""
+
+    coins = int(len(webinar.participants) * webinar.price * (1 - settings.event_fee))
+    return [
+        *(
+            OutboxMessage.new_row(
+                OutboxAction.ADD_XP, user_id=p.user_id, skill_id=webinar.skill_id, xp=settings.webinar_participant_xp
+            )
+            for p in webinar.participants
+        ),
+        OutboxMessage.new_row(
+            OutboxAction.ADD_COINS, user_id=webinar.creator, coins=coins, description="Webinar", credit_note=True
+        ),
+        OutboxMessage.new_row(
+            OutboxAction.ADD_XP, user_id=webinar.creator, skill_id=webinar.skill_id, xp=settings.webinar_lecturer_xp
+        ),
+    ]
+
+
 @db_wrapper
-async def clean_old_webinars() -> None:
+async def _settle_webinars(due: list[str], now: datetime) -> dict[str, datetime]:
+    """
+    Settle and delete the given webinars if they have ended and return the new deadlines of those that are left.
+
+    Webinars that have been moved after their deadline was scheduled get their new end as deadline. Webinars that are
+    locked by another transaction are checked again after `scheduler_retry_delay` seconds.
+    """
+
+    expired = []
     webinar: Webinar
-    async for webinar in await db.stream(select(Webinar, Webinar.participants).where(Webinar.end < utcnow())):
-        for participant in webinar.participants:
-            await LecturerRating.create(
-                webinar.creator, participant.user_id, webinar.skill_id, webinar.start, webinar.name
-            )
-            await add_xp(participant.user_id, webinar.skill_id, settings.webinar_participant_xp)
-        await shop.add_coins(
-            webinar.creator, int(len(webinar.participants) * webinar.price * (1 - settings.event_fee)), "Webinar", True
-        )
-        if webinar.participants:
-            await EmergencyCancel.delete(webinar.creator)
-        await add_xp(webinar.creator, webinar.skill_id, settings.webinar_lecturer_xp)
-        await db.delete(webinar)
+    for webinar in await db.all(
+        select(Webinar, Webinar.participants).where(Webinar.id.in_(due)).with_for_update(skip_locked=True)
+    ):
+        if webinar.end <= now:
+            expired.append(webinar)
+
+    await OutboxMessage.insert_many([row for webinar in expired for row in _grants(webinar)])
+    await LecturerRating.insert_many(
+        [
+            LecturerRating.new_row(webinar.creator, p.user_id, webinar.skill_id, webinar.start, webinar.name)
+            for webinar in expired
+            for p in webinar.participants
+        ]
+    )
+    await EmergencyCancel.delete_many({webinar.creator for webinar in expired if webinar.participants})
+    if expired_ids := [webinar.id for webinar in expired]:
+        from .webinar_participants import WebinarParticipant
+
+        for statement in [
+            delete(WebinarParticipant).where(WebinarParticipant.webinar_id.in_(expired_ids)),
+            delete(Webinar).where(Webinar.id.in_(expired_ids)),
+        ]:
+            await db.exec(statement.execution_options(synchronize_session=False))
+
+    await clear_cache("calendar")
+
+    retry = now + timedelta(seconds=settings.scheduler_retry_delay)
+    left = (await db.exec(sa_select(Webinar.id, Webinar.end).where(Webinar.id.in_(due)))).all()
+    return {id_: end if end > now else retry for id_, end in left}
+
+
+async def clean_old_webinars() -> None:
+    """
+    Settle and delete all webinars that have ended.
+
+    The grants are written to the outbox in the same transaction that creates the ratings and deletes the webinars,
+    so a webinar is either settled completely or not at all and can safely be retried. The webinars are locked until
+    then, so a former leader that is still running cannot settle them a second time.
+    """
+
+    now = utcnow()
+    if not (due := await webinar_deadlines.due(now)):
+        return
+
+    left = await _settle_webinars(due, now)
+    # the deadlines are only changed after the commit, so they are retried if the transaction fails
+    await webinar_deadlines.cancel(*(id_ for id_ in due if id_ not in left))
+    await webinar_deadlines.schedule(left)
+
+
+@db_wrapper
+async def sync_webinar_deadlines() -> None:
+    """Schedule the deadlines of all webinars, e.g. in case deadlines have been lost in redis."""
+
+    await webinar_deadlines.schedule(dict((await db.exec(sa_select(Webinar.id, Webinar.end))).all()))
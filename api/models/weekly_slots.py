@@ -5,16 +5,20 @@ from typing import TYPE_CHECKING, Any
 from uuid import uuid4
 
 from sqlalchemy import Column, SmallInteger, String, Time
-from sqlalchemy.orm import Mapped, relationship
+from sqlalchemy.orm import Mapped, raiseload, relationship
 
 from ..database.database import UTCDateTime
+from ..utils.cache import clear_cache
 from ..utils.utc import utcnow
-from api.database import Base, db
+from api.database import Base, db, db_wrapper, select
 
 
 if TYPE_CHECKING:
     from . import Slot
 
+# slots are created this far in advance
+HORIZON = timedelta(days=30)
+
 
 class WeeklySlot(Base):
     __tablename__ = "events_weekly_slots"
@@ -25,7 +29,7 @@ class WeeklySlot(Base):
     start: Mapped[time] = Column(Time)
     end: Mapped[time] = Column(Time)
     slots: list[Slot] = relationship("Slot", back_populates="weekly_slot", lazy="selectin")
-    last_slot: Mapped[datetime] = Column(UTCDateTime)
+    last_slot: Mapped[datetime] = Column(UTCDateTime, index=True)  # rules are due when this enters the horizon
 
     @property
     def serialize(self) -> dict[str, Any]:
@@ -40,19 +44,50 @@ class WeeklySlot(Base):
     async def create(cls, user_id: str, weekday: int, start: time, end: time) -> WeeklySlot:
         slot = cls(id=str(uuid4()), user_id=user_id, weekday=weekday, start=start, end=end, last_slot=utcnow())
         await db.add(slot)
+        await db.flush()  # the slots are inserted without the orm and reference this row
         await slot.create_slots()
         return slot
 
-    async def create_slots(self) -> None:
+    def generate_slots(self, until: datetime) -> list[dict[str, Any]]:
+        """Advance `last_slot` up to `until` and return the column values of the new slots for `Slot.insert_many`."""
+
         from .slots import Slot
 
-        until = utcnow() + timedelta(days=30)
         minutes = ((self.end.hour - self.start.hour) * 60 + (self.end.minute - self.start.minute)) % (60 * 24)
+        rows = []
         while self.last_slot <= until:
             self.last_slot = next_slot(self.last_slot, self.weekday, self.start)
-            slot = await Slot.create(self.user_id, self.last_slot, self.last_slot + timedelta(minutes=minutes))
-            slot.weekly_slot = self
-            slot.weekly_slot_id = self.id
+            rows.append(
+                Slot.new_row(self.user_id, self.last_slot, self.last_slot + timedelta(minutes=minutes), self.id)
+            )
+        return rows
+
+    async def create_slots(self) -> None:
+        from .slots import Slot
+
+        await Slot.insert_many(self.generate_slots(utcnow() + HORIZON))
+
+    @classmethod
+    async def create_due_slots(cls) -> int:
+        """
+        Create the slots of all rules whose last slot has entered the horizon with a single insert.
+
+        :return: the number of created slots
+        """
+
+        from .slots import Slot
+
+        until = utcnow() + HORIZON
+        weekly_slots = await db.all(select(cls).where(cls.last_slot <= until).options(raiseload(cls.slots)))
+        return await Slot.insert_many(
+            [row for weekly_slot in weekly_slots for row in weekly_slot.generate_slots(until)]
+        )
+
+
+@db_wrapper
+async def create_weekly_slots() -> None:
+    if await WeeklySlot.create_due_slots():
+        await clear_cache("calendar")
 
 
 def next_slot(start: datetime, weekday: int, t: time) -> datetime:
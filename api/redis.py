@@ -11,6 +11,8 @@ logger = get_logger(__name__)
 # global redis connection
 logger.debug("initializing redis connection")
 redis: Redis = cast(Callable[..., Redis], from_url)(settings.redis_url, encoding="utf-8", decode_responses=True)
+# cached values are stored as raw bytes
+cache_redis: Redis = cast(Callable[..., Redis], from_url)(settings.redis_url)
 auth_redis: Redis = cast(Callable[..., Redis], from_url)(
     settings.auth_redis_url, encoding="utf-8", decode_responses=True
 )
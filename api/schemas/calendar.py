@@ -42,3 +42,4 @@ class Coaching(Event):
 class Calendar(BaseModel):
     ics_token: str = Field(description="The token to access the calendar via the ics endpoint")
     events: list[Webinar | Coaching] = Field(description="List of events")
+    next_cursor: str | None = Field(description="The cursor of the next page, if there might be more events")
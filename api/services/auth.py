@@ -1,8 +1,10 @@
-from typing import cast
+from typing import Iterable, cast
 
 from api.schemas.user import UserInfo
 from api.services.internal import InternalService
-from api.utils.cache import redis_cached
+from api.settings import settings
+from api.utils.cache import get_cached_many, redis_cached, set_cached_many
+from api.utils.concurrency import gather_limited
 
 
 @redis_cached("user", "user_id")
@@ -40,11 +42,29 @@ async def get_user_id_by_email(email: str) -> str | None:
         return cast(str, response.json()["id"])
 
 
-@redis_cached("user", "user_id")
-async def get_userinfo(user_id: str) -> UserInfo | None:
+async def _fetch_userinfo(user_id: str) -> UserInfo | None:
     async with InternalService.AUTH.client as client:
         response = await client.get(f"/users/{user_id}")
         if response.status_code != 200:
             return None
 
         return UserInfo(**response.json())
+
+
+@redis_cached("user", "user_id", local_size=1024, lock=True, early_refresh=1, stale_ttl=settings.cache_stale_ttl)
+async def get_userinfo(user_id: str) -> UserInfo | None:
+    return await _fetch_userinfo(user_id)
+
+
+async def get_userinfos(user_ids: Iterable[str]) -> dict[str, UserInfo | None]:
+    """Resolve multiple users at once, fetching only those that are not cached yet."""
+
+    ids = [*dict.fromkeys(user_ids)]
+    cached, generation = await get_cached_many(get_userinfo, [(i,) for i in ids])
+    result: dict[str, UserInfo | None] = {user_id: info for (user_id,), info in cached.items()}
+    if not (missing := [user_id for user_id in ids if user_id not in result]):
+        return result
+
+    fetched = dict(zip(missing, await gather_limited(*[_fetch_userinfo(user_id) for user_id in missing])))
+    await set_cached_many(get_userinfo, {(user_id,): info for user_id, info in fetched.items()}, generation)
+    return result | fetched
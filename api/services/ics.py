@@ -1,6 +1,5 @@
-from typing import cast
-
-import icalendar
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, cast
 
 from api.schemas.calendar import Coaching, EventType, Webinar
 from api.services.skills import get_skills
@@ -8,35 +7,97 @@ from api.settings import settings
 from api.utils.utc import utcfromtimestamp
 
 
-async def create_ics(events: list[Webinar | Coaching]) -> bytes:
-    cal = icalendar.Calendar()
+# number of events that are rendered and sent at once
+CHUNK_SIZE = 100
 
-    skill_names: dict[str, str] = {skill.id: skill.name for skill in await get_skills()}
-    for e in events:
-        event = icalendar.Event()
-        skill = skill_names.get(e.skill_id) if e.skill_id else None
-        if e.type == EventType.WEBINAR:
-            summary = f"Webinar: {e.title} ({skill})" if skill else f"Webinar: {e.title}"
-            description = e.description
-        elif e.type == EventType.COACHING:
-            summary = f"Coaching: {skill}" if skill else "Coaching"
-            description = f"Instructor: {e.instructor} (Rating: {e.instructor_rating})"
-            if not e.booked:
-                summary = f"Empty Slot ({summary})"
-            else:
-                description += f"\nStudent: {cast(Coaching, e).student}"
-        else:
-            continue
-        event.add("summary", summary)
-        event.add("description", description)
-        event.add("dtstart", utcfromtimestamp(e.start))
-        event.add("dtend", utcfromtimestamp(e.start + e.duration * 60))
-        if e.admin_link:
-            event.add("location", e.admin_link)
-        elif e.link:
-            event.add("location", e.link)
+# maximum number of octets of a content line, excluding the line break (RFC 5545, section 3.1)
+MAX_LINE_OCTETS = 75
+
+
+def _escape(text: str) -> str:
+    """Escape a TEXT value (RFC 5545, section 3.3.11)."""
+
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\r", "\\n")
+        .replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Fold a content line so that no line exceeds 75 octets without splitting multi-byte characters."""
+
+    # continuation lines start with a space, so every chunk may only have 74 octets
+    limit = MAX_LINE_OCTETS - 1
+    chunks = []
+    if line.isascii():
+        for start in range(0, len(line), limit):
+            end = start + limit
+            chunks.append(line[start:end])
+    else:
+        size, start = 0, 0
+        for i, char in enumerate(line):
+            if size + (n := len(char.encode())) > limit:
+                chunks.append(line[start:i])
+                size, start = 0, i
+            size += n
+        chunks.append(line[start:])
+    return "\r\n ".join(chunks) + "\r\n"
+
+
+def _format_value(value: str | datetime) -> str:
+    if isinstance(value, datetime):
+        return value.strftime("%Y%m%dT%H%M%SZ")
+    return _escape(value)
+
+
+def _vevent(properties: list[tuple[str, str | datetime | None]]) -> str:
+    """Serialize an event with the given properties. Datetimes are expected to be in UTC, None values are omitted."""
+
+    lines = "".join(_fold(f"{name}:{_format_value(value)}") for name, value in properties if value is not None)
+    return f"BEGIN:VEVENT\r\n{lines}END:VEVENT\r\n"
+
+
+def _render_event(e: Webinar | Coaching, skill: str | None) -> str:
+    if e.type == EventType.WEBINAR:
+        summary = f"Webinar: {e.title} ({skill})" if skill else f"Webinar: {e.title}"
+        description = e.description
+    elif e.type == EventType.COACHING:
+        summary = f"Coaching: {skill}" if skill else "Coaching"
+        description = f"Instructor: {e.instructor} (Rating: {e.instructor_rating})"
+        if not e.booked:
+            summary = f"Empty Slot ({summary})"
         else:
-            event.add("location", settings.event_url.format(id=e.id))
-        cal.add_component(event)
+            description += f"\nStudent: {cast(Coaching, e).student}"
+    else:
+        return ""
+
+    return _vevent(
+        [
+            ("SUMMARY", summary),
+            ("DTSTART", utcfromtimestamp(e.start)),
+            ("DTEND", utcfromtimestamp(e.start + e.duration * 60)),
+            ("DESCRIPTION", description),
+            ("LOCATION", e.admin_link or e.link or settings.event_url.format(id=e.id)),
+        ]
+    )
+
+
+async def stream_ics(events: AsyncIterable[Webinar | Coaching]) -> AsyncIterator[bytes]:
+    """Serialize events as an ics calendar chunk by chunk while they are produced."""
+
+    skill_names: dict[str, str] = {skill.id: skill.name for skill in await get_skills()}
 
-    return cast(bytes, cal.to_ical())
+    yield b"BEGIN:VCALENDAR\r\n"
+    chunk = []
+    async for e in events:
+        chunk.append(_render_event(e, skill_names.get(e.skill_id) if e.skill_id else None))
+        if len(chunk) == CHUNK_SIZE:
+            yield "".join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield "".join(chunk).encode()
+    yield b"END:VCALENDAR\r\n"
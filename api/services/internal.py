@@ -1,7 +1,12 @@
+import asyncio
+import time
+from contextlib import nullcontext
 from datetime import timedelta
 from enum import Enum
+from importlib.util import find_spec
+from typing import Any, AsyncContextManager
 
-from httpx import AsyncClient, Response
+from httpx import AsyncClient, AsyncHTTPTransport, Limits, Request, Response
 
 from api.logger import get_logger
 from api.settings import settings
@@ -10,18 +15,53 @@ from api.utils.jwt import encode_jwt
 
 logger = get_logger(__name__)
 
+# use http/2 if the optional h2 package is installed
+HTTP2 = find_spec("h2") is not None
+
+# internal jwts are reused until this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 2
+
+_clients: dict[str, AsyncClient] = {}
+_tokens: dict[str, tuple[str, float]] = {}
+
 
 class InternalServiceError(Exception):
     pass
 
 
+class _LimitedTransport(AsyncHTTPTransport):
+    """
+    Transport that sends at most `settings.internal_concurrency` requests at once.
+
+    Each service has a single shared client and thus a single transport, so the limit applies to all requests of this
+    worker to the service, no matter how many requests or tasks make them concurrently.
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.semaphore = asyncio.Semaphore(settings.internal_concurrency)
+
+    async def handle_async_request(self, request: Request) -> Response:
+        async with self.semaphore:
+            return await super().handle_async_request(request)
+
+
 class InternalService(Enum):
     AUTH = settings.auth_url
     SKILLS = settings.skills_url
     SHOP = settings.shop_url
 
     def _get_token(self) -> str:
-        return encode_jwt({"aud": self.name.lower()}, timedelta(seconds=settings.internal_jwt_ttl))
+        token, valid_until = _tokens.get(self.name, ("", 0))
+        if time.monotonic() < valid_until:
+            return token
+
+        token = encode_jwt({"aud": self.name.lower()}, timedelta(seconds=settings.internal_jwt_ttl))
+        _tokens[self.name] = token, time.monotonic() + settings.internal_jwt_ttl - TOKEN_REFRESH_MARGIN
+        return token
+
+    async def _authorize(self, request: Request) -> None:
+        request.headers["Authorization"] = self._get_token()
 
     @classmethod
     async def _handle_error(cls, response: Response) -> None:
@@ -29,10 +69,44 @@ class InternalService(Enum):
             await response.aread()
             raise InternalServiceError(response, response.text)
 
-    @property
-    def client(self) -> AsyncClient:
+    def _create_client(self) -> AsyncClient:
         return AsyncClient(
             base_url=self.value.rstrip("/") + "/_internal",
-            headers={"Authorization": self._get_token()},
-            event_hooks={"response": [self._handle_error]},
+            transport=_LimitedTransport(
+                http2=HTTP2,
+                limits=Limits(
+                    max_connections=settings.internal_max_connections,
+                    max_keepalive_connections=settings.internal_max_connections,
+                ),
+            ),
+            event_hooks={"request": [self._authorize], "response": [self._handle_error]},
         )
+
+    @property
+    def client(self) -> AsyncContextManager[AsyncClient]:
+        """Return the shared client of this service. It is kept open when leaving the context."""
+
+        if (client := _clients.get(self.name)) is None or client.is_closed:
+            client = _clients[self.name] = self._create_client()
+        return nullcontext(client)
+
+
+def idempotency_headers(idempotency_key: str | None) -> dict[str, str]:
+    """Return the headers that allow a service to recognize a retried request."""
+
+    return {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+
+
+def start_clients() -> None:
+    """Create the shared clients of all internal services."""
+
+    for service in InternalService:
+        _clients[service.name] = service._create_client()
+
+
+async def close_clients() -> None:
+    """Close the shared clients of all internal services."""
+
+    for client in [*_clients.values()]:
+        await client.aclose()
+    _clients.clear()
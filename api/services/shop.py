@@ -1,10 +1,14 @@
-from api.services.internal import InternalService
+from api.services.internal import InternalService, idempotency_headers
 
 
-async def add_coins(user_id: str, coins: int, description: str, credit_note: bool) -> bool:
+async def add_coins(
+    user_id: str, coins: int, description: str, credit_note: bool, idempotency_key: str | None = None
+) -> bool:
     async with InternalService.SHOP.client as client:
         response = await client.post(
-            f"/coins/{user_id}", json={"coins": coins, "description": description, "credit_note": credit_note}
+            f"/coins/{user_id}",
+            json={"coins": coins, "description": description, "credit_note": credit_note},
+            headers=idempotency_headers(idempotency_key),
         )
         return response.status_code == 200
 
@@ -2,7 +2,8 @@ from typing import cast
 
 from pydantic import BaseModel, Extra
 
-from api.services.internal import InternalService
+from api.services.internal import InternalService, idempotency_headers
+from api.settings import settings
 from api.utils.cache import redis_cached
 
 
@@ -14,7 +15,7 @@ class Skill(BaseModel):
         extra = Extra.ignore
 
 
-@redis_cached("skills")
+@redis_cached("skills", local_size=1, lock=True, early_refresh=1, stale_ttl=settings.cache_stale_ttl)
 async def get_skills() -> list[Skill]:
     async with InternalService.SKILLS.client as client:
         response = await client.get("/skills")
@@ -25,7 +26,7 @@ async def get_skill(skill: str) -> Skill | None:
     return next(iter(s for s in await get_skills() if s.id == skill), None)
 
 
-@redis_cached("skills", "skill")
+@redis_cached("skills", "skill", local_size=256)
 async def get_skill_dependencies(skill: str) -> set[str] | None:
     async with InternalService.SKILLS.client as client:
         response = await client.get(f"/skills/{skill}/dependencies")
@@ -34,7 +35,7 @@ async def get_skill_dependencies(skill: str) -> set[str] | None:
         return set(response.json())
 
 
-@redis_cached("user_skills", "user_id")
+@redis_cached("user_skills", "user_id", stale_ttl=settings.cache_stale_ttl)
 async def get_skill_levels(user_id: str) -> dict[str, int]:
     async with InternalService.SKILLS.client as client:
         response = await client.get(f"/skills/{user_id}")
@@ -48,6 +49,8 @@ async def get_lecturers(skill_id: str, level: int) -> set[str]:
         return set(response.json())
 
 
-async def add_xp(user_id: str, skill_id: str, xp: int) -> None:
+async def add_xp(user_id: str, skill_id: str, xp: int, idempotency_key: str | None = None) -> None:
     async with InternalService.SKILLS.client as client:
-        await client.post(f"/skills/{user_id}/{skill_id}", json={"xp": xp})
+        await client.post(
+            f"/skills/{user_id}/{skill_id}", json={"xp": xp}, headers=idempotency_headers(idempotency_key)
+        )
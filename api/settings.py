@@ -15,6 +15,13 @@ class Settings(BaseSettings):
     reload: bool = False
 
     cache_ttl: int = 300
+    # json and msgpack are smaller and readable by other languages, but every hit is slower than with pickle (2-3x for
+    # larger values, see benchmarks/cache.py), so only use them for portability
+    cache_codec: Literal["pickle", "json", "msgpack"] = "pickle"
+    local_cache_ttl: int = 30
+    cache_stale_ttl: int = 3600
+    cache_lock_timeout: int = 10
+    cache_lock_poll_interval: float = 0.05
 
     jwt_secret: str = secrets.token_urlsafe(64)
 
@@ -37,6 +44,7 @@ class Settings(BaseSettings):
     event_fee: float = 0.3
 
     calendar_secret: str = secrets.token_urlsafe(64)
+    calendar_stream_page_size: int = 100
     webinar_registration_url: str = ""
     event_cancel_url: str = ""
 
@@ -45,6 +53,27 @@ class Settings(BaseSettings):
     public_base_url: str = "http://localhost:8000"
 
     internal_jwt_ttl: int = 10
+    internal_concurrency: int = 16
+    internal_max_connections: int = 32
+
+    leader_lease_duration: int = 30  # seconds
+    leader_lease_renewal: int = 10  # seconds
+
+    webinar_cleanup_interval: int = 300  # seconds
+    slot_cleanup_interval: int = 300  # seconds
+    weekly_slot_interval: int = 3600  # seconds
+    deadline_sync_interval: int = 3600  # seconds
+    scheduler_jitter: float = 0.1
+    scheduler_retry_delay: int = 10  # seconds
+    scheduler_max_backoff: int = 3600  # seconds
+    scheduler_shutdown_timeout: int = 30  # seconds
+    scheduler_deadline_poll_interval: float = 5  # seconds
+
+    outbox_interval: int = 5  # seconds
+    outbox_batch_size: int = 100
+    outbox_retry_delay: int = 10  # seconds
+    outbox_max_backoff: int = 3600  # seconds
+    outbox_max_attempts: int = 20
 
     smtp_host: str = ""
     smtp_port: int = 587
@@ -1,19 +1,344 @@
-import base64
+import asyncio
+import hashlib
 import inspect
-import pickle  # noqa: S403
+import json
+import math
+import random
+import struct
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, suppress
+from contextvars import Context, ContextVar
 from functools import wraps
-from typing import Any, Awaitable, Callable, TypeVar, cast
+from types import NoneType
+from typing import Any, Awaitable, Callable, Generic, Iterator, NamedTuple, TypeVar, cast, get_type_hints
+from uuid import uuid4
 
-from api.redis import redis
+from pydantic.json import pydantic_encoder
+
+from .codecs import CODECS, Codec
+from api.logger import get_logger
+from api.redis import cache_redis
 from api.settings import settings
 
 
 T = TypeVar("T")
 
+logger = get_logger(__name__)
+
+# clear_cache publishes the prefix on this channel, so all workers can invalidate their local caches
+INVALIDATION_CHANNEL = "func_cache_clear"
+
+_MISSING = object()
+
+
+class LocalCache:
+    """Bounded in-process cache with a ttl that evicts the least recently used entries."""
+
+    def __init__(self, prefix: str, maxsize: int, ttl: int) -> None:
+        self.prefix = prefix
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.epoch = 0  # incremented on every invalidation
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        """Return the cached value or `_MISSING`."""
+
+        if (entry := self.entries.get(key)) is None or entry[0] <= time.monotonic():
+            self.entries.pop(key, None)
+            self.misses += 1
+            return _MISSING
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any, epoch: int) -> None:
+        """Store a value unless the cache has been invalidated since `epoch`, as the value may be outdated then."""
+
+        if epoch != self.epoch:
+            return
+
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.epoch += 1
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.maxsize}
+
+
+class _Entry(NamedTuple, Generic[T]):
+    value: T
+    delta: float  # seconds it took to compute the value
+    expiry: float  # unix timestamp at which the entry expires in redis
+
+
+# delta and expiry precede the encoded value of each entry
+_HEADER = struct.Struct("!dd")
+
+
+def _encode(entry: _Entry[Any], codec: Codec) -> bytes:
+    return _HEADER.pack(entry.delta, entry.expiry) + codec.encode(entry.value)
+
+
+def _decode(data: bytes, codec: Codec) -> _Entry[Any]:
+    return _Entry(codec.decode(data[_HEADER.size :]), *_HEADER.unpack_from(data))  # noqa: E203
+
+
+def _should_refresh(entry: _Entry[Any], beta: float) -> bool:
+    """
+    Decide whether to recompute an entry before it expires ("XFetch").
+
+    The probability increases the closer the entry gets to its expiry and the longer it took to compute, so usually a
+    single caller recomputes the entry shortly before it expires and all others keep using the cached value.
+    """
+
+    return beta > 0 and time.time() - entry.delta * beta * math.log(1 - random.random()) >= entry.expiry  # noqa: S311
+
+
+class _CachedFunction(NamedTuple):
+    prefix: str
+    build_key: Callable[[tuple[Any, ...], dict[str, Any]], str]
+    ttl: int
+    stale_ttl: int
+    local: LocalCache | None
+    codec: Codec
+    refresh: Callable[[str, _Entry[Any], tuple[Any, ...], dict[str, Any]], None]
+
+
+# all functions decorated with redis_cached
+_cached_functions: dict[Callable[..., Any], _CachedFunction] = {}
+
+# local caches of all functions decorated with redis_cached that use one
+_local_caches: dict[str, LocalCache] = {}
+_invalidation_task: asyncio.Task[None] | None = None
+
+# computations of redis_cached functions that are currently running in this worker by redis key
+_inflight: dict[str, asyncio.Future[Any]] = {}
+
+# results of redis_cached functions in the current request by prefix and key, see `request_memo`
+_memo: ContextVar[dict[tuple[str, str], asyncio.Future[Any]] | None] = ContextVar("memo", default=None)
+
+# namespaces cleared in the current database transaction, see `defer_clear_cache`
+_deferred: ContextVar[set[str] | None] = ContextVar("deferred", default=None)
+
+
+@contextmanager
+def request_memo() -> Iterator[None]:
+    """
+    Remember the results of all functions decorated with `redis_cached` until the end of the context.
+
+    Repeated calls with the same key neither query redis nor the function again, and concurrent calls with the same key
+    wait for the same result. The results are shared between all callers and must not be modified.
+    """
+
+    token = _memo.set({})
+    try:
+        yield
+    finally:
+        _memo.reset(token)
+
+
+@contextmanager
+def defer_clear_cache(prefixes: set[str]) -> Iterator[None]:
+    """
+    Collect the namespaces passed to `clear_cache` in `prefixes` instead of invalidating them right away.
+
+    This allows invalidating them only after the changes that caused the invalidation have been committed. Otherwise
+    concurrent requests could store results computed from the old data in the new generation.
+    """
+
+    token = _deferred.set(prefixes)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+
+
+async def _memoized(prefix: str, key: str, func: Callable[[], Awaitable[T]]) -> T:
+    if (memo := _memo.get()) is None:
+        return await func()
+
+    if (future := memo.get((prefix, key))) is None:
+        future = memo[(prefix, key)] = asyncio.ensure_future(func())
+    try:
+        return cast(T, await asyncio.shield(future))
+    except Exception:
+        # failed calls are not remembered
+        if memo.get((prefix, key)) is future:
+            del memo[(prefix, key)]
+        raise
+
+
+async def _run_isolated(func: Callable[[], Awaitable[T]]) -> T:
+    """Run `func` with its own database session, memo and deferred cache invalidations."""
+
+    from api.database import db_context
+
+    async with db_context():
+        return await func()
+
+
+def _start_flight(key: str, func: Callable[[], Awaitable[T]]) -> tuple[asyncio.Future[T], bool]:
+    """
+    Run `func` unless a call with the same key is already running in this worker and return whether it is new.
+
+    The call is shared by all requests that need its result and may outlive the request that started it, so it runs in
+    a fresh context instead of the one of that request.
+    """
+
+    if (future := _inflight.get(key)) is not None:
+        return future, False
+
+    future = _inflight[key] = asyncio.get_running_loop().create_task(_run_isolated(func), context=Context())
+    future.add_done_callback(lambda f: _inflight.pop(key) if _inflight.get(key) is f else None)
+    return future, True
+
+
+async def _single_flight(key: str, func: Callable[[], Awaitable[T]]) -> T:
+    """Run `func` unless a call with the same key is already running in this worker, then wait for that call instead."""
+
+    future, _ = _start_flight(key, func)
+    return await asyncio.shield(future)
+
+
+def _refresh_in_background(key: str, func: Callable[[], Awaitable[Any]]) -> None:
+    """Run `func` without waiting for it unless a call with the same key is already running in this worker."""
+
+    def log_error(future: asyncio.Future[Any]) -> None:
+        if not future.cancelled() and (e := future.exception()):
+            logger.error(f"Could not refresh cache entry {key}", exc_info=e)
+
+    future, started = _start_flight(key, func)
+    if started:
+        future.add_done_callback(log_error)
+
+
+def _lock_key(key: str) -> str:
+    return f"func_cache_lock:{key}"
+
+
+# delete a lock only if it is still held with the given token
+# KEYS[1]: the lock key, ARGV[1]: the token of the holder
+_RELEASE_LOCK = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+async def _wait_for_entry(key: str, codec: Codec) -> _Entry[Any] | None:
+    """Poll redis until another worker has stored an entry or `settings.cache_lock_timeout` has passed."""
+
+    deadline = time.monotonic() + settings.cache_lock_timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(settings.cache_lock_poll_interval)
+        if res := await cache_redis.get(key):
+            return _decode(res, codec)
+    return None
+
+
+def _generation_key(prefix: str) -> str:
+    return f"func_cache_gen:{prefix}"
+
+
+async def get_generation(prefix: str) -> int:
+    """Return the current generation of a cache namespace, which is incremented by every `clear_cache`."""
+
+    return int(await cache_redis.get(_generation_key(prefix)) or 0)
+
+
+def _cache_key(prefix: str, generation: int, key: str) -> str:
+    return f"func_cache:{prefix}:{generation}:{key}"
+
+
+# look up the current generation of a namespace and the entries of the given keys in this generation at once
+# KEYS[1]: the generation key, ARGV[1]: "func_cache:{prefix}:", ARGV[2:]: the keys of the entries
+_GET_ENTRIES = """
+local generation = redis.call("GET", KEYS[1]) or "0"
+local result = {generation}
+for i = 2, #ARGV do
+    result[i] = redis.call("GET", ARGV[1] .. generation .. ":" .. ARGV[i])
+end
+return result
+"""
+
+
+async def _get_entries(prefix: str, keys: list[str]) -> tuple[int, list[bytes | None]]:
+    """Return the current generation of a namespace and the raw entries of the given keys with a single round trip."""
+
+    generation, *values = await cast(
+        Awaitable[list[Any]], cache_redis.eval(_GET_ENTRIES, 1, _generation_key(prefix), f"func_cache:{prefix}:", *keys)
+    )
+    return int(generation), values
+
+
+# types whose repr is the same in all processes
+_SCALARS = {str, int, float, bool, NoneType}
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    return pydantic_encoder(value)
+
+
+def _hash_key(values: list[Any]) -> str:
+    """Return a hash of the given values which is the same in all processes."""
+
+    if all(type(v) in _SCALARS for v in values):
+        data = repr(values)
+    else:
+        data = json.dumps(values, default=_canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+def _return_type(func: Callable[..., Any]) -> Any:
+    try:
+        return get_type_hints(func).get("return", Any)
+    except NameError:
+        return Any
+
 
 def redis_cached(
-    prefix: str, *key: str, ttl: int = settings.cache_ttl
+    prefix: str,
+    *key: str,
+    ttl: int = settings.cache_ttl,
+    local_size: int = 0,
+    local_ttl: int | None = None,
+    lock: bool = False,
+    early_refresh: float = 0,
+    codec: type[Codec] | None = None,
+    stale_ttl: int = 0,
 ) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """
+    Cache the results of an async function in redis.
+
+    Concurrent misses of the same key in one worker always share a single call of the function.
+
+    :param prefix: the namespace of the cache, which can be invalidated using `clear_cache`
+    :param key: the names of the parameters that identify a result
+    :param ttl: the number of seconds a result is cached in redis
+    :param local_size: if positive, also keep up to this many results in memory of the current worker
+    :param local_ttl: the number of seconds a result is kept in memory (default: `settings.local_cache_ttl`)
+    :param lock: if set, only one worker calls the function on a miss while all others wait for its result
+    :param early_refresh: if positive, results are recomputed shortly before they expire, the more likely the higher
+                          this value is (1 is a good default)
+    :param codec: the serialization of the results (default: `settings.cache_codec`)
+    :param stale_ttl: if positive, results are kept this many seconds longer than `ttl`, during which they are
+                      returned immediately while they are refreshed in the background ("stale-while-revalidate")
+    """
+
     def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
         if settings.cache_ttl <= 0:
             return func
@@ -26,26 +351,228 @@ def redis_cached(
                     param_indices[param.name] = pos_cnt
                 pos_cnt += 1
 
+        ident = f"{func.__module__}:{func.__name__}"
+        codec_ = (codec or CODECS[settings.cache_codec])(_return_type(func))
+        local: LocalCache | None = None
+        if local_size > 0:
+            local = _local_caches[ident] = LocalCache(
+                prefix, local_size, settings.local_cache_ttl if local_ttl is None else local_ttl
+            )
+
+        def build_key(args: tuple[Any, ...], kwargs: dict[str, Any]) -> str:
+            return f"{ident}:" + _hash_key(
+                [args[i] if 0 <= (i := param_indices.get(arg, -1)) < len(args) else kwargs[arg] for arg in key]
+            )
+
+        async def compute(k: str, cached: _Entry[T] | None, args: tuple[Any, ...], kwargs: dict[str, Any]) -> T:
+            token = None
+            if lock:
+                token = str(uuid4())
+                if not await cache_redis.set(_lock_key(k), token, nx=True, px=settings.cache_lock_timeout * 1000):
+                    # another worker is already computing the result
+                    if cached is not None:
+                        return cached.value
+                    if (entry := await _wait_for_entry(k, codec_)) is not None:
+                        return cast(T, entry.value)
+                    token = None  # the other worker took too long, so compute the result anyway
+
+            try:
+                start = time.perf_counter()
+                result = await func(*args, **kwargs)
+                entry = _Entry(result, time.perf_counter() - start, time.time() + ttl)
+                await cache_redis.setex(k, ttl + stale_ttl, _encode(entry, codec_))
+                return result
+            finally:
+                if token is not None:
+                    await cast(Awaitable[int], cache_redis.eval(_RELEASE_LOCK, 1, _lock_key(k), token))
+
+        def refresh(k: str, entry: _Entry[T], args: tuple[Any, ...], kwargs: dict[str, Any]) -> None:
+            _refresh_in_background(k, lambda: compute(k, entry, args, kwargs))
+
+        async def lookup(key: str, args: tuple[Any, ...], kwargs: dict[str, Any]) -> T:
+            if local is not None:
+                if (value := local.get(key)) is not _MISSING:
+                    return cast(T, value)
+                epoch = local.epoch
+
+            generation, [res] = await _get_entries(prefix, [key])
+            k = _cache_key(prefix, generation, key)
+            entry = _decode(res, codec_) if res else None
+            if entry is not None and stale_ttl and entry.expiry <= time.time():
+                # the stale value is not stored locally, so the refreshed value is used as soon as it is available
+                refresh(k, entry, args, kwargs)
+                return cast(T, entry.value)
+
+            if entry is not None and not _should_refresh(entry, early_refresh):
+                result = cast(T, entry.value)
+            else:
+                result = await _single_flight(k, lambda: compute(k, entry, args, kwargs))
+
+            if local is not None:
+                local.set(key, result, epoch)
+            return result
+
         @wraps(func)
         async def wrapper(*args: Any, **kwargs: Any) -> T:
-            ident = f"{func.__module__}:{func.__name__}"
-            k = f"func_cache:{prefix}:{ident}:" + base64.b64encode(
-                pickle.dumps(
-                    [args[i] if 0 <= (i := param_indices.get(arg, -1)) < len(args) else kwargs[arg] for arg in key]
-                )
-            ).decode().rstrip("=")
-            if res := await redis.get(k):
-                return cast(T, pickle.loads(base64.b64decode(res.encode())))  # noqa: S301
-
-            result = await func(*args, **kwargs)
-            await redis.setex(k, ttl, base64.b64encode(pickle.dumps(result)))
-            return result
+            key = build_key(args, kwargs)
+            return await _memoized(prefix, key, lambda: lookup(key, args, kwargs))
 
+        _cached_functions[wrapper] = _CachedFunction(prefix, build_key, ttl, stale_ttl, local, codec_, refresh)
         return wrapper
 
     return decorator
 
 
+def _resolve(
+    func: Callable[..., Any], calls: list[tuple[Any, ...]]
+) -> tuple[Callable[..., Any], list[tuple[Any, ...]]]:
+    if inspect.ismethod(func):
+        return func.__func__, [(func.__self__, *args) for args in calls]
+    return func, calls
+
+
+async def get_cached_many(
+    func: Callable[..., Awaitable[T]], calls: list[tuple[Any, ...]]
+) -> tuple[dict[tuple[Any, ...], T], int | None]:
+    """
+    Look up the cached results of a function decorated with `redis_cached` for multiple calls at once.
+
+    :param func: the decorated function
+    :param calls: the positional arguments of each call
+    :return: the cached results of all calls that are currently cached, and the generation of the namespace at the
+        time of the lookup (None if redis has not been queried), which should be passed to `set_cached_many`
+    """
+
+    raw, full_calls = _resolve(func, calls)
+    if not calls or not (cached := _cached_functions.get(raw)):
+        return {}, None
+
+    full = dict(zip(calls, full_calls))
+    keys = {args: cached.build_key(full_args, {}) for args, full_args in full.items()}
+    result: dict[tuple[Any, ...], T] = {}
+    if cached.local is not None:
+        for args, key in keys.items():
+            if (value := cached.local.get(key)) is not _MISSING:
+                result[args] = value
+        if not (keys := {args: key for args, key in keys.items() if args not in result}):
+            return result, None
+        epoch = cached.local.epoch
+
+    now = time.time()
+    generation, values = await _get_entries(cached.prefix, [*keys.values()])
+    for (args, key), res in zip(keys.items(), values):
+        if not res:
+            continue
+
+        entry = _decode(res, cached.codec)
+        result[args] = cast(T, entry.value)
+        if cached.stale_ttl and entry.expiry <= now:
+            cached.refresh(_cache_key(cached.prefix, generation, key), entry, full[args], {})
+        elif cached.local is not None:
+            cached.local.set(key, result[args], epoch)
+    return result, generation
+
+
+async def set_cached_many(
+    func: Callable[..., Awaitable[T]], results: dict[tuple[Any, ...], T], generation: int | None = None
+) -> None:
+    """
+    Store results of a function decorated with `redis_cached` for multiple calls at once.
+
+    :param func: the decorated function
+    :param results: mapping from the positional arguments of each call to its result
+    :param generation: the generation returned by `get_cached_many` before the results were computed, so results that
+        have been invalidated in the meantime are not stored in the new generation (default: the current generation)
+    """
+
+    raw, full_calls = _resolve(func, [*results])
+    if not results or not (cached := _cached_functions.get(raw)):
+        return
+
+    epoch = cached.local.epoch if cached.local is not None else 0
+    now = time.time()
+    if generation is None:
+        generation = await get_generation(cached.prefix)
+    async with cache_redis.pipeline(transaction=False) as pipe:
+        for args, result in zip(full_calls, results.values()):
+            key = cached.build_key(args, {})
+            pipe.setex(
+                _cache_key(cached.prefix, generation, key),
+                cached.ttl + cached.stale_ttl,
+                _encode(_Entry(result, 0, now + cached.ttl), cached.codec),
+            )
+            if cached.local is not None:
+                cached.local.set(key, result, epoch)
+        await pipe.execute()
+
+
 async def clear_cache(prefix: str) -> None:
-    if keys := await redis.keys(f"func_cache:{prefix}:*"):
-        await redis.delete(*keys)
+    """
+    Invalidate all cached results of a namespace.
+
+    Instead of deleting the entries, the generation of the namespace is incremented, so all existing entries become
+    unreachable and simply expire after their ttl.
+
+    Within a database context, the namespace is only invalidated after the commit (see `defer_clear_cache`).
+    """
+
+    if (memo := _memo.get()) is not None:
+        for k in [k for k in memo if k[0] == prefix]:
+            del memo[k]
+
+    if (deferred := _deferred.get()) is not None:
+        deferred.add(prefix)
+        return
+
+    await cache_redis.incr(_generation_key(prefix))
+
+    if _clear_local_caches(prefix):
+        await cache_redis.publish(INVALIDATION_CHANNEL, prefix)
+
+
+def _clear_local_caches(prefix: str | None = None) -> bool:
+    """Clear the local caches of a namespace (or all local caches) and return whether any have been found."""
+
+    caches = [c for c in _local_caches.values() if prefix is None or c.prefix == prefix]
+    for c in caches:
+        c.clear()
+    return bool(caches)
+
+
+def local_cache_stats() -> dict[str, dict[str, int]]:
+    """Return the hits, misses and sizes of all local caches of this worker."""
+
+    return {ident: c.stats for ident, c in _local_caches.items()}
+
+
+async def _listen_for_invalidations() -> None:
+    while True:
+        try:
+            async with cache_redis.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                _clear_local_caches()  # invalidations may have been missed while not subscribed
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        _clear_local_caches(message["data"].decode())
+        except Exception as e:
+            logger.exception(e)
+            await asyncio.sleep(1)
+
+
+def start_cache_invalidation() -> None:
+    """Start invalidating the local caches of this worker when other workers clear a cache namespace."""
+
+    global _invalidation_task
+
+    if _local_caches and _invalidation_task is None:
+        _invalidation_task = asyncio.create_task(_listen_for_invalidations())
+
+
+async def stop_cache_invalidation() -> None:
+    global _invalidation_task
+
+    if _invalidation_task is not None:
+        _invalidation_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _invalidation_task
+        _invalidation_task = None
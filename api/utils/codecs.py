@@ -0,0 +1,126 @@
+"""Serialization of cached values."""
+
+import json
+import pickle  # noqa: S403
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from enum import Enum
+from inspect import isclass
+from types import NoneType, UnionType
+from typing import Any, Callable, Union, get_args, get_origin, get_type_hints
+
+from pydantic import BaseModel, parse_obj_as
+from pydantic.json import pydantic_encoder
+
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Codec(ABC):
+    """Converts values of a given type to bytes and back."""
+
+    def __init__(self, type_: Any) -> None:
+        self.type = type_
+
+    @abstractmethod
+    def encode(self, value: Any) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Any:
+        pass
+
+
+class PickleCodec(Codec):
+    """Supports arbitrary python objects, but only python can read the data."""
+
+    def encode(self, value: Any) -> bytes:
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data: bytes) -> Any:
+        return pickle.loads(data)  # noqa: S301
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _converter(type_: Any) -> Callable[[Any], Any]:
+    """
+    Return a function that restores a value of the given type from plain data.
+
+    The data has been written by the api itself, so pydantic models are constructed without validation.
+    """
+
+    origin, args = get_origin(type_), get_args(type_)
+    if type_ in (Any, str, int, float, bool, NoneType):
+        return _identity
+
+    if origin in (Union, UnionType) and len(options := [a for a in args if a is not NoneType]) == 1:
+        option = _converter(options[0])
+        return lambda value: None if value is None else option(value)
+
+    if origin in (list, set, frozenset) and args:
+        item = _converter(args[0])
+        return lambda value: origin(map(item, value))
+
+    if origin is tuple and args and args[-1] is not Ellipsis:
+        items = [*map(_converter, args)]
+        return lambda value: tuple(convert(v) for convert, v in zip(items, value))
+
+    if origin is dict and args:
+        # json turns all keys into strings
+        key = args[0] if args[0] in (int, float) else _converter(args[0])
+        val = _converter(args[1])
+        return lambda value: {key(k): val(v) for k, v in value.items()}
+
+    if isclass(type_) and issubclass(type_, BaseModel):
+        hints = get_type_hints(type_)
+        fields = {name: _converter(hints[name]) for name in type_.__fields__}
+        return lambda value: type_.construct(**{name: fields[name](v) for name, v in value.items() if name in fields})
+
+    if isclass(type_) and issubclass(type_, Enum):
+        return type_
+
+    if type_ is datetime:
+        return datetime.fromisoformat
+
+    if type_ is date:
+        return date.fromisoformat
+
+    return lambda value: parse_obj_as(type_, value)
+
+
+class JsonCodec(Codec):
+    """Supports plain data and pydantic models. Restoring their types makes decoding slower than with `PickleCodec`."""
+
+    def __init__(self, type_: Any) -> None:
+        super().__init__(type_)
+        self._convert = _converter(type_)
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value, default=pydantic_encoder, separators=(",", ":")).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return self._convert(json.loads(data))
+
+
+class MsgpackCodec(JsonCodec):
+    """Like `JsonCodec`, but more compact. Requires the msgpack extra."""
+
+    def __init__(self, type_: Any) -> None:
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        super().__init__(type_)
+
+    def encode(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=pydantic_encoder)  # type: ignore
+
+    def decode(self, data: bytes) -> Any:
+        return self._convert(msgpack.unpackb(data, strict_map_key=False))
+
+
+CODECS: dict[str, type[Codec]] = {"pickle": PickleCodec, "json": JsonCodec, "msgpack": MsgpackCodec}
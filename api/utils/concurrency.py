@@ -0,0 +1,24 @@
+import asyncio
+from typing import Awaitable, TypeVar
+
+from ..settings import settings
+
+
+T = TypeVar("T")
+
+
+async def gather_limited(*aws: Awaitable[T], limit: int | None = None) -> list[T]:
+    """
+    Like asyncio.gather, but run at most `limit` (default: `settings.internal_concurrency`) awaitables at once.
+
+    This only limits the fan-out of a single call. Requests to internal services are additionally limited per service
+    across all calls by the transport of their shared client.
+    """
+
+    semaphore = asyncio.Semaphore(limit or settings.internal_concurrency)
+
+    async def run(aw: Awaitable[T]) -> T:
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*map(run, aws))
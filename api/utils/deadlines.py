@@ -0,0 +1,46 @@
+"""Deadlines of events in a redis sorted set, so expired events can be processed right when they end."""
+
+from datetime import datetime
+from typing import cast
+
+from api.redis import redis
+
+
+# maximum number of deadlines that are scheduled or returned at once
+BATCH_SIZE = 1000
+
+
+class Deadlines:
+    """
+    A set of ids with a deadline each, shared by all workers.
+
+    The database remains the source of truth: consumers should check the entries they get from `due` against the
+    database, and `schedule` may be called for events that are never committed.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.key = f"deadlines:{name}"
+
+    async def schedule(self, deadlines: dict[str, datetime]) -> None:
+        """Set the deadlines of the given ids, replacing existing deadlines of the same ids."""
+
+        items = [(id_, deadline.timestamp()) for id_, deadline in deadlines.items()]
+        for start in range(0, len(items), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            await redis.zadd(self.key, dict(items[start:end]))
+
+    async def cancel(self, *ids: str) -> None:
+        if ids:
+            await redis.zrem(self.key, *ids)
+
+    async def next_deadline(self) -> float | None:
+        """Return the earliest deadline as a unix timestamp."""
+
+        if not (first := await redis.zrange(self.key, 0, 0, withscores=True)):
+            return None
+        return cast(float, first[0][1])
+
+    async def due(self, now: datetime, limit: int = BATCH_SIZE) -> list[str]:
+        """Return up to `limit` ids whose deadline is not after `now`, starting with the earliest one."""
+
+        return cast(list[str], await redis.zrangebyscore(self.key, "-inf", now.timestamp(), start=0, num=limit))
@@ -0,0 +1,129 @@
+"""Leader election between all workers and replicas based on a lease in redis."""
+
+import asyncio
+from contextlib import suppress
+from typing import Any, Awaitable, cast
+
+from api.logger import get_logger
+from api.redis import redis
+from api.settings import settings
+
+
+logger = get_logger(__name__)
+
+# KEYS[1]: the lease, ARGV[1]: the token of the holder, ARGV[2]: the new duration of the lease in milliseconds
+_RENEW = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS[1]: the lease, ARGV[1]: the token of the holder
+_RELEASE = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLease:
+    """
+    A named lease in redis that is held by at most one worker at a time.
+
+    Every successful acquisition gets a new token from a counter that only ever increases. The lease stores the
+    token of its holder, so a worker that has lost the lease (e.g. because it could not renew it in time) notices that
+    it is no longer the leader as soon as it verifies, renews or releases the lease, and never extends or deletes the
+    lease of another worker.
+
+    The lease does not fence off writes of a former leader that are already in progress when it loses the lease, so the
+    jobs it guards have to be safe to run concurrently for a short time.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.token: int | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def _key(self) -> str:
+        return f"leader:{self.name}"
+
+    @property
+    def _token_key(self) -> str:
+        return f"leader_token:{self.name}"
+
+    @property
+    def is_leader(self) -> bool:
+        """Return whether this worker held the lease when it was last acquired, renewed or verified."""
+
+        return self.token is not None
+
+    async def acquire(self) -> bool:
+        """Try to acquire the lease and return whether this worker is the leader now."""
+
+        if self.is_leader:
+            return await self.renew()
+
+        token = await redis.incr(self._token_key)
+        if await redis.set(self._key, token, nx=True, px=settings.leader_lease_duration * 1000):
+            logger.info(f"Acquired lease {self.name} with token {token}")
+            self.token = token
+        return self.is_leader
+
+    def _lost(self) -> None:
+        logger.warning(f"Lost lease {self.name} with token {self.token}")
+        self.token = None
+
+    async def _run(self, script: str, *args: Any) -> bool:
+        """Run a script that only touches the lease if it still holds the token of this worker."""
+
+        return bool(await cast(Awaitable[int], redis.eval(script, 1, self._key, str(self.token), *args)))
+
+    async def verify(self) -> bool:
+        """Check that the lease is still held by this worker."""
+
+        if self.token is not None and await redis.get(self._key) != str(self.token):
+            self._lost()
+        return self.is_leader
+
+    async def renew(self) -> bool:
+        """Extend the lease if it is still held by this worker."""
+
+        if self.token is not None and not await self._run(_RENEW, settings.leader_lease_duration * 1000):
+            self._lost()
+        return self.is_leader
+
+    async def release(self) -> None:
+        """Give up the lease if it is held by this worker."""
+
+        if self.token is not None and await self._run(_RELEASE):
+            logger.info(f"Released lease {self.name} with token {self.token}")
+        self.token = None
+
+    async def _maintain(self) -> None:
+        while True:
+            try:
+                await self.acquire()
+            except Exception as e:
+                # step down, as the lease may expire without this worker noticing
+                logger.exception(e)
+                self.token = None
+            await asyncio.sleep(settings.leader_lease_renewal)
+
+    def start(self) -> None:
+        """Keep trying to acquire the lease in the background and renew it while it is held."""
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def stop(self) -> None:
+        """Stop renewing the lease and release it."""
+
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.release()
@@ -0,0 +1,215 @@
+"""Scheduler for periodic background jobs."""
+
+import asyncio
+import random
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable
+
+from .leader import LeaderLease
+from ..logger import get_logger
+from ..settings import settings
+
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class JobStats:
+    runs: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    skipped: int = 0  # runs skipped because this worker did not hold the lease of the job
+    last_duration: float | None = None  # seconds
+    max_duration: float = 0
+    total_duration: float = 0
+
+    @property
+    def average_duration(self) -> float | None:
+        return self.total_duration / self.runs if self.runs else None
+
+    @property
+    def serialize(self) -> dict[str, Any]:
+        return asdict(self) | {"average_duration": self.average_duration}
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], Awaitable[None]]
+    interval: float  # seconds between the end of a run and the start of the next one
+    jitter: float  # maximum random deviation from the delay as a fraction of the delay
+    retry_delay: float  # seconds before the first retry after a failure, doubled on every consecutive failure
+    max_backoff: float  # maximum number of seconds before a retry
+    lease: LeaderLease | None  # if set, the job only runs on the worker that holds this lease
+    deadline: Callable[[], Awaitable[float | None]] | None = None  # returns when the job should run next
+    stats: JobStats = field(default_factory=JobStats)
+
+    def next_delay(self) -> float:
+        if failures := self.stats.consecutive_failures:
+            delay = min(self.retry_delay * 2.0 ** (failures - 1), self.max_backoff)
+        else:
+            delay = self.interval
+        return max(0, delay * (1 + random.uniform(-self.jitter, self.jitter)))  # noqa: S311
+
+    async def time_until_deadline(self) -> float | None:
+        """Return the number of seconds until the next deadline of the job, if it has any."""
+
+        if not self.deadline:
+            return None
+        try:
+            deadline = await self.deadline()
+        except Exception as e:
+            logger.exception(e)
+            return None
+        return None if deadline is None else max(0, deadline - time.time())
+
+    async def run(self) -> bool:
+        """Run the job once and return whether it has actually been run."""
+
+        try:
+            if self.lease and not (await self.lease.verify() or await self.lease.acquire()):
+                self.stats.skipped += 1
+                return False
+        except Exception as e:
+            logger.exception(e)
+            self.stats.skipped += 1
+            return False
+
+        start = time.perf_counter()
+        try:
+            await self.func()
+        except Exception as e:
+            self.stats.failures += 1
+            self.stats.consecutive_failures += 1
+            logger.exception(e)
+        else:
+            self.stats.consecutive_failures = 0
+        finally:
+            duration = time.perf_counter() - start
+            self.stats.runs += 1
+            self.stats.last_duration = duration
+            self.stats.max_duration = max(self.stats.max_duration, duration)
+            self.stats.total_duration += duration
+            logger.debug(f"Job {self.name} finished after {duration:.3f}s")
+        return True
+
+
+# the schedulers that have been started in this worker
+_running: set["Scheduler"] = set()
+
+
+class Scheduler:
+    """Run each job in its own task, so a slow or failing job does not delay the other jobs."""
+
+    def __init__(self) -> None:
+        self.jobs: dict[str, Job] = {}
+        self._tasks: list[asyncio.Task[None]] = []
+        self._stopping = asyncio.Event()
+
+    def add_job(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[None]],
+        interval: float,
+        *,
+        jitter: float | None = None,
+        retry_delay: float | None = None,
+        max_backoff: float | None = None,
+        lease: LeaderLease | None = None,
+        deadline: Callable[[], Awaitable[float | None]] | None = None,
+    ) -> Job:
+        """
+        Register a job that runs immediately after the scheduler has been started and then every `interval` seconds.
+
+        If `deadline` is given, it is called after each successful run and then periodically until the next run, and
+        should return the unix timestamp at which the job has to run next (or None). The job then runs at this time if
+        it is earlier than the interval.
+
+        Settings are used for all optional parameters which are not specified.
+        """
+
+        if name in self.jobs:
+            raise ValueError(f"Job {name} already exists")
+
+        self.jobs[name] = job = Job(
+            name=name,
+            func=func,
+            interval=interval,
+            jitter=settings.scheduler_jitter if jitter is None else jitter,
+            retry_delay=settings.scheduler_retry_delay if retry_delay is None else retry_delay,
+            max_backoff=settings.scheduler_max_backoff if max_backoff is None else max_backoff,
+            lease=lease,
+            deadline=deadline,
+        )
+        return job
+
+    async def _sleep(self, job: Job, delay: float, follow_deadline: bool) -> None:
+        """
+        Wait for `delay` seconds or until the scheduler is stopped.
+
+        If `follow_deadline` is set, the deadline of the job is checked again every
+        `settings.scheduler_deadline_poll_interval` seconds, so deadlines that have been scheduled in the meantime (by
+        any worker) are not missed until the end of the delay.
+        """
+
+        end = time.monotonic() + delay
+        while True:
+            remaining = max(0, end - time.monotonic())
+            if follow_deadline:
+                remaining = min(remaining, settings.scheduler_deadline_poll_interval)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), remaining)
+                return
+            except asyncio.TimeoutError:
+                pass
+            if time.monotonic() >= end:
+                return
+            if follow_deadline and (until_deadline := await job.time_until_deadline()) is not None:
+                end = min(end, time.monotonic() + until_deadline)
+
+    async def _loop(self, job: Job) -> None:
+        while not self._stopping.is_set():
+            ran = await job.run()
+            delay = job.next_delay()
+            # deadlines are ignored after failures and skipped runs, as they could be due already
+            follow_deadline = job.deadline is not None and ran and not job.stats.consecutive_failures
+            if follow_deadline and (until_deadline := await job.time_until_deadline()) is not None:
+                delay = min(delay, until_deadline)
+            await self._sleep(job, delay, follow_deadline)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+
+        self._stopping.clear()
+        _running.add(self)
+        self._tasks = [asyncio.create_task(self._loop(job), name=job.name) for job in self.jobs.values()]
+
+    async def stop(self, timeout: float | None = None) -> None:
+        """
+        Stop scheduling new runs and wait for running jobs to finish.
+
+        Jobs that are still running after `timeout` (default: `settings.scheduler_shutdown_timeout`) seconds are
+        cancelled.
+        """
+
+        if not self._tasks:
+            return
+
+        self._stopping.set()
+        _running.discard(self)
+        tasks, self._tasks = self._tasks, []
+        _, pending = await asyncio.wait(
+            tasks, timeout=settings.scheduler_shutdown_timeout if timeout is None else timeout
+        )
+        for task in pending:
+            logger.warning(f"Cancelling job {task.get_name()} after shutdown timeout")
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def job_stats() -> dict[str, dict[str, Any]]:
+    """Return the statistics of all jobs of the running schedulers of this worker."""
+
+    return {name: job.stats.serialize for scheduler in _running for name, job in scheduler.jobs.items()}
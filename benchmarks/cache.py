@@ -0,0 +1,82 @@
+"""
+Micro-benchmark of the per-hit cost of `redis_cached` without the redis round trip.
+
+Compares building the key and decoding the cached value as done before (pickle + base64 on a text connection) with
+hashed keys and each available codec (raw bytes on a binary connection).
+
+Usage: python -m benchmarks.cache
+"""
+
+import base64
+import pickle  # noqa: S403
+import timeit
+from typing import Any, Callable
+
+from api.schemas.user import UserInfo
+from api.services.skills import Skill
+from api.utils.cache import _decode, _encode, _Entry, _hash_key
+from api.utils.codecs import CODECS, Codec
+
+
+NUMBER = 2000
+
+SAMPLES: list[tuple[str, Any, Any]] = [
+    (
+        "get_userinfo",
+        UserInfo | None,
+        UserInfo(
+            id="4f3f1a4e-5c3b-4d4e-9a3f-0c8f6d2b1e7a",
+            name="instructor",
+            display_name="Well-known Instructor",
+            email="instructor@example.com",
+            avatar_url="https://example.com/avatar.png",
+        ),
+    ),
+    ("get_skills", list[Skill], [Skill(id=f"skill_{i}", name=f"Skill {i}") for i in range(200)]),
+    ("get_skill_levels", dict[str, int], {f"skill_{i}": i % 50 for i in range(200)}),
+]
+
+KEY = ["4f3f1a4e-5c3b-4d4e-9a3f-0c8f6d2b1e7a"]
+
+
+def _measure(func: Callable[[], Any]) -> float:
+    """Return the average duration of a call in microseconds."""
+
+    return min(timeit.repeat(func, number=NUMBER, repeat=5)) / NUMBER * 1e6
+
+
+def _legacy(value: Any) -> tuple[int, float]:
+    data = base64.b64encode(pickle.dumps(value)).decode()
+
+    def hit() -> Any:
+        base64.b64encode(pickle.dumps(KEY)).decode().rstrip("=")
+        return pickle.loads(base64.b64decode(data.encode()))  # noqa: S301
+
+    return len(data), _measure(hit)
+
+
+def _current(codec: Codec, value: Any) -> tuple[int, float]:
+    data = _encode(_Entry(value, 0, 0), codec)
+
+    def hit() -> Any:
+        _hash_key(KEY)
+        return _decode(data, codec)
+
+    return len(data), _measure(hit)
+
+
+def main() -> None:
+    print(f"{'function':<18}{'codec':<16}{'bytes':>8}{'us/hit':>10}")
+    for func, type_, value in SAMPLES:
+        size, duration = _legacy(value)
+        print(f"{func:<18}{'pickle+base64':<16}{size:>8}{duration:>10.1f}")
+        for name, codec in CODECS.items():
+            try:
+                size, duration = _current(codec(type_), value)
+            except RuntimeError:  # codec not available
+                continue
+            print(f"{func:<18}{name:<16}{size:>8}{duration:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
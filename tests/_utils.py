@@ -5,9 +5,11 @@ import sys
 from contextlib import asynccontextmanager
 from functools import partial
 from types import ModuleType
-from typing import AsyncContextManager, AsyncIterator, Callable, TypeVar, cast
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, TypeVar, cast
 from unittest.mock import MagicMock
 
+from api.utils import cache, leader
+
 
 T = TypeVar("T")
 
@@ -61,3 +63,128 @@ def mock_asynccontextmanager(
         exit_callback()
 
     return asynccontextmanager(context_manager), callbacks, assert_calls
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the parts of `redis.asyncio.Redis` used by the api."""
+
+    def __init__(self, decode_responses: bool = True) -> None:
+        self.decode_responses = decode_responses
+        self.data: dict[str, Any] = {}
+        self.ttls: dict[str, float] = {}
+        self.zsets: dict[str, dict[str, float]] = {}
+        self.published: list[tuple[str, str | bytes]] = []
+
+    def _encode(self, value: Any) -> str | bytes:
+        if isinstance(value, bytes):
+            return value.decode() if self.decode_responses else value
+        return str(value) if self.decode_responses else str(value).encode()
+
+    async def get(self, key: str) -> Any:
+        return self.data.get(key)
+
+    async def mget(self, keys: list[str]) -> list[Any]:
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key: str, value: Any, ex: int | None = None, px: int | None = None, nx: bool = False) -> bool:
+        if nx and key in self.data:
+            return False
+        self.data[key] = self._encode(value)
+        if ex is not None:
+            self.ttls[key] = ex
+        if px is not None:
+            self.ttls[key] = px / 1000
+        return True
+
+    async def setex(self, key: str, ttl: int, value: Any) -> bool:
+        return await self.set(key, value, ex=ttl)
+
+    async def incr(self, key: str) -> int:
+        self.data[key] = self._encode(value := int(self.data.get(key, 0)) + 1)
+        return value
+
+    async def pexpire(self, key: str, ttl: int) -> bool:
+        if key not in self.data:
+            return False
+        self.ttls[key] = ttl / 1000
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def zadd(self, key: str, mapping: dict[str, float]) -> int:
+        zset = self.zsets.setdefault(key, {})
+        added = sum(member not in zset for member in mapping)
+        zset.update(mapping)
+        return added
+
+    async def zrem(self, key: str, *members: str) -> int:
+        zset = self.zsets.get(key, {})
+        return sum(zset.pop(member, None) is not None for member in members)
+
+    def _sorted(self, key: str) -> list[tuple[str, float]]:
+        return sorted(self.zsets.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+
+    async def zrange(self, key: str, start: int, end: int, withscores: bool = False) -> list[Any]:
+        items: list[Any] = self._sorted(key)[start : (end + 1) or None]  # noqa: E203
+        return items if withscores else [member for member, _ in items]
+
+    async def zrangebyscore(
+        self, key: str, min: float | str, max: float | str, start: int = 0, num: int | None = None
+    ) -> list[str]:
+        items = [member for member, score in self._sorted(key) if float(min) <= score <= float(max)]
+        return items[start:] if num is None else items[start : start + num]  # noqa: E203
+
+    async def publish(self, channel: str, message: Any) -> int:
+        self.published.append((channel, self._encode(message)))
+        return 0
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args: Any) -> Any:
+        """Run a lua script of the api. There is no lua runtime in the tests, so each script is emulated in python."""
+
+        return await SCRIPTS[script](self, list(keys_and_args[:numkeys]), list(keys_and_args[numkeys:]))
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis) -> None:
+        self.redis = redis
+        self.commands: list[Awaitable[Any]] = []
+
+    async def __aenter__(self) -> "FakePipeline":
+        return self
+
+    async def __aexit__(self, *_: Any) -> None:
+        for command in self.commands:
+            command.close()  # type: ignore
+
+    def __getattr__(self, name: str) -> Callable[..., None]:
+        return lambda *args, **kwargs: self.commands.append(getattr(self.redis, name)(*args, **kwargs))
+
+    async def execute(self) -> list[Any]:
+        commands, self.commands = self.commands, []
+        return [await command for command in commands]
+
+
+async def _get_entries(redis: FakeRedis, keys: list[str], args: list[str]) -> list[Any]:
+    generation = int(redis.data.get(keys[0]) or 0)
+    prefix, *entries = args
+    return [redis._encode(generation), *(redis.data.get(f"{prefix}{generation}:{key}") for key in entries)]
+
+
+async def _renew_lease(redis: FakeRedis, keys: list[str], args: list[str]) -> int:
+    return await redis.pexpire(keys[0], int(args[1])) if redis.data.get(keys[0]) == args[0] else 0
+
+
+async def _release_lock(redis: FakeRedis, keys: list[str], args: list[str]) -> int:
+    return await redis.delete(keys[0]) if redis.data.get(keys[0]) == redis._encode(args[0]) else 0
+
+
+SCRIPTS: dict[str, Callable[[FakeRedis, list[str], list[str]], Awaitable[Any]]] = {
+    cache._GET_ENTRIES: _get_entries,
+    leader._RENEW: _renew_lease,
+    leader._RELEASE: _release_lock,
+    cache._RELEASE_LOCK: _release_lock,
+}
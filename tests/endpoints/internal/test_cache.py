@@ -0,0 +1,9 @@
+from pytest_mock import MockerFixture
+
+from api.endpoints.internal.cache import get_cache_stats
+
+
+async def test__get_cache_stats(mocker: MockerFixture) -> None:
+    local_cache_stats = mocker.patch("api.endpoints.internal.cache.local_cache_stats")
+
+    assert await get_cache_stats() == local_cache_stats.return_value
@@ -0,0 +1,9 @@
+from pytest_mock import MockerFixture
+
+from api.endpoints.internal.jobs import get_job_stats
+
+
+async def test__get_job_stats(mocker: MockerFixture) -> None:
+    job_stats = mocker.patch("api.endpoints.internal.jobs.job_stats")
+
+    assert await get_job_stats() == job_stats.return_value
@@ -0,0 +1,363 @@
+import inspect
+import json
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable
+from unittest.mock import AsyncMock
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from httpx import AsyncClient
+from pytest_mock import MockerFixture
+
+from .._utils import FakeRedis
+from api import models
+from api.database import db, db_context
+from api.endpoints.calendar import (
+    CalendarEntry,
+    _decode_cursor,
+    _encode_cursor,
+    _etag_matches,
+    _ics_etag,
+    _ics_token,
+    _merge_pages,
+    _stream_calendar,
+    get_coachings,
+    get_snapshot,
+    get_webinars,
+    personalize,
+)
+from api.exceptions.calendar import InvalidCursorError
+from api.schemas.calendar import Coaching, EventType, Webinar
+from api.schemas.user import User
+from api.utils import cache
+from api.utils.utc import utcnow
+
+
+def _webinar(start: timedelta, **kwargs: Any) -> Webinar:
+    data: dict[str, Any] = {
+        "id": "w",
+        "type": EventType.WEBINAR,
+        "title": "title",
+        "description": "description",
+        "skill_id": "skill",
+        "start": int((utcnow() + start).timestamp()),
+        "duration": 60,
+        "price": 10,
+        "admin_link": "admin link",
+        "link": "link",
+        "instructor": None,
+        "instructor_rating": None,
+        "booked": False,
+        "bookable": False,
+        "creation_date": 0,
+        "max_participants": 2,
+        "participants": 1,
+    }
+    return Webinar(**data | kwargs)
+
+
+def _coaching(booked: bool) -> Coaching:
+    return Coaching(
+        id="c",
+        type=EventType.COACHING,
+        title=None,
+        description=None,
+        skill_id="skill",
+        start=int((utcnow() + timedelta(days=3)).timestamp()),
+        duration=60,
+        price=10,
+        admin_link="admin link" if booked else None,
+        link="link" if booked else None,
+        instructor=None,
+        instructor_rating=None,
+        booked=booked,
+        bookable=not booked,
+        student=None,
+    )
+
+
+@pytest.mark.parametrize(
+    "user_id,admin,start,booked,bookable,admin_link,link",
+    [
+        ("other", False, timedelta(days=3), False, True, None, None),
+        ("other", True, timedelta(days=3), False, True, "admin link", "link"),
+        ("student", False, timedelta(days=3), True, False, None, None),
+        ("student", False, timedelta(hours=3), True, False, None, "link"),
+        ("teacher", False, timedelta(days=3), True, False, "admin link", "link"),
+        ("other", False, -timedelta(minutes=30), False, False, None, None),
+    ],
+)
+def test__personalize__webinar(
+    user_id: str, admin: bool, start: timedelta, booked: bool, bookable: bool, admin_link: str | None, link: str | None
+) -> None:
+    entry = CalendarEntry(_webinar(start), "teacher", ["student"], utcnow() + start)
+
+    event = personalize(entry, user_id, admin)
+
+    assert event is not None
+    assert (event.booked, event.bookable, event.admin_link, event.link) == (booked, bookable, admin_link, link)
+    assert entry.event.admin_link == "admin link"  # the snapshot itself is not modified
+
+
+def test__personalize__full_and_finished_webinar() -> None:
+    event = personalize(CalendarEntry(_webinar(timedelta(days=3)), "teacher", ["a", "b"], utcnow()), "c", False)
+    assert event is not None
+    assert not event.bookable
+    assert personalize(CalendarEntry(_webinar(-timedelta(hours=2)), "teacher", [], utcnow()), "c", False) is None
+
+
+@pytest.mark.parametrize(
+    "booked,user_id,admin,bookable,link",
+    [
+        (False, "other", False, True, None),
+        (False, "teacher", False, False, None),
+        (True, "other", False, False, None),
+        (True, "other", True, False, "link"),
+        (True, "student", False, False, "link"),
+        (True, "teacher", False, False, "link"),
+    ],
+)
+def test__personalize__coaching(booked: bool, user_id: str, admin: bool, bookable: bool, link: str | None) -> None:
+    entry = CalendarEntry(_coaching(booked), "teacher", ["student"] if booked else [], utcnow())
+
+    event = personalize(entry, user_id, admin)
+
+    assert event is not None
+    assert (event.booked, event.bookable, event.link) == (booked, bookable, link)
+
+
+def _entry(id_: str, minute: int) -> CalendarEntry:
+    return CalendarEntry(_webinar(timedelta(days=1), id=id_), "teacher", [], datetime(2042, 1, 1, 0, minute))
+
+
+def test__merge_pages() -> None:
+    webinars = [_entry("w1", 1), _entry("w2", 3), _entry("w3", 5)]
+    coachings = [_entry("c1", 2), _entry("c1", 2), _entry("c2", 3)]
+
+    entries, _ = _merge_pages([(webinars, None), (coachings, None)], None)
+    assert [e.event.id for e in entries] == ["w1", "c1", "c1", "c2", "w2", "w3"]
+
+    # the coachings of a slot are never split
+    entries, position = _merge_pages([(webinars, None), (coachings, None)], 2)
+    assert [e.event.id for e in entries] == ["w1", "c1", "c1"]
+    assert position == (datetime(2042, 1, 1, 0, 2), "c1")
+
+    # the coaching source might have more rows after c2, so w2 and w3 must wait for the next page
+    entries, position = _merge_pages([(webinars, None), (coachings, (datetime(2042, 1, 1, 0, 3), "c2"))], 10)
+    assert [e.event.id for e in entries] == ["w1", "c1", "c1", "c2"]
+    assert position == (datetime(2042, 1, 1, 0, 3), "c2")
+
+    entries, position = _merge_pages([(webinars, None), (coachings, None)], 10)
+    assert len(entries) == 6
+    assert position is None
+
+
+def test__cursor() -> None:
+    position = (datetime(2042, 1, 1, 13, 37, 0, 123456), "event id")
+
+    assert _decode_cursor(_encode_cursor(position)) == position
+    with pytest.raises(InvalidCursorError):
+        _decode_cursor("invalid")
+
+
+async def test__stream_calendar(mocker: MockerFixture) -> None:
+    mocker.patch("api.endpoints.calendar.settings.calendar_stream_page_size", 2)
+    pages: list[tuple[list[Webinar], str | None]] = [
+        ([_webinar(timedelta(days=1), id="a"), _webinar(timedelta(days=2), id="b")], "next"),
+        ([], "next2"),
+        ([_webinar(timedelta(days=3), id="c")], None),
+    ]
+    get_events = mocker.patch("api.endpoints.calendar.get_events", AsyncMock(side_effect=pages))
+    user = User(id="user", email_verified=True, admin=False)
+
+    lines = [line async for line in _stream_calendar("token", user, ("filter",), "start")]
+
+    assert all(line.endswith("\n") for line in lines)
+    assert json.loads(lines[0]) == {"ics_token": "token"}
+    assert [json.loads(line)["id"] for line in lines[1:]] == ["a", "b", "c"]
+    assert [(c.args, c.kwargs) for c in get_events.call_args_list] == [
+        (("user", False, "filter"), {"cursor": cursor, "limit": 2}) for cursor in ["start", "next", "next2"]
+    ]
+
+
+async def test__download_ics(client: AsyncClient, mocker: MockerFixture) -> None:
+    mocker.patch("api.endpoints.calendar.settings.calendar_stream_page_size", 2)
+    mocker.patch("api.endpoints.calendar._ics_etag", AsyncMock(return_value='"etag"'))
+    mocker.patch("api.endpoints.calendar.is_admin", AsyncMock(return_value=False))
+    mocker.patch("api.services.ics.get_skills", AsyncMock(return_value=[]))
+    pages: list[tuple[list[Webinar], str | None]] = [
+        ([_webinar(timedelta(days=1), id="a"), _webinar(timedelta(days=2), id="b")], "next"),
+        ([_webinar(timedelta(days=3), id="c")], None),
+    ]
+    get_events = mocker.patch("api.endpoints.calendar.get_events", AsyncMock(side_effect=pages))
+
+    response = await client.get(f"/calendar/user_{_ics_token('user')}/academy.ics", params={"booked": True})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"etag"'
+    assert response.text.count("BEGIN:VEVENT") == 3
+    # the events are loaded page by page while the feed is streamed
+    assert [c.kwargs for c in get_events.call_args_list] == [
+        {"cursor": None, "limit": 2},
+        {"cursor": "next", "limit": 2},
+    ]
+    assert all(c.args[:2] == ("user", False) and c.args[-2:] == (True, None) for c in get_events.call_args_list)
+
+
+async def test__ics_etag(mocker: MockerFixture) -> None:
+    get_generation = mocker.patch("api.endpoints.calendar.get_generation", AsyncMock(return_value=1))
+    mocker.patch("api.endpoints.calendar.time.time", return_value=1000)
+    mocker.patch("api.endpoints.calendar.settings.cache_ttl", 300)
+
+    etag = await _ics_etag("user", None, True)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert await _ics_etag("user", None, True) == etag
+    assert await _ics_etag("other", None, True) != etag
+    assert await _ics_etag("user", None, False) != etag
+
+    get_generation.return_value = 2
+    assert await _ics_etag("user", None, True) != etag
+
+
+@pytest.mark.parametrize(
+    "header,matches",
+    [(None, False), ("", False), ('"a"', True), ('"b"', False), ('"b", "a"', True), ("*", True), ('W/"a"', False)],
+)
+def test__etag_matches(header: str | None, matches: bool) -> None:
+    assert _etag_matches('"a"', header) is matches
+
+
+@pytest.fixture
+def services(mocker: MockerFixture) -> None:
+    mocker.patch("api.endpoints.calendar.get_userinfos", AsyncMock(side_effect=lambda ids: dict.fromkeys(ids)))
+    mocker.patch("api.models.LecturerRating.get_ratings", AsyncMock(side_effect=lambda keys: dict.fromkeys(keys)))
+    mocker.patch("api.endpoints.calendar._get_coaching_skills", AsyncMock(side_effect=lambda _, offers: offers))
+
+
+def _webinar_row(id_: str, creator: str, start: timedelta, participants: int, max_participants: int) -> models.Webinar:
+    return models.Webinar(
+        id=id_,
+        skill_id="skill",
+        creator=creator,
+        creation_date=utcnow(),
+        name=id_,
+        description="",
+        admin_link="",
+        link="",
+        start=utcnow() + start,
+        end=utcnow() + start + timedelta(hours=1),
+        max_participants=max_participants,
+        price=100,
+        participants=[models.WebinarParticipant(user_id=f"student{i}") for i in range(participants)],
+    )
+
+
+async def _query(func: Callable[..., Awaitable[Any]], **filters: Any) -> Any:
+    async with db_context():
+        return await func(**dict.fromkeys(inspect.signature(func).parameters) | filters)
+
+
+async def _webinars(**filters: Any) -> list[tuple[str, int]]:
+    entries, _ = await _query(get_webinars, **filters)
+    return [(entry.event.id, entry.event.price) for entry in entries]
+
+
+@pytest.mark.usefixtures("services")
+async def test__get_webinars() -> None:
+    async with db_context():
+        await db.add(_webinar_row("free", "a", timedelta(days=1), 0, 2))
+        await db.add(_webinar_row("cancelled", "b", timedelta(days=2), 0, 2))
+        await db.add(_webinar_row("full", "a", timedelta(days=3), 1, 1))
+        await db.add(_webinar_row("running", "a", -timedelta(minutes=30), 0, 2))
+        await db.add(_webinar_row("over", "a", -timedelta(hours=2), 0, 2))
+        await models.EmergencyCancel.create("b")
+
+    all_ = [("running", 100), ("free", 100), ("cancelled", 0), ("full", 100)]
+    assert await _webinars() == all_
+    # the price of instructors who have to make up for an emergency cancellation is zero
+    assert await _webinars(price_max=0) == [("cancelled", 0)]
+    assert await _webinars(price_min=1) == [("running", 100), ("free", 100), ("full", 100)]
+    assert await _webinars(bookable=True) == [("free", 100), ("cancelled", 0)]
+    assert await _webinars(bookable=False) == all_
+    assert await _webinars(member_id="a") == [("running", 100), ("free", 100), ("full", 100)]
+    assert await _webinars(member_id="student0") == [("full", 100)]
+    assert await _webinars(member_id="other") == []
+
+
+async def _coachings(**filters: Any) -> list[tuple[str, str | None, int, bool]]:
+    entries, _ = await _query(get_coachings, **filters)
+    return sorted((e.event.id, e.event.skill_id, e.event.price, e.event.booked) for e in entries)
+
+
+@pytest.mark.usefixtures("services")
+async def test__get_coachings() -> None:
+    start = utcnow() + timedelta(days=1)
+    async with db_context():
+        for user_id, skill_id, price in [("a", "x", 10), ("a", "y", 20), ("b", "x", 10)]:
+            await db.add(models.Coaching(user_id=user_id, skill_id=skill_id, price=price))
+        await models.EmergencyCancel.create("b")
+        for id_, user_id, offset in [
+            ("free", "a", 1),
+            ("cancelled", "b", 2),
+            ("no offers", "c", 3),
+            ("over", "a", -26),
+        ]:
+            slot_start = start + timedelta(hours=offset)
+            await db.add(models.Slot(id=id_, user_id=user_id, start=slot_start, end=slot_start + timedelta(hours=1)))
+        await db.add(
+            models.Slot(
+                id="booked",
+                user_id="a",
+                start=start,
+                end=start + timedelta(hours=1),
+                booked_by="student",
+                skill_id="z",
+                student_coins=30,
+            )
+        )
+
+    free = [("cancelled", "x", 0, False), ("free", "x", 10, False), ("free", "y", 20, False)]
+    booked = [("booked", "z", 30, True)]
+    # free slots are offered once per coaching of their instructor, slots without coachings are not offered at all
+    assert await _coachings() == sorted(booked + free)
+    assert await _coachings(skill_id="y") == [("free", "y", 20, False)]
+    assert await _coachings(skill_id="z") == booked
+    assert await _coachings(price_max=0) == [("cancelled", "x", 0, False)]
+    assert await _coachings(price_min=15) == sorted(booked + [("free", "y", 20, False)])
+    assert await _coachings(booked=True) == booked
+    assert await _coachings(booked=False) == free
+    assert await _coachings(bookable=True) == free
+    assert await _coachings(instructor_id="c") == []
+    # only coachings held or booked by the member
+    assert await _coachings(booked=True, member_id="student") == booked
+    assert await _coachings(booked=True, member_id="a") == booked
+    assert await _coachings(booked=True, member_id="b") == []
+
+
+@pytest.mark.usefixtures("services")
+async def test__get_snapshot__pagination(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(cache, "cache_redis", FakeRedis(decode_responses=False))
+    start = utcnow() + timedelta(days=1)
+    async with db_context():
+        for id_, offset in [("w2", 0), ("w1", 0), ("w3", 1)]:
+            webinar = _webinar_row(id_, "a", timedelta(days=1, hours=offset), 0, 2)
+            webinar.start, webinar.end = start + timedelta(hours=offset), start + timedelta(hours=offset + 1)
+            await db.add(webinar)
+        for user_id, skill_id in [("a", "x"), ("a", "y"), ("b", "x")]:
+            await db.add(models.Coaching(user_id=user_id, skill_id=skill_id, price=10))
+        for id_, user_id, offset in [("s1", "a", 0), ("s2", "b", 1)]:
+            slot_start = start + timedelta(hours=offset)
+            await db.add(models.Slot(id=id_, user_id=user_id, start=slot_start, end=slot_start + timedelta(hours=1)))
+
+    pages = []
+    cursor: str | None = None
+    while True:
+        params = dict.fromkeys(inspect.signature(get_snapshot).parameters)
+        entries, position = await get_snapshot(**params | {"after": cursor and _decode_cursor(cursor), "limit": 2})
+        pages.append([(entry.event.id, entry.event.skill_id) for entry in entries])
+        if not position:
+            break
+        cursor = _encode_cursor(position)
+
+    # events with the same start are ordered by id, and the coachings of a slot are never split across pages
+    assert pages == [[("s1", "x"), ("s1", "y")], [("w1", "skill"), ("w2", "skill")], [("s2", "x"), ("w3", "skill")]]
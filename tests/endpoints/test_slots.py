@@ -0,0 +1,52 @@
+from datetime import timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from api.database import db, db_context, select
+from api.endpoints.slots import add_slots
+from api.exceptions.slots import SlotOverlapException
+from api.models import Slot
+from api.schemas.slots import CreateSlot
+from api.utils.utc import utcnow
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(mocker: MockerFixture) -> AsyncMock:
+    return mocker.patch("api.endpoints.slots.clear_cache", AsyncMock())
+
+
+async def test__add_slots(clear_cache: AsyncMock) -> None:
+    start = int((utcnow() + timedelta(days=1)).timestamp())
+
+    async with db_context():
+        result = await add_slots(
+            [CreateSlot(start=start + 3600, duration=30), CreateSlot(start=start - 2 * 86400, duration=30)], "user"
+        )
+        result += await add_slots([CreateSlot(start=start, duration=60)], "user")
+
+    assert [(r["start"], r["end"], r["booked"]) for r in result] == [
+        (start + 3600, start + 5400, False),
+        (start, start + 3600, False),
+    ]
+    clear_cache.assert_called_with("calendar")
+    async with db_context():
+        assert sorted(s.id for s in await db.all(select(Slot))) == sorted(r["id"] for r in result)
+
+
+@pytest.mark.parametrize(
+    "slots", [[(0, 60), (30, 60)], [(0, 60), (90, 60)]]  # overlap among the new slots  # overlap with an existing slot
+)
+async def test__add_slots__overlap(slots: list[tuple[int, int]]) -> None:
+    start = int((utcnow() + timedelta(days=1)).timestamp())
+    async with db_context():
+        await add_slots([CreateSlot(start=start + 7200, duration=60)], "user")
+
+    async with db_context():
+        with pytest.raises(SlotOverlapException):
+            await add_slots([CreateSlot(start=start + 60 * s, duration=d) for s, d in slots], "user")
+        await db.session.rollback()  # done by the exception handler of the app
+
+    async with db_context():
+        assert await db.count(select(Slot)) == 1
@@ -7,8 +7,10 @@ from httpx import AsyncClient
 from pytest_mock import MockerFixture
 from sqlalchemy.ext.asyncio import create_async_engine
 
+from ._utils import FakeRedis
 from api.app import app
 from api.database import db
+from api.utils import deadlines
 
 
 @pytest.fixture(autouse=True)
@@ -17,6 +19,12 @@ async def database(monkeypatch: MonkeyPatch) -> None:
     await db.create_tables()
 
 
+@pytest.fixture(autouse=True)
+def deadlines_redis(monkeypatch: MonkeyPatch) -> FakeRedis:
+    monkeypatch.setattr(deadlines, "redis", fake := FakeRedis())
+    return fake
+
+
 @pytest.fixture
 async def client() -> AsyncIterator[AsyncClient]:
     async with AsyncClient(app=app, base_url="http://test") as client:
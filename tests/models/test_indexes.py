@@ -0,0 +1,173 @@
+import inspect
+from datetime import timedelta
+from typing import Any, Awaitable, Callable
+from unittest.mock import AsyncMock
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pytest_mock import MockerFixture
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+from .._utils import FakeRedis
+from ..endpoints.test_calendar import _webinar_row
+from api import models
+from api.database import db, db_context, filter_by, select
+from api.endpoints.calendar import get_coachings, get_webinars
+from api.models.slots import clean_old_slots, slot_deadlines
+from api.models.webinars import clean_old_webinars, webinar_deadlines
+from api.utils import cache
+from api.utils.utc import utcnow
+
+
+async def _query_plan(statement: Select) -> str:
+    async with db.engine.connect() as conn:
+        compiled = statement.compile(dialect=conn.dialect)
+        params = compiled.construct_params()
+        result = await conn.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {compiled}", tuple(params[name] for name in compiled.positiontup or [])
+        )
+        return "\n".join(row[-1] for row in result)
+
+
+@pytest.mark.parametrize(
+    "statement,index",
+    [
+        (select(models.Webinar).where(models.Webinar.end > utcnow()), "ix_events_webinars_end"),
+        (select(models.Webinar).where(models.Webinar.end < utcnow()), "ix_events_webinars_end"),
+        (filter_by(models.Webinar, creator="user"), "ix_events_webinars_creator_start"),
+        (filter_by(models.Webinar, skill_id="skill"), "ix_events_webinars_skill_id_start"),
+        (select(models.Slot).where(models.Slot.end > utcnow()), "ix_events_slot_end"),
+        (select(models.Slot).where(models.Slot.end < utcnow()), "ix_events_slot_end"),
+        (filter_by(models.Slot, user_id="user"), "ix_events_slot_user_id_start"),
+        (filter_by(models.Slot, booked_by="user"), "ix_events_slot_booked_by"),
+        (filter_by(models.Slot, weekly_slot_id="weekly"), "ix_events_slot_weekly_slot_id"),
+        (select(models.WeeklySlot).where(models.WeeklySlot.last_slot <= utcnow()), "ix_events_weekly_slots_last_slot"),
+        (filter_by(models.WebinarParticipant, user_id="user"), "ix_events_webinar_participants_user_id"),
+        (
+            select(models.OutboxMessage).where(models.OutboxMessage.next_attempt <= utcnow()),
+            "ix_events_outbox_next_attempt",
+        ),
+        (
+            filter_by(models.LecturerRating, lecturer_id="user", skill_id="skill").where(
+                models.LecturerRating.rating != None  # noqa: E711
+            ),
+            "ix_events_lecturer_rating_lecturer_id_skill_id_rating",
+        ),
+        (
+            filter_by(models.LecturerRating, participant_id="user", rating=None),
+            "ix_events_lecturer_rating_participant_id_rating",
+        ),
+    ],
+)
+async def test__query_plan_uses_index(statement: Select, index: str) -> None:
+    assert f"INDEX {index} " in await _query_plan(statement) + " "
+
+
+async def _executed_query_plans(func: Callable[[], Awaitable[Any]]) -> list[tuple[str, str]]:
+    """Run a function and return each sql statement it executes together with its query plan."""
+
+    statements: list[tuple[str, Any]] = []
+
+    def record(_conn: Any, _cursor: Any, statement: str, parameters: Any, *_: Any) -> None:
+        statements.append((statement, parameters))
+
+    event.listen(db.engine.sync_engine, "before_cursor_execute", record)
+    try:
+        await func()
+    finally:
+        event.remove(db.engine.sync_engine, "before_cursor_execute", record)
+
+    plans = []
+    async with db.engine.connect() as conn:
+        for statement, parameters in statements:
+            result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            plans.append((statement, "\n".join(row[-1] for row in result)))
+    return plans
+
+
+def _calendar_query(func: Callable[..., Awaitable[Any]], **filters: Any) -> Callable[[], Awaitable[Any]]:
+    async def query() -> None:
+        async with db_context():
+            await func(**dict.fromkeys(inspect.signature(func).parameters) | filters)
+
+    return query
+
+
+async def _get_ratings() -> None:
+    async with db_context():
+        await models.LecturerRating.get_ratings([("a", "x"), ("b", "y")])
+
+
+async def _clean_old_webinars() -> None:
+    async with db_context():
+        await db.add(_webinar_row("expired", "a", -timedelta(hours=2), 1, 2))
+    await webinar_deadlines.schedule({"expired": utcnow()})
+    await clean_old_webinars()
+
+
+async def _clean_old_slots() -> None:
+    async with db_context():
+        await db.add(models.Slot(id="expired", user_id="a", start=utcnow() - timedelta(hours=2), end=utcnow()))
+    await slot_deadlines.schedule({"expired": utcnow()})
+    await clean_old_slots()
+
+
+@pytest.mark.parametrize(
+    "func,statement,indexes",
+    [
+        (
+            _calendar_query(get_webinars, after=(utcnow(), "id"), limit=10),
+            "SELECT events_webinars.id",
+            ["ix_events_webinars_end"],
+        ),
+        (
+            _calendar_query(get_webinars, instructor_id="user", after=(utcnow(), "id"), limit=10),
+            "SELECT events_webinars.id",
+            ["ix_events_webinars_creator_start"],
+        ),
+        (
+            _calendar_query(get_webinars, skill_id="skill", limit=10),
+            "SELECT events_webinars.id",
+            ["ix_events_webinars_skill_id_start"],
+        ),
+        (
+            _calendar_query(get_coachings, after=(utcnow(), "id"), limit=10),
+            "SELECT events_slot.id",
+            ["ix_events_slot_start"],
+        ),
+        (
+            _calendar_query(get_coachings, instructor_id="user", limit=10),
+            "SELECT events_slot.id",
+            ["ix_events_slot_user_id_start"],
+        ),
+        (
+            _calendar_query(get_coachings, booked=True, member_id="user", limit=10),
+            "SELECT events_slot.id",
+            ["ix_events_slot_user_id_start", "ix_events_slot_booked_by"],
+        ),
+        (_get_ratings, "SELECT events_lecturer_rating.id", ["ix_events_lecturer_rating_lecturer_id_skill_id_rating"]),
+        (_clean_old_webinars, "DELETE FROM events_webinars ", ["sqlite_autoindex_events_webinars_1"]),
+        (
+            _clean_old_webinars,
+            "DELETE FROM events_webinar_participants ",
+            ["sqlite_autoindex_events_webinar_participants_1"],
+        ),
+        (_clean_old_slots, "DELETE FROM events_slot ", ["sqlite_autoindex_events_slot_1"]),
+    ],
+)
+async def test__executed_query_plan_uses_index(
+    func: Callable[[], Awaitable[Any]],
+    statement: str,
+    indexes: list[str],
+    mocker: MockerFixture,
+    monkeypatch: MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(cache, "cache_redis", FakeRedis(decode_responses=False))
+    mocker.patch("api.endpoints.calendar.get_userinfos", AsyncMock(side_effect=lambda ids: dict.fromkeys(ids)))
+    mocker.patch("api.endpoints.calendar._get_coaching_skills", AsyncMock(side_effect=lambda _, offers: offers))
+
+    plans = [plan for executed, plan in await _executed_query_plans(func) if executed.startswith(statement)]
+
+    assert plans
+    assert all(f"INDEX {index} " in plan.replace("\n", " ") + " " for plan in plans for index in indexes)
@@ -0,0 +1,69 @@
+from datetime import timedelta
+from unittest.mock import AsyncMock
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pytest_mock import MockerFixture
+
+from api.database import db, db_context, select
+from api.models import LecturerRating
+from api.settings import settings
+from api.utils.utc import utcnow
+
+
+async def test__get_ratings(mocker: MockerFixture, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "rating_half_life", 10)
+    monkeypatch.setattr(settings, "rating_max_keep", 100)
+    mocker.patch("api.models.lecturer_rating.get_cached_many", AsyncMock(return_value=({("cached", "skill"): 1.5}, 3)))
+    set_cached_many = mocker.patch("api.models.lecturer_rating.set_cached_many", AsyncMock())
+
+    now = utcnow()
+    async with db_context():
+        for lecturer, skill, rating, age in [
+            ("a", "x", 5, 0),
+            ("a", "x", 3, 10),
+            ("a", "x", 1, 200),
+            ("a", "y", 4, 0),
+            ("a", "y", None, 0),
+            ("b", "x", 2, 0),
+            ("c", "x", 5, 0),
+        ]:
+            r = await LecturerRating.create(lecturer, "participant", skill, now - timedelta(days=age), "webinar")
+            r.rating = rating
+
+    async with db_context():
+        result = await LecturerRating.get_ratings(
+            [("a", "x"), ("a", "y"), ("b", "x"), ("a", "x"), ("b", "y"), ("cached", "skill")]
+        )
+
+    assert result == {
+        ("a", "x"): pytest.approx((5 + 3 * 0.5) / 1.5),
+        ("a", "y"): 4,
+        ("b", "x"): 2,
+        ("b", "y"): None,
+        ("cached", "skill"): 1.5,
+    }
+    set_cached_many.assert_called_once()
+    assert set_cached_many.call_args.args[1] == {k: v for k, v in result.items() if k != ("cached", "skill")}
+    assert set_cached_many.call_args.args[2] == 3
+
+    async with db_context():
+        assert await db.count(select(LecturerRating)) == 6  # the rating that was too old has been deleted
+
+
+async def test__insert_many(mocker: MockerFixture) -> None:
+    mocker.patch("api.models.lecturer_rating.INSERT_BATCH_SIZE", 2)
+    exec_ = mocker.spy(db, "exec")
+    now = utcnow()
+
+    async with db_context():
+        await LecturerRating.insert_many(
+            [LecturerRating.new_row("lecturer", f"p{i}", "skill", now, "webinar") for i in range(5)]
+        )
+        assert exec_.call_count == 3
+
+    async with db_context():
+        ratings = await db.all(select(LecturerRating).order_by(LecturerRating.participant_id))
+        assert [(r.participant_id, r.webinar_timestamp, r.rating) for r in ratings] == [
+            (f"p{i}", now, None) for i in range(5)
+        ]
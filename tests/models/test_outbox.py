@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, call
+
+from _pytest.monkeypatch import MonkeyPatch
+from httpx import ConnectError, Response
+from pytest_mock import MockerFixture
+
+from api.database import db, db_context, select
+from api.models import OutboxMessage
+from api.models.outbox import HANDLERS, OutboxAction, dispatch_outbox
+from api.services.internal import InternalServiceError
+from api.settings import settings
+from api.utils.utc import utcnow
+
+
+async def _messages() -> dict[str, tuple[str, int, datetime | None]]:
+    async with db_context():
+        return {m.payload["user_id"]: (m.id, m.attempts, m.next_attempt) for m in await db.all(select(OutboxMessage))}
+
+
+def _add_xp(user_id: str, **_: object) -> None:
+    match user_id:
+        case "failing":
+            raise ConnectError("connection refused")
+        case "forbidden":
+            raise InternalServiceError(Response(403), "")
+        case "unavailable":
+            raise InternalServiceError(Response(503), "")
+
+
+async def test__dispatch_outbox(mocker: MockerFixture, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "outbox_batch_size", 2)
+    monkeypatch.setattr(settings, "outbox_retry_delay", 10)
+    monkeypatch.setattr(settings, "outbox_max_attempts", 2)
+    add_coins = AsyncMock(side_effect=lambda user_id, *_, **__: user_id != "rejected")
+    add_xp = AsyncMock(side_effect=_add_xp)
+    mocker.patch.dict(HANDLERS, {OutboxAction.ADD_COINS: add_coins, OutboxAction.ADD_XP: add_xp})
+
+    async with db_context():
+        await OutboxMessage.enqueue(
+            OutboxAction.ADD_COINS, user_id="user", coins=42, description="Coaching", credit_note=True
+        )
+        await OutboxMessage.enqueue(
+            OutboxAction.ADD_COINS, user_id="rejected", coins=-1, description="Webinar", credit_note=False
+        )
+        for user_id in ["student", "failing", "forbidden", "unavailable"]:
+            await OutboxMessage.enqueue(OutboxAction.ADD_XP, user_id=user_id, skill_id="skill", xp=100)
+    message_ids = {user_id: id_ for user_id, (id_, *_) in (await _messages()).items()}
+
+    # all due messages are dispatched in batches and the message id is used as idempotency key
+    await dispatch_outbox()
+
+    add_coins.assert_has_calls(
+        [
+            call(
+                user_id="user", coins=42, description="Coaching", credit_note=True, idempotency_key=message_ids["user"]
+            ),
+            call(
+                user_id="rejected",
+                coins=-1,
+                description="Webinar",
+                credit_note=False,
+                idempotency_key=message_ids["rejected"],
+            ),
+        ],
+        any_order=True,
+    )
+    add_xp.assert_has_calls(
+        [
+            call(user_id="student", skill_id="skill", xp=100, idempotency_key=message_ids["student"]),
+            call(user_id="failing", skill_id="skill", xp=100, idempotency_key=message_ids["failing"]),
+            call(user_id="forbidden", skill_id="skill", xp=100, idempotency_key=message_ids["forbidden"]),
+            call(user_id="unavailable", skill_id="skill", xp=100, idempotency_key=message_ids["unavailable"]),
+        ],
+        any_order=True,
+    )
+
+    # rejected messages are dropped right away, only transport errors and server errors are retried
+    messages = await _messages()
+    assert messages.keys() == {"failing", "unavailable"}
+    assert all(
+        attempts == 1 and next_attempt and next_attempt > utcnow() + timedelta(seconds=9)
+        for _, attempts, next_attempt in messages.values()
+    )
+
+    # failed messages are not retried before their next attempt
+    add_xp.reset_mock()
+    await dispatch_outbox()
+    add_xp.assert_not_called()
+
+    # messages are given up after the maximum number of attempts, but kept with a failure timestamp
+    mocker.patch("api.models.outbox.utcnow", return_value=utcnow() + timedelta(seconds=20))
+    await dispatch_outbox()
+    assert add_xp.call_count == 2
+    async with db_context():
+        given_up = {
+            m.payload["user_id"]: (m.attempts, m.next_attempt, m.failed_at) for m in await db.all(select(OutboxMessage))
+        }
+    assert given_up.keys() == {"failing", "unavailable"}
+    assert all(
+        attempts == 2 and next_attempt is None and failed_at for attempts, next_attempt, failed_at in given_up.values()
+    )
+
+    add_xp.reset_mock()
+    mocker.patch("api.models.outbox.utcnow", return_value=utcnow() + timedelta(days=1))
+    await dispatch_outbox()
+    add_xp.assert_not_called()
+
+
+async def test__dispatch_outbox__claim(mocker: MockerFixture) -> None:
+    seen: list[tuple[str, int, datetime | None]] = []
+
+    async def add_xp(**__: object) -> None:
+        seen.extend((await _messages()).values())
+
+    handler = AsyncMock(side_effect=add_xp)
+    mocker.patch.dict(HANDLERS, {OutboxAction.ADD_XP: handler})
+    async with db_context():
+        await OutboxMessage.enqueue(OutboxAction.ADD_XP, user_id="student", skill_id="skill", xp=100)
+
+    await dispatch_outbox()
+
+    # the attempt has been committed before the message is dispatched
+    handler.assert_called_once()
+    [(_, attempts, next_attempt)] = seen
+    assert attempts == 1 and next_attempt and next_attempt > utcnow()
+    assert await _messages() == {}
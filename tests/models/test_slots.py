@@ -0,0 +1,156 @@
+from datetime import datetime, time, timedelta, timezone
+from unittest.mock import AsyncMock, call
+
+import pytest
+from pytest_mock import MockerFixture
+from sqlalchemy.exc import InvalidRequestError
+
+from api.database import db, db_context, filter_by, select
+from api.models import OutboxMessage, Slot, WeeklySlot
+from api.models.slots import EventType, clean_old_slots, slot_deadlines
+from api.models.weekly_slots import create_weekly_slots
+from api.utils.utc import utcnow
+
+
+def _at(hour: int, minute: int = 0) -> datetime:
+    return datetime(2042, 1, 1, hour, minute, tzinfo=timezone.utc)
+
+
+async def test__insert_many() -> None:
+    async with db_context():
+        assert await Slot.insert_many([Slot.new_row("a", _at(10), _at(11)), Slot.new_row("a", _at(12), _at(13))]) == 2
+    assert await slot_deadlines.next_deadline() == _at(11).timestamp()
+
+    async with db_context():
+        rows = [
+            Slot.new_row("a", _at(9), _at(10)),  # adjacent to an existing slot
+            Slot.new_row("a", _at(10, 30), _at(11, 30)),  # overlaps with an existing slot
+            Slot.new_row("a", _at(11, 30), _at(13, 30)),  # overlaps with an existing slot
+            Slot.new_row("b", _at(10), _at(11)),  # other user
+        ]
+        assert await Slot.insert_many(rows) == 2
+        assert await Slot.insert_many([]) == 0
+
+    async with db_context():
+        slots = await db.all(select(Slot).order_by(Slot.user_id, Slot.start))
+        assert [(s.user_id, s.start, s.end, s.booked) for s in slots] == [
+            ("a", _at(9), _at(10), False),
+            ("a", _at(10), _at(11), False),
+            ("a", _at(12), _at(13), False),
+            ("b", _at(10), _at(11), False),
+        ]
+        assert slots[0].id == rows[0]["id"]
+        assert slots[0].serialize == {
+            "id": rows[0]["id"],
+            "start": _at(9).timestamp(),
+            "end": _at(10).timestamp(),
+            "booked": False,
+        }
+
+
+async def test__weekly_slot__create_slots() -> None:
+    async with db_context():
+        weekly_slot = await WeeklySlot.create("user", utcnow().weekday(), time(10), time(11, 30))
+        weekly_slot_id = weekly_slot.id
+
+    async with db_context():
+        slots = await db.all(filter_by(Slot, weekly_slot_id=weekly_slot_id).order_by(Slot.start))
+        assert len(slots) in (4, 5, 6)
+        assert all(s.user_id == "user" and s.end - s.start == timedelta(minutes=90) for s in slots)
+        assert all(b.start - a.start == timedelta(days=7) for a, b in zip(slots, slots[1:]))
+        stored = await db.get(WeeklySlot, id=weekly_slot_id)
+        assert stored is not None
+        assert slots[-1].start == stored.last_slot
+
+
+async def test__clean_old_slots(mocker: MockerFixture) -> None:
+    clear_cache = mocker.patch("api.models.slots.clear_cache", AsyncMock())
+    mocker.patch("api.models.slots.settings.coaching_lecturer_xp", 10)
+    mocker.patch("api.models.slots.settings.coaching_participant_xp", 20)
+
+    past, future = utcnow() - timedelta(hours=2), utcnow() + timedelta(hours=2)
+    async with db_context():
+        for id_, start, student, coins in [
+            ("expired", past, None, 0),
+            ("future", future, None, 0),
+            ("paid", past, "student", 42),
+            ("free", past, "student", 0),
+            ("booked", future, "student", 42),
+        ]:
+            slot = await db.add(Slot(**Slot.new_row("teacher", start, start + timedelta(hours=1)) | {"id": id_}))
+            await slot_deadlines.schedule({id_: slot.end})
+            if student:
+                slot.book(student, EventType.COACHING, 2 * coins, coins, "skill")
+        await slot_deadlines.schedule({"unknown": past, "booked": past})  # due before the slot ends
+
+    await clean_old_slots()
+
+    async with db_context():
+        assert {s.id for s in await db.all(select(Slot))} == {"future", "booked"}
+        messages = [(m.action, m.payload) for m in await db.all(select(OutboxMessage))]
+        assert sorted(messages, key=repr) == sorted(
+            [
+                ("add_coins", {"user_id": "teacher", "coins": 42, "description": "Coaching", "credit_note": True}),
+                *[("add_xp", {"user_id": "teacher", "skill_id": "skill", "xp": 10})] * 2,
+                *[("add_xp", {"user_id": "student", "skill_id": "skill", "xp": 20})] * 2,
+            ],
+            key=repr,
+        )
+    # only the deadlines of slots that are gone are cancelled
+    assert await slot_deadlines.due(utcnow() + timedelta(hours=1)) == []
+    assert await slot_deadlines.due(utcnow() + timedelta(hours=3)) == ["booked", "future"]
+    clear_cache.assert_called_once_with("calendar")
+
+
+async def test__insert_many__batches(mocker: MockerFixture) -> None:
+    mocker.patch("api.models.slots.INSERT_BATCH_SIZE", 2)
+    rows = [Slot.new_row("user", _at(i), _at(i, 30)) for i in range(5)] + [Slot.new_row("user", _at(0), _at(1))]
+
+    async with db_context():
+        assert await Slot.insert_many(rows) == 5
+
+    async with db_context():
+        assert await db.count(select(Slot)) == 5
+
+
+async def test__weekly_slot__create_due_slots(mocker: MockerFixture) -> None:
+    now = utcnow()
+    async with db_context():
+        for id_, last_slot in [("due", now), ("not due", now + timedelta(days=60))]:
+            await db.add(
+                WeeklySlot(id=id_, user_id="user", weekday=0, start=time(10), end=time(11), last_slot=last_slot)
+            )
+
+    all_ = mocker.spy(db, "all")
+    async with db_context():
+        await WeeklySlot.create_due_slots()
+
+        weekly_slots = all_.spy_return
+        assert [w.id for w in weekly_slots] == ["due"]
+        with pytest.raises(InvalidRequestError):
+            weekly_slots[0].slots  # the relationship has not been loaded
+
+    async with db_context():
+        slots = await db.all(filter_by(Slot, weekly_slot_id="due").order_by(Slot.start))
+        assert len(slots) in (4, 5)
+        due, not_due = await db.get(WeeklySlot, id="due"), await db.get(WeeklySlot, id="not due")
+        assert due is not None and not_due is not None
+        assert due.last_slot == slots[-1].start
+        assert not_due.last_slot == now + timedelta(days=60)
+        assert await db.count(filter_by(Slot, weekly_slot_id="not due")) == 0
+
+
+async def test__create_weekly_slots(mocker: MockerFixture) -> None:
+    clear_cache = mocker.patch("api.models.weekly_slots.clear_cache", AsyncMock())
+    async with db_context():
+        await db.add(WeeklySlot(id="due", user_id="user", weekday=0, start=time(10), end=time(11), last_slot=utcnow()))
+
+    await create_weekly_slots()
+
+    async with db_context():
+        assert await db.count(filter_by(Slot, weekly_slot_id="due")) in (4, 5)
+    clear_cache.assert_called_once_with("calendar")
+
+    # nothing is due anymore, so the cache is not cleared again
+    await create_weekly_slots()
+    clear_cache.assert_called_once_with("calendar")
@@ -0,0 +1,96 @@
+from datetime import timedelta
+from unittest.mock import AsyncMock, patch
+
+from pytest_mock import MockerFixture
+
+from api.database import db, db_context, select
+from api.models import EmergencyCancel, LecturerRating, OutboxMessage, Webinar, WebinarParticipant
+from api.models.webinars import clean_old_webinars, sync_webinar_deadlines, webinar_deadlines
+from api.utils.utc import utcnow
+
+
+def _webinar(id_: str, end_offset: timedelta) -> Webinar:
+    end = utcnow() + end_offset
+    return Webinar(
+        id=id_,
+        skill_id="skill",
+        creator="creator",
+        creation_date=utcnow(),
+        name=id_,
+        description="",
+        admin_link="",
+        link="",
+        start=end - timedelta(hours=1),
+        end=end,
+        max_participants=10,
+        price=100,
+        participants=[],
+    )
+
+
+async def test__clean_old_webinars(mocker: MockerFixture) -> None:
+    clear_cache = mocker.patch("api.models.webinars.clear_cache", AsyncMock())
+
+    async with db_context():
+        for id_, offset in [("expired", timedelta(hours=-1)), ("moved", timedelta(hours=1))]:
+            webinar = await db.add(_webinar(id_, offset))
+            webinar.participants.append(WebinarParticipant(user_id="student", webinar_id=id_))
+        await EmergencyCancel.create("creator")
+        await webinar_deadlines.schedule({"expired": utcnow(), "moved": utcnow() - timedelta(minutes=1)})
+
+    await clean_old_webinars()
+
+    async with db_context():
+        assert [w.id for w in await db.all(select(Webinar))] == ["moved"]
+        assert [p.webinar_id for p in await db.all(select(WebinarParticipant))] == ["moved"]
+        assert [(r.lecturer_id, r.participant_id, r.webinar_name) for r in await db.all(select(LecturerRating))] == [
+            ("creator", "student", "expired")
+        ]
+        assert not await EmergencyCancel.exists("creator")
+        messages = [(m.action, m.payload) for m in await db.all(select(OutboxMessage))]
+        assert sorted(messages, key=repr) == sorted(
+            [
+                ("add_coins", {"user_id": "creator", "coins": 70, "description": "Webinar", "credit_note": True}),
+                ("add_xp", {"user_id": "creator", "skill_id": "skill", "xp": 100}),
+                ("add_xp", {"user_id": "student", "skill_id": "skill", "xp": 100}),
+            ],
+            key=repr,
+        )
+        moved = await db.get(Webinar, id="moved")
+        # the moved webinar is processed when it actually ends
+        assert moved and await webinar_deadlines.next_deadline() == moved.end.timestamp()
+    clear_cache.assert_called_once_with("calendar")
+
+    # nothing is due, so the database is not queried
+    all_ = mocker.spy(db, "all")
+    await clean_old_webinars()
+    all_.assert_not_called()
+
+
+async def test__clean_old_webinars__locked(mocker: MockerFixture) -> None:
+    mocker.patch("api.models.webinars.clear_cache", AsyncMock())
+    mocker.patch("api.models.webinars.settings.scheduler_retry_delay", 60)
+    async with db_context():
+        await db.add(_webinar("locked", timedelta(hours=-1)))
+    await webinar_deadlines.schedule({"locked": utcnow(), "gone": utcnow()})
+
+    now = utcnow()
+    # simulate that the webinar is locked by another transaction and therefore skipped
+    with patch.object(db, "all", AsyncMock(return_value=[])):
+        await clean_old_webinars()
+
+    async with db_context():
+        assert [w.id for w in await db.all(select(Webinar))] == ["locked"]
+    # the webinar is retried later instead of waiting for the next sync, the deadline of the unknown one is cancelled
+    assert await webinar_deadlines.due(now + timedelta(seconds=59)) == []
+    assert await webinar_deadlines.due(now + timedelta(seconds=61)) == ["locked"]
+
+
+async def test__sync_webinar_deadlines() -> None:
+    async with db_context():
+        webinar = await db.add(_webinar("webinar", timedelta(hours=1)))
+        end = webinar.end
+
+    await sync_webinar_deadlines()
+
+    assert await webinar_deadlines.next_deadline() == end.timestamp()
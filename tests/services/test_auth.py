@@ -0,0 +1,41 @@
+from contextlib import nullcontext
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock
+
+from pytest_mock import MockerFixture
+
+from api.schemas.user import UserInfo
+from api.services import auth
+
+
+def _userinfo(user_id: str) -> dict[str, Any]:
+    return {"id": user_id, "name": user_id, "display_name": user_id.upper(), "email": None, "avatar_url": None}
+
+
+async def test__get_userinfos(mocker: MockerFixture) -> None:
+    cached = UserInfo(**_userinfo("a"))
+    get_cached_many = mocker.patch("api.services.auth.get_cached_many", AsyncMock(return_value=({("a",): cached}, 3)))
+    set_cached_many = mocker.patch("api.services.auth.set_cached_many", AsyncMock())
+    responses = {
+        "/users/b": MagicMock(status_code=200, json=lambda: _userinfo("b")),
+        "/users/c": MagicMock(status_code=404),
+    }
+    http = MagicMock(get=AsyncMock(side_effect=responses.__getitem__))
+    service = mocker.patch("api.services.auth.InternalService")
+    service.AUTH.client = nullcontext(http)
+
+    result = await auth.get_userinfos(["a", "b", "a", "c", "b"])
+
+    get_cached_many.assert_called_once_with(auth.get_userinfo, [("a",), ("b",), ("c",)])
+    assert [c.args for c in http.get.call_args_list] == [("/users/b",), ("/users/c",)]
+    assert result == {"a": cached, "b": UserInfo(**_userinfo("b")), "c": None}
+    set_cached_many.assert_called_once_with(auth.get_userinfo, {("b",): result["b"], ("c",): None}, 3)
+
+
+async def test__get_userinfos__all_cached(mocker: MockerFixture) -> None:
+    cached = {("a",): UserInfo(**_userinfo("a"))}
+    mocker.patch("api.services.auth.get_cached_many", AsyncMock(return_value=(cached, None)))
+    service = mocker.patch("api.services.auth.InternalService")
+
+    assert await auth.get_userinfos(["a"]) == {"a": cached[("a",)]}
+    service.AUTH.client.assert_not_called()
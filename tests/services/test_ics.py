@@ -0,0 +1,116 @@
+import random
+from datetime import datetime, timezone
+from typing import AsyncIterator
+from unittest.mock import AsyncMock
+
+import icalendar
+import pytest
+from pytest_mock import MockerFixture
+
+from api.schemas.calendar import Coaching, EventType, Webinar
+from api.services import ics
+from api.services.skills import Skill
+
+
+async def _iterate(events: list[Webinar | Coaching]) -> AsyncIterator[Webinar | Coaching]:
+    for event in events:
+        yield event
+
+
+async def _collect(events: list[Webinar | Coaching]) -> bytes:
+    return b"".join([chunk async for chunk in ics.stream_ics(_iterate(events))])
+
+
+def _webinar(id_: str, title: str) -> Webinar:
+    return Webinar(
+        id=id_,
+        type=EventType.WEBINAR,
+        title=title,
+        description="line 1\nline 2",
+        skill_id="python",
+        start=1700000000,
+        duration=60,
+        price=10,
+        admin_link=None,
+        link="https://example.com",
+        instructor=None,
+        instructor_rating=None,
+        booked=True,
+        bookable=False,
+        creation_date=0,
+        max_participants=10,
+        participants=1,
+    )
+
+
+def _coaching() -> Coaching:
+    return Coaching(
+        id="c",
+        type=EventType.COACHING,
+        title=None,
+        description=None,
+        skill_id="unknown",
+        start=1700003600,
+        duration=30,
+        price=0,
+        admin_link=None,
+        link=None,
+        instructor=None,
+        instructor_rating=4.5,
+        booked=False,
+        bookable=True,
+        student=None,
+    )
+
+
+async def test__stream_ics(mocker: MockerFixture) -> None:
+    mocker.patch("api.services.ics.get_skills", AsyncMock(return_value=[Skill(id="python", name="Python")]))
+    events: list[Webinar | Coaching] = [_webinar("a", "Webinar, with; special chars"), _coaching()]
+
+    result = await _collect(events)
+
+    cal = icalendar.Calendar.from_ical(result)
+    assert [str(e["summary"]) for e in cal.walk("VEVENT")] == [
+        "Webinar: Webinar, with; special chars (Python)",
+        "Empty Slot (Coaching)",
+    ]
+
+
+async def test__stream_ics__chunks(mocker: MockerFixture) -> None:
+    mocker.patch("api.services.ics.get_skills", AsyncMock(return_value=[]))
+    mocker.patch("api.services.ics.CHUNK_SIZE", 2)
+
+    events: list[Webinar | Coaching] = [_webinar(str(i), "title") for i in range(5)]
+    chunks = [chunk async for chunk in ics.stream_ics(_iterate(events))]
+
+    assert chunks[0] == b"BEGIN:VCALENDAR\r\n"
+    assert [chunk.count(b"BEGIN:VEVENT") for chunk in chunks[1:-1]] == [2, 2, 1]
+    assert chunks[-1] == b"END:VCALENDAR\r\n"
+    assert await _collect([]) == b"BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n"
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test__vevent__matches_icalendar(seed: int) -> None:
+    rnd = random.Random(seed)  # noqa: S311
+    alphabet = 'abc XYZ 019 ,;:\\"\t\n äöü € 你好 😀'
+
+    def text() -> str:
+        # icalendar turns a literal \N into a line break
+        return "".join(rnd.choice(alphabet) for _ in range(rnd.randrange(200))).replace("\\N", "N")
+
+    start = datetime.fromtimestamp(rnd.randrange(2**31), timezone.utc)
+    properties: list[tuple[str, str | datetime | None]] = [
+        ("SUMMARY", text()),
+        ("DTSTART", start),
+        ("DTEND", start),
+        ("DESCRIPTION", text()),
+        ("LOCATION", text()),
+    ]
+    expected = icalendar.Event()
+    for name, value in properties:
+        expected.add(name, value)
+
+    result = ics._vevent(properties)
+
+    assert result.encode() == expected.to_ical()
+    assert all(len(line.encode()) <= 75 for line in result.split("\r\n"))
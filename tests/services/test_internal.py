@@ -1,16 +1,22 @@
+import asyncio
 from datetime import timedelta
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 from _pytest.monkeypatch import MonkeyPatch
+from httpx import Limits, Request, Response
 from pytest_mock import MockerFixture
 
+from api.services import internal
 from api.services.internal import InternalService, InternalServiceError
 from api.settings import settings
+from api.utils.concurrency import gather_limited
 
 
 async def test__internal_service__get_token(mocker: MockerFixture, monkeypatch: MonkeyPatch) -> None:
     encode_jwt = mocker.patch("api.services.internal.encode_jwt")
+    monotonic = mocker.patch("api.services.internal.time.monotonic", return_value=1000)
+    monkeypatch.setattr(internal, "_tokens", {})
     monkeypatch.setattr(settings, "internal_jwt_ttl", 123)
     service = MagicMock()
     service.name = "MY_SERVICE"
@@ -18,7 +24,25 @@ async def test__internal_service__get_token(mocker: MockerFixture, monkeypatch:
     result = InternalService._get_token(service)
 
     encode_jwt.assert_called_once_with({"aud": "my_service"}, timedelta(seconds=123))
-    assert result == encode_jwt()
+    assert result == encode_jwt.return_value
+
+    monotonic.return_value = 1000 + 123 - internal.TOKEN_REFRESH_MARGIN - 1
+    assert InternalService._get_token(service) == result
+    encode_jwt.assert_called_once()
+
+    monotonic.return_value = 1000 + 123 - internal.TOKEN_REFRESH_MARGIN
+    encode_jwt.return_value = "new token"
+    assert InternalService._get_token(service) == "new token"
+    assert encode_jwt.call_count == 2
+
+
+async def test__internal_service__authorize() -> None:
+    service = MagicMock()
+    request = MagicMock(headers={})
+
+    await InternalService._authorize(service, request)
+
+    assert request.headers == {"Authorization": service._get_token()}
 
 
 @pytest.mark.parametrize(
@@ -38,19 +62,84 @@ async def test__internal_service__handle_error(code: int, ok: bool) -> None:
         assert e.value.args == (response, "response text asdf")
 
 
-async def test__internal_service__client(mocker: MockerFixture, monkeypatch: MonkeyPatch) -> None:
+async def test__internal_service__create_client(mocker: MockerFixture, monkeypatch: MonkeyPatch) -> None:
     async_client = mocker.patch("api.services.internal.AsyncClient")
+    transport = mocker.patch("api.services.internal._LimitedTransport")
+    monkeypatch.setattr(settings, "internal_max_connections", 42)
     service = MagicMock(value="http://example.service:1234/test/")
 
-    result = InternalService.client.fget(service)  # type: ignore
+    result = InternalService._create_client(service)
 
     async_client.assert_called_once()
     args = async_client.call_args[1]
     assert result == async_client()
 
     assert args["base_url"] == "http://example.service:1234/test/_internal"
-    assert args["headers"] == {"Authorization": service._get_token()}
+    assert args["transport"] == transport.return_value
+    transport.assert_called_once_with(
+        http2=internal.HTTP2, limits=Limits(max_connections=42, max_keepalive_connections=42)
+    )
 
     event_hooks = args["event_hooks"]
-    assert [*event_hooks] == ["response"]
+    assert [*event_hooks] == ["request", "response"]
+    assert event_hooks["request"] == [service._authorize]
     assert event_hooks["response"] == [service._handle_error]
+
+
+async def test__internal_service__client(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(internal, "_clients", {})
+    service = MagicMock()
+    service.name = "MY_SERVICE"
+    service._create_client.return_value.is_closed = False
+
+    async with InternalService.client.fget(service) as client:  # type: ignore
+        assert client == service._create_client.return_value
+    async with InternalService.client.fget(service) as client:  # type: ignore
+        assert client == service._create_client.return_value
+
+    service._create_client.assert_called_once_with()
+    client.aclose.assert_not_called()
+
+    client.is_closed = True
+    InternalService.client.fget(service)  # type: ignore
+    assert service._create_client.call_count == 2
+
+
+async def test__start_and_close_clients(mocker: MockerFixture, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(internal, "_clients", {})
+    async_client = mocker.patch("api.services.internal.AsyncClient")
+    async_client.return_value.aclose = AsyncMock()
+
+    internal.start_clients()
+
+    assert [*internal._clients] == [service.name for service in InternalService]
+
+    await internal.close_clients()
+
+    assert internal._clients == {}
+    assert async_client.return_value.aclose.call_count == len(InternalService)
+
+
+async def test__limited_transport(mocker: MockerFixture, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "internal_concurrency", 2)
+    running = 0
+    max_running = 0
+
+    async def handle(request: Request) -> Response:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return Response(200)
+
+    mocker.patch("httpx.AsyncHTTPTransport.handle_async_request", side_effect=handle)
+    transport = internal._LimitedTransport()
+
+    # separate fan-outs (e.g. of concurrent requests) share the limit of the transport
+    await asyncio.gather(
+        gather_limited(*[transport.handle_async_request(Request("GET", "http://x")) for _ in range(3)]),
+        gather_limited(*[transport.handle_async_request(Request("GET", "http://x")) for _ in range(3)]),
+    )
+
+    assert max_running == 2
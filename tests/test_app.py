@@ -62,6 +62,10 @@ async def test__rollback_on_exception(mocker: MockerFixture) -> None:
 async def test__on_startup(mocker: MockerFixture, monkeypatch: MonkeyPatch) -> None:
     fastapi_patch = mocker.patch("fastapi.FastAPI")
     db_patch = mocker.patch("api.database.db")
+    start_cache_invalidation = mocker.patch("api.utils.cache.start_cache_invalidation")
+    start_clients = mocker.patch("api.services.internal.start_clients")
+    lease = mocker.patch("api.utils.leader.LeaderLease").return_value
+    scheduler = mocker.patch("api.utils.scheduler.Scheduler").return_value
 
     module, on_startup = get_decorated_function(fastapi_patch, "on_event", "startup")
     db_patch.create_tables = AsyncMock()
@@ -69,15 +73,40 @@ async def test__on_startup(mocker: MockerFixture, monkeypatch: MonkeyPatch) -> N
     await on_startup()
 
     db_patch.create_tables.assert_not_called()  # use alembic migrations instead
+    start_cache_invalidation.assert_called_once_with()
+    start_clients.assert_called_once_with()
+    assert module.cleanup_lease is lease
+    lease.start.assert_called_once_with()
+    assert module.scheduler is scheduler
+    assert [c.args[0] for c in scheduler.add_job.call_args_list] == [
+        "clean_old_webinars",
+        "clean_old_slots",
+        "dispatch_outbox",
+        "create_weekly_slots",
+        "sync_webinar_deadlines",
+        "sync_slot_deadlines",
+    ]
+    scheduler.start.assert_called_once_with()
 
 
 async def test__on_shutdown(mocker: MockerFixture) -> None:
     fastapi_patch = mocker.patch("fastapi.FastAPI")
+    stop_cache_invalidation = mocker.patch("api.utils.cache.stop_cache_invalidation", AsyncMock())
+    close_clients = mocker.patch("api.services.internal.close_clients", AsyncMock())
+    lease = mocker.patch("api.utils.leader.LeaderLease").return_value
+    lease.stop = AsyncMock()
+    scheduler = mocker.patch("api.utils.scheduler.Scheduler").return_value
+    scheduler.stop = AsyncMock()
 
     _, on_shutdown = get_decorated_function(fastapi_patch, "on_event", "shutdown")
 
     await on_shutdown()
 
+    stop_cache_invalidation.assert_called_once_with()
+    close_clients.assert_called_once_with()
+    lease.stop.assert_called_once_with()
+    scheduler.stop.assert_called_once_with()
+
 
 async def test__status(client: AsyncClient) -> None:
     response = await client.head("/status")
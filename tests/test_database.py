@@ -10,6 +10,7 @@ from sqlalchemy.orm import DeclarativeMeta, registry
 from ._utils import import_module, mock_asynccontextmanager, mock_dict, mock_list
 from api import database
 from api.settings import settings
+from api.utils import cache
 
 
 @pytest.mark.parametrize(
@@ -396,6 +397,21 @@ async def test__db_context(mocker: MockerFixture) -> None:
     db_patch.close.assert_called_once_with()
 
 
+async def test__db_context__clear_cache_after_commit(mocker: MockerFixture) -> None:
+    db_patch = mocker.patch("api.database.db")
+    clear_cache_patch = mocker.patch("api.database.clear_cache", AsyncMock())
+
+    db_patch.commit = AsyncMock()
+    db_patch.close = AsyncMock()
+    clear_cache_patch.side_effect = lambda _: db_patch.close.assert_called_once_with()
+
+    async with database.db_context():
+        await cache.clear_cache("test")
+        db_patch.commit.assert_not_called()
+
+    clear_cache_patch.assert_called_once_with("test")
+
+
 async def test__db_wrapper(mocker: MockerFixture) -> None:
     db_context_patch = mocker.patch("api.database.db_context")
     db_context_patch.side_effect, [func_callback], assert_calls = mock_asynccontextmanager(1, None)
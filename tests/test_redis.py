@@ -19,3 +19,12 @@ async def test__redis(monkeypatch: MonkeyPatch) -> None:
         "encoding": "utf-8",
         "decode_responses": True,
     }
+
+
+async def test__cache_redis(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "redis_url", "redis://my_redis_host:4953/42")
+
+    r = import_module(redis).cache_redis
+
+    assert isinstance(r, Redis)
+    assert r.connection_pool.connection_kwargs == {"host": "my_redis_host", "port": 4953, "db": 42}
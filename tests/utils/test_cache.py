@@ -0,0 +1,528 @@
+import asyncio
+import math
+from typing import Any, cast
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pytest_mock import MockerFixture
+
+from .._utils import FakeRedis
+from api.database import db, db_context
+from api.settings import settings
+from api.utils import cache
+
+
+@pytest.fixture
+def redis(monkeypatch: MonkeyPatch) -> FakeRedis:
+    monkeypatch.setattr(cache, "cache_redis", fake := FakeRedis(decode_responses=False))
+    return fake
+
+
+async def test__redis_cached(redis: FakeRedis) -> None:
+    func = AsyncMock(side_effect=lambda a, b, c=0: a + b + c)
+
+    @cache.redis_cached("test", "a", "c", ttl=42)
+    async def cached(a: int, b: int, c: int = 0) -> int:
+        return await func(a, b, c)  # type: ignore
+
+    assert await cached(1, 2, 0) == 3
+    assert await cached(1, 5, 0) == 3  # b is not part of the key
+    assert await cached(1, 2, c=3) == 6
+    assert await cached(2, 2, 0) == 4
+    assert func.call_count == 3
+    assert set(redis.ttls.values()) == {42}
+
+
+async def test__redis_cached__single_round_trip(redis: FakeRedis, mocker: MockerFixture) -> None:
+    @cache.redis_cached("test")
+    async def cached() -> int:
+        return 1
+
+    await cache.clear_cache("test")
+    await cached()
+    eval_, get = mocker.spy(redis, "eval"), mocker.spy(redis, "get")
+
+    assert await cached() == 1
+    eval_.assert_called_once()
+    get.assert_not_called()
+
+
+async def test__clear_cache(redis: FakeRedis) -> None:
+    func = AsyncMock(return_value=1)
+    other = AsyncMock(return_value=2)
+
+    @cache.redis_cached("test", "x")
+    async def cached(x: int) -> int:
+        return await func()  # type: ignore
+
+    @cache.redis_cached("other", "x")
+    async def cached_other(x: int) -> int:
+        return await other()  # type: ignore
+
+    await cached(1)
+    await cached_other(1)
+    await cache.clear_cache("test")
+    await cached(1)
+    await cached_other(1)
+
+    assert func.call_count == 2
+    assert other.call_count == 1
+
+
+async def test__clear_cache__deferred(redis: FakeRedis) -> None:
+    func = AsyncMock(return_value=1)
+
+    @cache.redis_cached("test", "x")
+    async def cached(x: int) -> int:
+        return await func()  # type: ignore
+
+    await cached(1)
+    cleared: set[str] = set()
+    with cache.defer_clear_cache(cleared):
+        await cache.clear_cache("test")
+    await cached(1)
+
+    assert cleared == {"test"}
+    assert func.call_count == 1
+
+    await cache.clear_cache("test")
+    await cached(1)
+
+    assert func.call_count == 2
+    assert await cache.get_generation("test") == 1
+    assert await cache.get_generation("other") == 0
+
+
+async def test__get_set_cached_many(redis: FakeRedis) -> None:
+    @cache.redis_cached("test", "x", "y")
+    async def cached(x: int, y: str) -> str | None:
+        return y * x if x else None
+
+    class Foo:
+        @classmethod
+        @cache.redis_cached("test", "x")
+        async def method(cls, x: int) -> int:
+            return x
+
+    await cached(0, "a")
+    await cached(2, "b")
+
+    assert await cache.get_cached_many(cached, [(0, "a"), (1, "a"), (2, "b")]) == ({(0, "a"): None, (2, "b"): "bb"}, 0)
+
+    results: dict[tuple[Any, ...], str | None] = {(1, "a"): "x"}
+    await cache.set_cached_many(cached, results)
+    assert await cached(1, "a") == "x"
+
+    await cache.set_cached_many(Foo.method, {(3,): 4})
+    assert await Foo.method(3) == 4
+    assert await cache.get_cached_many(Foo.method, [(3,), (5,)]) == ({(3,): 4}, 0)
+
+    await cache.clear_cache("test")
+    assert await cache.get_cached_many(cached, [(0, "a"), (1, "a"), (2, "b")]) == ({}, 1)
+
+    # results computed before the namespace has been cleared are not stored in the new generation
+    results = {(1, "a"): "old"}
+    await cache.set_cached_many(cached, results, 0)
+    assert await cache.get_cached_many(cached, [(1, "a")]) == ({}, 1)
+
+
+async def test__get_set_cached_many__not_cached(redis: FakeRedis) -> None:
+    async def func(x: int) -> int:
+        return x
+
+    await cache.set_cached_many(func, {(1,): 2})
+    assert await cache.get_cached_many(func, [(1,)]) == ({}, None)
+    assert redis.data == {}
+
+
+async def test__request_memo(redis: FakeRedis, mocker: MockerFixture) -> None:
+    func = AsyncMock(side_effect=lambda x: x * 2)
+
+    @cache.redis_cached("test", "x")
+    async def cached(x: int) -> int:
+        await asyncio.sleep(0.01)
+        return await func(x)  # type: ignore
+
+    get = mocker.spy(redis, "eval")
+    with cache.request_memo():
+        # concurrent calls with the same key are coalesced
+        assert list(await asyncio.gather(cached(1), cached(1), cached(2))) == [2, 2, 4]
+        assert func.call_count == 2
+        lookups = get.call_count
+
+        # repeated calls neither query redis nor the function
+        assert await cached(1) == 2
+        assert get.call_count == lookups
+
+        # clearing the cache also clears the memo of the namespace
+        await cache.clear_cache("test")
+        assert await cached(1) == 2
+        assert func.call_count == 3
+
+    # the memo is dropped at the end of the context
+    assert await cached(1) == 2
+    assert get.call_count > lookups + 1
+
+
+async def test__request_memo__exception(redis: FakeRedis) -> None:
+    func = AsyncMock(side_effect=[ValueError, 1])
+
+    @cache.redis_cached("test")
+    async def cached() -> int:
+        return await func()  # type: ignore
+
+    with cache.request_memo():
+        with pytest.raises(ValueError):
+            await cached()
+        assert await cached() == 1
+        assert await cached() == 1
+    assert func.call_count == 2
+
+
+async def test__db_context__request_memo(redis: FakeRedis) -> None:
+    func = AsyncMock(return_value=1)
+
+    @cache.redis_cached("test")
+    async def cached() -> int:
+        return await func()  # type: ignore
+
+    async with db_context():
+        await cached()
+        redis.data.clear()
+        await cached()  # taken from the memo
+        assert func.call_count == 1
+
+    assert cache._memo.get() is None
+    await cached()
+    assert func.call_count == 2
+
+
+@pytest.fixture
+def local_caches(monkeypatch: MonkeyPatch) -> dict[str, cache.LocalCache]:
+    monkeypatch.setattr(cache, "_local_caches", caches := cast(dict[str, cache.LocalCache], {}))
+    return caches
+
+
+async def test__redis_cached__local(redis: FakeRedis, local_caches: dict[str, cache.LocalCache]) -> None:
+    func = AsyncMock(side_effect=lambda x: x)
+
+    @cache.redis_cached("test", "x", local_size=2)
+    async def cached(x: int) -> int:
+        return await func(x)  # type: ignore
+
+    assert await cached(1) == 1
+    redis.data.clear()
+    assert await cached(1) == 1  # served from memory
+    assert func.call_count == 1
+
+    await cached(2)
+    await cached(1)
+    await cached(3)  # evicts 2, the least recently used entry
+    [local] = local_caches.values()
+    build_key = cache._cached_functions[cached].build_key
+    assert [*local.entries] == [build_key((1,), {}), build_key((3,), {})]
+    assert local.stats == {"hits": 2, "misses": 3, "size": 2, "maxsize": 2}
+    assert cache.local_cache_stats() == {f"{cached.__module__}:cached": local.stats}
+
+
+async def test__redis_cached__local_ttl(
+    redis: FakeRedis, local_caches: dict[str, cache.LocalCache], mocker: MockerFixture
+) -> None:
+    monotonic = mocker.patch("time.monotonic", return_value=100)
+    func = AsyncMock(return_value=1)
+
+    @cache.redis_cached("test", local_size=1, local_ttl=10)
+    async def cached() -> int:
+        return await func()  # type: ignore
+
+    await cached()
+    redis.data.clear()
+    monotonic.return_value = 109
+    await cached()
+    monotonic.return_value = 110
+    await cached()
+
+    assert func.call_count == 2
+
+
+async def test__clear_cache__local(redis: FakeRedis, local_caches: dict[str, cache.LocalCache]) -> None:
+    func = AsyncMock(return_value=1)
+
+    @cache.redis_cached("test", local_size=1)
+    async def cached() -> int:
+        return await func()  # type: ignore
+
+    await cached()
+    await cache.clear_cache("test")
+    await cache.clear_cache("other")
+    await cached()
+
+    assert func.call_count == 2
+    assert redis.published == [(cache.INVALIDATION_CHANNEL, b"test")]
+
+
+async def test__redis_cached__local_cleared_during_lookup(
+    redis: FakeRedis, local_caches: dict[str, cache.LocalCache]
+) -> None:
+    async def func() -> int:
+        cache._clear_local_caches("test")  # e.g. invalidation by another worker
+        return 1
+
+    @cache.redis_cached("test", local_size=1)
+    async def cached() -> int:
+        return await func()
+
+    await cached()
+
+    [local] = local_caches.values()
+    assert not local.entries  # the result may be outdated already
+
+
+async def test__get_set_cached_many__local(redis: FakeRedis, local_caches: dict[str, cache.LocalCache]) -> None:
+    @cache.redis_cached("test", "x", local_size=10)
+    async def cached(x: int) -> int:
+        return x
+
+    await cache.set_cached_many(cached, {(1,): 1, (2,): 2})
+    redis.data.clear()
+    await cached(3)
+    redis.data.clear()
+
+    assert await cache.get_cached_many(cached, [(1,), (2,), (3,), (4,)]) == ({(1,): 1, (2,): 2, (3,): 3}, 0)
+    assert await cache.get_cached_many(cached, [(1,), (2,)]) == ({(1,): 1, (2,): 2}, None)  # no redis lookup
+
+
+async def test__listen_for_invalidations(local_caches: dict[str, cache.LocalCache], mocker: MockerFixture) -> None:
+    local_caches["a"] = a = cache.LocalCache("a", 10, 10)
+    local_caches["b"] = b = cache.LocalCache("b", 10, 10)
+    received = asyncio.Event()
+
+    async def listen() -> Any:
+        yield {"type": "subscribe", "data": 1}
+        a.set("x", 1, a.epoch)
+        b.set("x", 1, b.epoch)
+        yield {"type": "message", "data": b"a"}
+        received.set()
+        await asyncio.Event().wait()
+
+    pubsub = MagicMock(subscribe=AsyncMock(), listen=listen)
+    pubsub.__aenter__.return_value = pubsub
+    mocker.patch.object(cache, "cache_redis", MagicMock(pubsub=MagicMock(return_value=pubsub)))
+
+    cache.start_cache_invalidation()
+    await asyncio.wait_for(received.wait(), 1)
+    await cache.stop_cache_invalidation()
+
+    pubsub.subscribe.assert_called_once_with(cache.INVALIDATION_CHANNEL)
+    assert not a.entries
+    assert [*b.entries] == ["x"]
+    assert a.epoch == 2
+    assert b.epoch == 1
+
+
+async def test__redis_cached__single_flight(redis: FakeRedis) -> None:
+    release = asyncio.Event()
+    func = AsyncMock(side_effect=release.wait)
+
+    @cache.redis_cached("test")
+    async def cached() -> bool:
+        return await func()  # type: ignore
+
+    tasks = [asyncio.ensure_future(cached()) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*tasks) == [True] * 3
+    func.assert_called_once_with()
+    assert not cache._inflight
+
+
+async def test__redis_cached__single_flight__context(redis: FakeRedis) -> None:
+    sessions = []
+
+    @cache.redis_cached("test")
+    async def cached() -> int:
+        sessions.append(db.session)
+        await cache.clear_cache("other")
+        return 1
+
+    # the shared call has its own database session and does not defer invalidations to the request that started it
+    cleared: set[str] = set()
+    async with db_context():
+        request_session = db.session
+        with cache.defer_clear_cache(cleared):
+            assert await cached() == 1
+
+    assert sessions and sessions[0] is not None and sessions[0] is not request_session
+    assert not cleared
+
+
+async def test__redis_cached__lock(redis: FakeRedis, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "cache_lock_poll_interval", 0)
+    func = AsyncMock(return_value=1)
+
+    @cache.redis_cached("test", lock=True)
+    async def cached() -> int:
+        return await func()  # type: ignore
+
+    k = cache._cache_key("test", 0, cache._cached_functions[cached].build_key((), {}))
+    codec = cache._cached_functions[cached].codec
+    await redis.set(cache._lock_key(k), "other worker")
+
+    async def store() -> None:
+        await asyncio.sleep(0)
+        await redis.setex(k, 42, cache._encode(cache._Entry(2, 0, 0), codec))
+
+    assert (await asyncio.gather(cached(), store()))[0] == 2
+    func.assert_not_called()
+
+    await redis.delete(k)
+    monkeypatch.setattr(settings, "cache_lock_timeout", 0)
+    assert await cached() == 1  # the other worker took too long
+    assert await redis.get(cache._lock_key(k)) == b"other worker"
+
+    await redis.delete(k, cache._lock_key(k))
+    assert await cached() == 1
+    assert await redis.get(cache._lock_key(k)) is None
+    assert func.call_count == 2
+
+    # a lock that expired during the call and has been taken by another worker is not released
+    async def take_over() -> int:
+        await redis.set(cache._lock_key(k), "other worker")
+        return 1
+
+    await redis.delete(k)
+    func.side_effect = take_over
+    assert await cached() == 1
+    assert await redis.get(cache._lock_key(k)) == b"other worker"
+
+
+@pytest.mark.parametrize("lock", [False, True])
+async def test__redis_cached__early_refresh(redis: FakeRedis, mocker: MockerFixture, lock: bool) -> None:
+    mocker.patch("time.time", return_value=1000)
+    func = AsyncMock(side_effect=[1, 2, 3])
+
+    @cache.redis_cached("test", ttl=100, lock=lock, early_refresh=1)
+    async def cached() -> int:
+        return await func()  # type: ignore
+
+    k = cache._cache_key("test", 0, cache._cached_functions[cached].build_key((), {}))
+    codec = cache._cached_functions[cached].codec
+    await redis.setex(k, 100, cache._encode(cache._Entry(0, 10, 1100), codec))
+    random = mocker.patch("random.random", return_value=0)
+    assert await cached() == 0  # ln(1) * 10 = 0 seconds ahead of the expiry
+
+    random.return_value = 1 - math.exp(-11)
+    assert await cached() == 1  # ln(e^-11) * 10 = 110 seconds ahead of the expiry
+    assert cache._decode(await redis.get(k), codec).expiry == 1100
+
+    await redis.setex(k, 100, cache._encode(cache._Entry(1, 10, 1100), codec))
+    await redis.set(cache._lock_key(k), "other worker")
+    assert await cached() == (1 if lock else 2)  # with a lock, only one worker refreshes the entry
+
+
+async def test__redis_cached__key(redis: FakeRedis) -> None:
+    @cache.redis_cached("test", "x", "y")
+    async def cached(x: set[str], y: int) -> None:
+        pass
+
+    build_key = cache._cached_functions[cached].build_key
+    key = build_key(({"a", "b", "c"}, 1), {})
+
+    assert key.startswith(f"{cached.__module__}:cached:")
+    assert len(key.split(":")[-1]) == 32
+    assert key == build_key(({"c", "a", "b"},), {"y": 1})
+    assert key != build_key(({"a", "b", "c"}, "1"), {})
+    assert cache._hash_key(["a", 1]) == cache._hash_key(["a", 1]) != cache._hash_key(["a", "1"])
+
+
+async def test__redis_cached__codec(redis: FakeRedis, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "cache_codec", "json")
+
+    @cache.redis_cached("test")
+    async def cached() -> set[int]:
+        return {1, 2}
+
+    await cached()
+
+    [value] = [v for k, v in redis.data.items() if k.startswith("func_cache:")]
+    assert value[16:] == b"[1,2]"
+    assert await cache.get_cached_many(cached, [()]) == ({(): {1, 2}}, 0)
+
+
+async def test__redis_cached__stale(
+    redis: FakeRedis, local_caches: dict[str, cache.LocalCache], mocker: MockerFixture
+) -> None:
+    time_ = mocker.patch("time.time", return_value=1000)
+    release = asyncio.Event()
+    results = iter([1, 2])
+
+    async def side_effect() -> int:
+        if func.call_count == 2:
+            await release.wait()
+        return next(results)
+
+    func = AsyncMock(side_effect=side_effect)
+
+    @cache.redis_cached("test", ttl=10, local_size=1, stale_ttl=100)
+    async def cached() -> int:
+        return await func()  # type: ignore
+
+    assert await cached() == 1
+    assert set(redis.ttls.values()) == {110}
+
+    time_.return_value = 1010
+    local_caches[f"{cached.__module__}:cached"].clear()
+    assert await cached() == 1  # stale, refreshed in the background
+    await asyncio.sleep(0)
+    assert await cached() == 1  # the refresh is still running
+    assert func.call_count == 2
+
+    release.set()
+    await asyncio.gather(*cache._inflight.values())
+    await asyncio.sleep(0)
+    assert not cache._inflight
+    assert await cached() == 2
+    assert func.call_count == 2
+
+
+async def test__redis_cached__stale_refresh_error(redis: FakeRedis, mocker: MockerFixture) -> None:
+    time_ = mocker.patch("time.time", return_value=1000)
+    logger = mocker.patch.object(cache, "logger")
+    func = AsyncMock(side_effect=[1, ValueError("upstream down"), ValueError("upstream down")])
+
+    @cache.redis_cached("test", ttl=10, stale_ttl=100)
+    async def cached() -> int:
+        return await func()  # type: ignore
+
+    await cached()
+    time_.return_value = 1050
+    assert await cached() == 1
+    await asyncio.gather(*cache._inflight.values(), return_exceptions=True)
+    await asyncio.sleep(0)
+
+    logger.error.assert_called_once()
+    assert str(logger.error.call_args.kwargs["exc_info"]) == "upstream down"
+    assert await cached() == 1  # served as long as the upstream service is down
+    await asyncio.gather(*cache._inflight.values(), return_exceptions=True)
+    assert func.call_count == 3
+
+
+async def test__get_cached_many__stale(redis: FakeRedis, mocker: MockerFixture) -> None:
+    time_ = mocker.patch("time.time", return_value=1000)
+    func = AsyncMock(return_value=2)
+
+    @cache.redis_cached("test", "x", ttl=10, stale_ttl=100)
+    async def cached(x: int) -> int:
+        return await func()  # type: ignore
+
+    await cache.set_cached_many(cached, {(1,): 1})
+    assert set(redis.ttls.values()) == {110}
+
+    time_.return_value = 1010
+    assert await cache.get_cached_many(cached, [(1,)]) == ({(1,): 1}, 0)
+    await asyncio.gather(*cache._inflight.values())
+
+    func.assert_called_once_with()
+    assert await cache.get_cached_many(cached, [(1,)]) == ({(1,): 2}, 0)
@@ -0,0 +1,58 @@
+from datetime import datetime
+from enum import Enum
+from importlib.util import find_spec
+from typing import Any
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+
+from api.schemas.user import UserInfo
+from api.services.skills import Skill
+from api.utils import codecs
+
+
+class Color(Enum):
+    RED = "red"
+
+
+VALUES: list[tuple[Any, Any]] = [
+    (UserInfo | None, UserInfo(id="a", name="b", display_name="c", email=None, avatar_url="d")),
+    (UserInfo | None, None),
+    (list[Skill], [Skill(id="a", name="A"), Skill(id="b", name="B")]),
+    (set[str] | None, {"a", "b"}),
+    (dict[str, int], {"a": 1}),
+    (dict[int, list[float]], {1: [1.5]}),
+    (tuple[datetime, str], (datetime(2024, 1, 2, 3, 4, 5), "x")),
+    (tuple[int, ...], (1, 2)),
+    (Color, Color.RED),
+    (float | None, 1.5),
+    (bool, True),
+    (Any, {"a": [1, None]}),
+]
+
+
+@pytest.mark.parametrize("codec", [codecs.PickleCodec, codecs.JsonCodec])
+@pytest.mark.parametrize("type_,value", VALUES)
+def test__codec(codec: type[codecs.Codec], type_: Any, value: Any) -> None:
+    c = codec(type_)
+    data = c.encode(value)
+
+    assert isinstance(data, bytes)
+    result = c.decode(data)
+    assert result == value
+    assert type(result) is type(value)
+
+
+@pytest.mark.skipif(find_spec("msgpack") is None, reason="msgpack is not installed")
+@pytest.mark.parametrize("type_,value", VALUES)
+def test__msgpack_codec(type_: Any, value: Any) -> None:
+    c = codecs.MsgpackCodec(type_)
+
+    assert c.decode(c.encode(value)) == value
+
+
+def test__msgpack_codec__not_installed(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(codecs, "msgpack", None)
+
+    with pytest.raises(RuntimeError):
+        codecs.MsgpackCodec(int)
@@ -0,0 +1,27 @@
+import asyncio
+
+from _pytest.monkeypatch import MonkeyPatch
+
+from api.settings import settings
+from api.utils.concurrency import gather_limited
+
+
+async def test__gather_limited(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "internal_concurrency", 3)
+    running = 0
+    max_running = 0
+
+    async def job(i: int) -> int:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return i * 2
+
+    assert await gather_limited(*[job(i) for i in range(10)]) == [i * 2 for i in range(10)]
+    assert max_running == 3
+
+    max_running = 0
+    assert await gather_limited(*[job(i) for i in range(4)], limit=1) == [0, 2, 4, 6]
+    assert max_running == 1
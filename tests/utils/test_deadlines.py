@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta, timezone
+
+from _pytest.monkeypatch import MonkeyPatch
+
+from .._utils import FakeRedis
+from api.utils import deadlines
+from api.utils.deadlines import Deadlines
+
+
+def _at(minute: int) -> datetime:
+    return datetime(2042, 1, 1, 12, minute, tzinfo=timezone.utc)
+
+
+async def test__deadlines(deadlines_redis: FakeRedis, monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(deadlines, "BATCH_SIZE", 2)
+    timers = Deadlines("test")
+
+    assert await timers.next_deadline() is None
+    assert await timers.due(_at(59)) == []
+
+    await timers.schedule({"c": _at(30), "a": _at(10), "b": _at(20)})
+    await timers.schedule({"c": _at(5)})  # replaces the existing deadline
+
+    assert await timers.next_deadline() == _at(5).timestamp()
+    assert await timers.due(_at(10)) == ["c", "a"]
+    assert await timers.due(_at(59), limit=1) == ["c"]
+
+    await timers.cancel("c", "unknown")
+    await timers.cancel()
+    assert await timers.due(_at(59)) == ["a", "b"]
+    assert await timers.next_deadline() == _at(10).timestamp()
+    assert deadlines_redis.zsets["deadlines:test"].keys() == {"a", "b"}
+    assert await timers.due(_at(10) - timedelta(seconds=1)) == []
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+
+from .._utils import FakeRedis
+from api.settings import settings
+from api.utils import leader
+from api.utils.leader import LeaderLease
+
+
+@pytest.fixture
+def redis(monkeypatch: MonkeyPatch) -> FakeRedis:
+    monkeypatch.setattr(leader, "redis", fake := FakeRedis())
+    monkeypatch.setattr(settings, "leader_lease_duration", 30)
+    monkeypatch.setattr(settings, "leader_lease_renewal", 10)
+    return fake
+
+
+async def test__acquire(redis: FakeRedis) -> None:
+    a, b = LeaderLease("test"), LeaderLease("test")
+
+    assert await a.acquire() is True
+    assert await b.acquire() is False
+    assert a.is_leader and not b.is_leader
+    assert redis.data["leader:test"] == str(a.token)
+    assert redis.ttls["leader:test"] == 30
+
+    # the current leader renews its lease instead of acquiring it again
+    assert await a.acquire() is True
+    assert redis.data["leader:test"] == str(a.token)
+
+
+async def test__acquire__token(redis: FakeRedis) -> None:
+    a, b = LeaderLease("test"), LeaderLease("test")
+    await a.acquire()
+    old_token = a.token
+
+    # simulate the expiry of the lease, e.g. because the leader was paused for too long
+    await redis.delete("leader:test")
+    assert await b.acquire() is True
+    assert b.token is not None and old_token is not None and b.token > old_token
+
+    # the old leader notices that it has lost the lease and does not remove the lease of the new leader
+    assert await a.verify() is False
+    assert not a.is_leader
+    assert await a.renew() is False
+    await a.release()
+    assert redis.data["leader:test"] == str(b.token)
+
+
+async def test__release(redis: FakeRedis) -> None:
+    a, b = LeaderLease("test"), LeaderLease("test")
+    await a.acquire()
+
+    await a.release()
+
+    assert not a.is_leader
+    assert "leader:test" not in redis.data
+    assert await b.acquire() is True
+
+
+async def test__start_stop(redis: FakeRedis) -> None:
+    lease = LeaderLease("test")
+
+    lease.start()
+    await asyncio.sleep(0)
+
+    assert lease.is_leader
+    await lease.stop()
+    assert not lease.is_leader
+    assert "leader:test" not in redis.data
+
+
+async def test__maintain__step_down_on_error(redis: FakeRedis, monkeypatch: MonkeyPatch) -> None:
+    lease = LeaderLease("test")
+    await lease.acquire()
+
+    async def fail(*_: str) -> None:
+        raise ConnectionError
+
+    monkeypatch.setattr(redis, "eval", fail)
+    lease.start()
+    await asyncio.sleep(0)
+
+    assert not lease.is_leader
+    await lease.stop()
@@ -0,0 +1,207 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+
+from api.settings import settings
+from api.utils.scheduler import Job, Scheduler, job_stats
+
+
+@pytest.fixture(autouse=True)
+def scheduler_settings(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "scheduler_jitter", 0)
+    monkeypatch.setattr(settings, "scheduler_retry_delay", 1)
+    monkeypatch.setattr(settings, "scheduler_max_backoff", 5)
+    monkeypatch.setattr(settings, "scheduler_shutdown_timeout", 1)
+    monkeypatch.setattr(settings, "scheduler_deadline_poll_interval", 0.01)
+
+
+def _job(func: AsyncMock, interval: float = 60, **kwargs: float) -> Job:
+    return Scheduler().add_job("job", func, interval, **kwargs)  # type: ignore
+
+
+async def test__job__backoff() -> None:
+    job = _job(AsyncMock(side_effect=ValueError))
+
+    delays = []
+    for _ in range(5):
+        await job.run()
+        delays.append(job.next_delay())
+
+    assert delays == [1, 2, 4, 5, 5]
+    assert job.stats.runs == job.stats.failures == job.stats.consecutive_failures == 5
+
+    job.func = AsyncMock()
+    await job.run()
+    assert job.next_delay() == 60
+    assert job.stats.consecutive_failures == 0
+    assert job.stats.failures == 5
+
+
+async def test__job__jitter() -> None:
+    job = _job(AsyncMock(), 100, jitter=0.1)
+
+    assert all(90 <= job.next_delay() <= 110 for _ in range(100))
+
+
+async def test__job__metrics() -> None:
+    async def func() -> None:
+        await asyncio.sleep(0.01)
+
+    job = _job(func)  # type: ignore
+
+    await job.run()
+    await job.run()
+
+    assert job.stats.runs == 2
+    assert job.stats.last_duration is not None and job.stats.last_duration >= 0.01
+    assert job.stats.max_duration >= job.stats.last_duration
+    assert job.stats.average_duration == job.stats.total_duration / 2
+
+
+async def test__job__lease() -> None:
+    lease = MagicMock(verify=AsyncMock(return_value=False), acquire=AsyncMock(return_value=False))
+    job = _job(func := AsyncMock(), lease=lease)
+
+    await job.run()
+    func.assert_not_called()
+    assert job.stats.skipped == 1
+
+    lease.acquire.return_value = True
+    await job.run()
+    func.assert_called_once_with()
+    assert job.stats.runs == 1
+
+
+def test__add_job__duplicate() -> None:
+    scheduler = Scheduler()
+    scheduler.add_job("job", AsyncMock(), 60)
+
+    with pytest.raises(ValueError):
+        scheduler.add_job("job", AsyncMock(), 60)
+
+
+async def test__scheduler() -> None:
+    scheduler = Scheduler()
+    fast = AsyncMock()
+    release, finished = asyncio.Event(), asyncio.Event()
+
+    async def slow() -> None:
+        await release.wait()
+        finished.set()
+
+    scheduler.add_job("fast", fast, 0)
+    scheduler.add_job("slow", slow, 60)
+
+    scheduler.start()
+    for _ in range(100):
+        await asyncio.sleep(0.001)
+
+    # the slow job does not delay the fast job
+    assert fast.call_count >= 3
+    assert not finished.is_set()
+
+    # running jobs are finished before the scheduler stops
+    stop = asyncio.create_task(scheduler.stop())
+    await asyncio.sleep(0.01)
+    assert not stop.done()
+    release.set()
+    await stop
+    assert finished.is_set()
+    calls = fast.call_count
+    await asyncio.sleep(0.01)
+    assert fast.call_count == calls
+
+
+async def test__scheduler__stop_timeout() -> None:
+    scheduler = Scheduler()
+    cancelled = asyncio.Event()
+
+    async def hanging() -> None:
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    scheduler.add_job("hanging", hanging, 60)
+    scheduler.start()
+    await asyncio.sleep(0)
+
+    await scheduler.stop(timeout=0.01)
+
+    assert cancelled.is_set()
+
+
+async def test__scheduler__deadline() -> None:
+    scheduler = Scheduler()
+    deadline = AsyncMock(return_value=None)
+    func = scheduler.add_job("job", AsyncMock(), 60, deadline=deadline).func
+
+    scheduler.start()
+    await asyncio.sleep(0.01)
+    assert isinstance(func, AsyncMock) and func.call_count == 1
+
+    # the job runs again as soon as the earliest deadline is reached instead of waiting for the interval
+    deadline.return_value = time.time() + 0.02
+    await scheduler.stop()
+    scheduler.start()
+    await asyncio.sleep(0.01)
+    assert func.call_count == 2
+    await asyncio.sleep(0.05)
+    assert func.call_count >= 3
+    await scheduler.stop()
+
+
+async def test__job_stats() -> None:
+    scheduler = Scheduler()
+    scheduler.add_job("job", AsyncMock(), 60)
+    assert job_stats() == {}
+
+    scheduler.start()
+    await asyncio.sleep(0)
+    stats = job_stats()
+    await scheduler.stop()
+
+    assert stats == {
+        "job": {
+            "runs": 1,
+            "failures": 0,
+            "consecutive_failures": 0,
+            "skipped": 0,
+            "last_duration": scheduler.jobs["job"].stats.last_duration,
+            "max_duration": scheduler.jobs["job"].stats.max_duration,
+            "total_duration": scheduler.jobs["job"].stats.total_duration,
+            "average_duration": scheduler.jobs["job"].stats.average_duration,
+        }
+    }
+    assert job_stats() == {}
+
+
+async def test__scheduler__earlier_deadline() -> None:
+    scheduler = Scheduler()
+    deadline = AsyncMock(return_value=None)
+    func = scheduler.add_job("job", AsyncMock(), 60, deadline=deadline).func
+
+    scheduler.start()
+    await asyncio.sleep(0.005)
+    assert isinstance(func, AsyncMock) and func.call_count == 1
+
+    # a deadline that is scheduled while the job is waiting wakes it up
+    deadline.return_value = time.time()
+    await asyncio.sleep(0.03)
+    await scheduler.stop()
+    assert func.call_count >= 2
+
+
+async def test__job__time_until_deadline() -> None:
+    job = _job(AsyncMock())
+    assert await job.time_until_deadline() is None
+
+    job.deadline = AsyncMock(return_value=time.time() - 10)
+    assert await job.time_until_deadline() == 0
+
+    job.deadline = AsyncMock(side_effect=ConnectionError)
+    assert await job.time_until_deadline() is None